@@ -16,6 +16,22 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = Field(default="development")
     DEBUG: bool = Field(default=False)
     LOG_LEVEL: str = Field(default="INFO")
+    LOG_FORMAT: str = Field(default="standard")  # standard | json
+    LOG_QUEUE_SIZE: int = Field(default=10000)
+    LOG_SAMPLE_RATE: float = Field(default=1.0)  # Fracción de logs INFO de alto volumen que se conserva
+    LOG_SAMPLED_LOGGERS: list = Field(default=["api"])
+    LOG_HEADER_ALLOWLIST: set = Field(default={
+        "user-agent", "content-type", "content-length", "x-forwarded-for", "x-request-id"
+    })
+    WARM_UP_ON_STARTUP: bool = Field(default=True)
+    METRICS_ENABLED: bool = Field(default=True)
+    PROFILING_ENABLED: bool = Field(default=False)
+    PROFILING_INTERVAL_MS: int = Field(default=10)
+    PROFILING_MAX_SECONDS: int = Field(default=60)
+    PROFILING_MAX_REQUESTS: int = Field(default=100)
+    LOOP_MONITOR_ENABLED: bool = Field(default=True)
+    LOOP_LAG_INTERVAL_MS: int = Field(default=100)
+    LOOP_LAG_THRESHOLD_MS: int = Field(default=250)
 
     # MySQL
     MYSQL_HOST: str = Field(default="db")
@@ -37,28 +53,105 @@ class Settings(BaseSettings):
     ALGORITHM: str = Field(default="HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=30)
     REFRESH_TOKEN_EXPIRE_DAYS: int = Field(default=7)
+    # argon2 usa 64MB por hash: los workers acotan CPU y memoria a la vez
+    PASSWORD_HASH_WORKERS: int = Field(default=0)  # 0 = según la cuota de CPU del cgroup
+    PASSWORD_HASH_QUEUE_LIMIT: int = Field(default=32)
+    PASSWORD_HASH_RETRY_AFTER: int = Field(default=1)
+    # Caché por proceso: otros pods ven los cambios de rol/contraseña al expirar el TTL
+    USER_CACHE_SIZE: int = Field(default=10000)
+    USER_CACHE_TTL: int = Field(default=60)
+    AUTH_TRUST_TOKEN_CLAIMS: bool = Field(default=False)
+    ACCESS_CACHE_SIZE: int = Field(default=10000)
+    ACCESS_CACHE_TTL: int = Field(default=30)
 
     # Files
     UPLOAD_FOLDER: str = Field(default="/app/uploads")
     MAX_FILE_SIZE_MB: int = Field(default=10)
     ALLOWED_EXTENSIONS: set = Field(default={'pdf', 'docx', 'csv', 'txt'})
+    UPLOAD_MAX_FILES: int = Field(default=500)
+    # Límite para subidas reanudables por rangos (MAX_FILE_SIZE_MB aplica a las de una sola petición)
+    MAX_UPLOAD_SIZE_MB: int = Field(default=2048)
+    UPLOAD_SESSION_TTL_HOURS: int = Field(default=24)
+    PROCESSING_WORKERS: int = Field(default=2)
+    PROCESSING_QUEUE_SIZE: int = Field(default=1000)
+    # Texto extraído (zstd) por checksum y versión de extractor, compartido entre réplicas
+    ARTIFACT_FOLDER: str = Field(default="/app/uploads/.artifacts")
+
+    # Storage tiering: originales antiguos pasan al tier frío (comprimidos y/o en S3)
+    STORAGE_COLD_BACKEND: str = Field(default="local")  # local | s3
+    STORAGE_COLD_AFTER_DAYS: int = Field(default=30)
+    STORAGE_TIERING_INTERVAL_HOURS: int = Field(default=6)  # 0 = desactivado
+    STORAGE_COMPRESS_EXTENSIONS: set = Field(default={'txt', 'csv', 'json', 'xml'})
+    STORAGE_ZSTD_LEVEL: int = Field(default=9)
+    S3_ENDPOINT_URL: str = Field(default="http://minio:9000")
+    S3_BUCKET: str = Field(default="documents")
+    S3_REGION: str = Field(default="us-east-1")
+    S3_ACCESS_KEY: str = Field(default="")
+    S3_SECRET_KEY: str = Field(default="")
+    S3_PREFIX: str = Field(default="originals/")
 
     # Ollama
     OLLAMA_BASE_URL: str = Field(default="http://ollama:11434")
     DEFAULT_MODEL: str = Field(default="llama3")
     OLLAMA_TIMEOUT: int = Field(default=300)
+    OLLAMA_COALESCE_REQUESTS: bool = Field(default=True)
+    OLLAMA_BACKENDS: str = Field(default="")  # Lista separada por comas; vacío usa OLLAMA_BASE_URL
+    OLLAMA_KEEP_ALIVE: str = Field(default="30m")
+    OLLAMA_WARM_MODELS: bool = Field(default=True)
+    OLLAMA_MAX_ATTEMPTS: int = Field(default=3)
+    OLLAMA_FAILURE_THRESHOLD: int = Field(default=2)
+    OLLAMA_UNHEALTHY_COOLDOWN: int = Field(default=30)
+    OLLAMA_HEALTH_INTERVAL: int = Field(default=15)
+    OLLAMA_HEALTH_TIMEOUT: int = Field(default=5)
+    OLLAMA_COLD_MODEL_PENALTY: int = Field(default=4)
+
+    # Vector store
+    EMBEDDING_MODEL: str = Field(default="sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_BACKEND: str = Field(default="sentence-transformers")  # sentence-transformers | onnx
+    EMBEDDING_ONNX_DIR: str = Field(default="/app/models/onnx")
+    EMBEDDING_THREADS: int = Field(default=0)  # 0 = según la cuota de CPU del cgroup
+    EMBEDDING_BATCH_SIZE: int = Field(default=32)
+    EMBEDDING_MAX_LENGTH: int = Field(default=256)
+    MONGO_VECTOR_COLLECTION: str = Field(default="document_chunks")
+    MONGO_UPLOAD_COLLECTION: str = Field(default="upload_sessions")
+    MONGO_INDEX_STATE_COLLECTION: str = Field(default="vector_index_state")
+    # Re-embedding tras cambiar de modelo: fracción del tiempo real que puede ocupar el encode
+    REEMBED_BATCH_SIZE: int = Field(default=256)
+    REEMBED_CPU_BUDGET: float = Field(default=0.5)
+    # Cada réplica sigue el estado del índice compartido; las que no informan en el timeout se ignoran
+    REEMBED_SYNC_INTERVAL: int = Field(default=15)  # 0 = desactivado
+    REEMBED_REPLICA_TIMEOUT: int = Field(default=120)
+    CHUNK_SIZE: int = Field(default=1000)
+    VECTOR_QUANTIZATION: str = Field(default="fp16")  # none | fp16 | int8
+    VECTOR_INT8_RANGE: float = Field(default=0.5)
+    MIN_SIMILARITY_SCORE: float = Field(default=0.2)
+    HYBRID_SEARCH_ENABLED: bool = Field(default=True)
+    HYBRID_CANDIDATES: int = Field(default=50)
+    RRF_K: int = Field(default=60)
+    BM25_K1: float = Field(default=1.2)
+    BM25_B: float = Field(default=0.75)
+    RERANK_ENABLED: bool = Field(default=False)
+    RERANK_MODEL: str = Field(default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_CANDIDATES: int = Field(default=50)
+    RERANK_MAX_LENGTH: int = Field(default=256)
+    RERANK_TIMEOUT_MS: int = Field(default=300)
 
     # URLs completas
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> str:
         return f"mysql+pymysql://{self.MYSQL_USER}:{self.MYSQL_PASSWORD}@{self.MYSQL_HOST}:{self.MYSQL_PORT}/{self.MYSQL_DB}"
 
+    @property
+    def OLLAMA_BACKEND_URLS(self) -> list:
+        urls = [url.strip() for url in self.OLLAMA_BACKENDS.split(",") if url.strip()]
+        return urls or [self.OLLAMA_BASE_URL]
+
     @validator('UPLOAD_FOLDER')
     def create_upload_folder(cls, v):
         Path(v).mkdir(parents=True, exist_ok=True)
         return v
 
-    @validator('ALLOWED_EXTENSIONS')
+    @validator('ALLOWED_EXTENSIONS', 'STORAGE_COMPRESS_EXTENSIONS')
     def normalize_extensions(cls, v):
         return {ext.lower() for ext in v}
 
@@ -74,11 +167,14 @@ LOGGING_CONFIG: Dict[str, Any] = {
             "format": "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
             "datefmt": "%Y-%m-%d %H:%M:%S"
         },
+        "json": {
+            "()": "app.utils.logger.JSONFormatter"
+        },
     },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
-            "formatter": "standard",
+            "formatter": settings.LOG_FORMAT,
             "stream": "ext://sys.stdout"
         },
     },
@@ -88,6 +184,9 @@ LOGGING_CONFIG: Dict[str, Any] = {
             "level": settings.LOG_LEVEL,
             "propagate": False
         },
+        "api": {
+            "level": settings.LOG_LEVEL
+        },
     },
     "root": {
         "handlers": ["console"],
@@ -1,3 +1,4 @@
+import asyncio
 from typing import AsyncGenerator
 from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
@@ -7,15 +8,15 @@ from pymongo.errors import PyMongoError
 
 from app.config import settings
 from .mysql import async_engine, AsyncSessionLocal
-from .mongodb import mongo_client, get_mongo_db
+from . import mongodb
 
 async def init_db():
     """Initialize database connections"""
     # MySQL connection is lazy, no need to explicitly connect
-    # MongoDB connection test
+    # MongoDB: se conecta aquí (y no al importar) fuera del event loop
     try:
-        await get_mongo_db().command('ping')
-    except PyMongoError as e:
+        await asyncio.to_thread(mongodb.get_mongo_client)
+    except mongodb.MongoDBConnectionError as e:
         raise RuntimeError(f"MongoDB connection failed: {str(e)}")
 
 async def close_db():
@@ -23,10 +24,9 @@ async def close_db():
     # Close MySQL connections
     if async_engine:
         await async_engine.dispose()
-    
+
     # Close MongoDB connection
-    if mongo_client:
-        mongo_client.close()
+    mongodb.close_mongo_connection()
 
 @asynccontextmanager
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
@@ -43,4 +43,4 @@ async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
 
 # MongoDB dependency
 def get_mongo_db():
-    return mongo_client[settings.MONGO_DB_NAME]
\ No newline at end of file
+    return mongodb.get_mongo_client()[settings.MONGO_DB_NAME]
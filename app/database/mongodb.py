@@ -10,6 +10,7 @@ import logging
 from typing import Iterator
 
 from app.config import settings
+from app.utils.metrics import MongoPoolMetrics
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +36,8 @@ def initialize_mongo_client():
             socketTimeoutMS=settings.MONGO_TIMEOUT_MS,
             connectTimeoutMS=settings.MONGO_TIMEOUT_MS,
             retryWrites=True,
-            retryReads=True
+            retryReads=True,
+            event_listeners=[MongoPoolMetrics()]
         )
         # Test the connection
         mongo_client.admin.command('ping')
@@ -50,14 +52,19 @@ def initialize_mongo_client():
         logger.error(f"General MongoDB error: {str(e)}")
         raise MongoDBConnectionError("MongoDB initialization error")
 
+def get_mongo_client() -> MongoClient:
+    """Returns the shared client, connecting on first use"""
+    if mongo_client is None:
+        initialize_mongo_client()
+    return mongo_client
+
 @contextmanager
 def get_mongo_collection(collection_name: str) -> Iterator:
     """Context manager for MongoDB collections with error handling"""
-    if mongo_client is None:
-        initialize_mongo_client()
+    client = get_mongo_client()
     
     try:
-        db = mongo_client[settings.MONGO_DB_NAME]
+        db = client[settings.MONGO_DB_NAME]
         collection = db[collection_name]
         yield collection
     except OperationFailure as e:
@@ -81,10 +88,3 @@ def close_mongo_connection():
             logger.error(f"Error closing MongoDB connection: {str(e)}")
         finally:
             mongo_client = None
-
-# Initialize on import
-try:
-    initialize_mongo_client()
-except MongoDBConnectionError:
-    # Will be retried on first operation if initial connection fails
-    pass
\ No newline at end of file
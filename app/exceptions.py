@@ -0,0 +1,15 @@
+class OllamaError(Exception):
+    """Errors talking to the Ollama API"""
+    pass
+
+class OllamaUnavailableError(OllamaError):
+    """No healthy Ollama backend could serve the request"""
+    pass
+
+class VectorStoreError(Exception):
+    """Errors storing or searching embeddings"""
+    pass
+
+class PasswordHashingBusyError(Exception):
+    """The password hashing pool is saturated; the caller should retry later"""
+    pass
@@ -1,16 +1,31 @@
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import logging
 from typing import Dict, Any
 
 from app.config import settings, LOGGING_CONFIG
 from app.database import init_db, close_db
-from app.routers import auth, documents, shared, health
+from app.exceptions import PasswordHashingBusyError
+from app.services.ollama import get_backend_pool
+from app.services.processing_queue import get_processing_queue
+from app.services.storage import StorageTiering, get_storage
+from app.services.reembedding import get_index_state_watcher, get_reembedding_job
+from app.utils.startup import warm_up
+from app.utils.metrics import PrometheusMiddleware, track_mysql_pool
+from app.utils.profiling import ProfilingMiddleware
+from app.utils.loop_monitor import LoopLagMonitor
+from app.utils.logger import RequestLoggerMiddleware, enable_async_logging, stop_async_logging
+from app.database.mysql import async_engine
+from app.routers import auth, documents, shared, health, readiness, search, metrics, admin, bulk, uploads, downloads
 import logging.config
 
 # Configuración inicial de logging
 logging.config.dictConfig(LOGGING_CONFIG)
+# Formateo y escritura a stdout salen del event loop a un hilo propio
+enable_async_logging(["app"])
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
@@ -24,12 +39,48 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.critical("Database initialization failed: %s", str(e))
         raise
+
+    # Detecta llamadas bloqueantes dentro de handlers async
+    loop_monitor = None
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor = LoopLagMonitor(
+            settings.LOOP_LAG_INTERVAL_MS / 1000,
+            settings.LOOP_LAG_THRESHOLD_MS / 1000
+        )
+        loop_monitor.start()
+
+    # Monitor de salud y precarga de los hosts de Ollama
+    await get_backend_pool().start()
+
+    # Workers de (re)procesado en segundo plano para las operaciones bulk
+    await get_processing_queue().start()
+
+    # Mueve originales antiguos al tier frío
+    tiering = StorageTiering(get_storage())
+    await tiering.start()
+
+    # Sigue el re-embedding que pueda estar corriendo en otra réplica
+    await get_index_state_watcher().start()
+
+    # Imports pesados y modelos se cargan en segundo plano; /ready responde 503 hasta que terminan
+    warm_up_task = asyncio.create_task(warm_up()) if settings.WARM_UP_ON_STARTUP else None
     
     yield  # Aquí la aplicación corre
     
     # Shutdown
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    await tiering.stop()
+    await get_index_state_watcher().stop()
+    await get_reembedding_job().stop()
+    await get_processing_queue().stop()
+    await get_storage().close()
+    await get_backend_pool().stop()
     await close_db()
+    if loop_monitor:
+        await loop_monitor.stop()
     logger.info("Application shutdown complete")
+    stop_async_logging()
 
 app = FastAPI(
     title="Document AI API",
@@ -49,10 +100,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(RequestLoggerMiddleware)
+
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(PrometheusMiddleware)
+    track_mysql_pool(async_engine)
+
 # Routers
 app.include_router(health.router)
+app.include_router(readiness.router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
+app.include_router(bulk.router, prefix="/documents/bulk", tags=["Documents"])
 app.include_router(documents.router, prefix="/documents", tags=["Documents"])
+app.include_router(downloads.router, prefix="/documents", tags=["Documents"])
+app.include_router(uploads.router, prefix="/uploads", tags=["Documents"])
 app.include_router(shared.router, prefix="/shared", tags=["Sharing"])
+app.include_router(search.router, prefix="/search", tags=["Search"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 
-# Exception handlers could be added here
\ No newline at end of file
+# Exception handlers
+@app.exception_handler(PasswordHashingBusyError)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusyError):
+    # Pool de hashing saturado en cualquier ruta (login, registro, cambio de contraseña)
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many authentication requests, retry shortly"},
+        headers={"Retry-After": str(settings.PASSWORD_HASH_RETRY_AFTER)}
+    )
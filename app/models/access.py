@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, Boolean, DateTime, ForeignKey, Index
+
+from app.database.mysql import Base
+
+class DocumentAccess(Base):
+    """Materialized access level per (user, document).
+
+    Derived from document ownership and active shares; DocumentService keeps it
+    in sync on create, share and revoke. Expiry is checked at read time.
+    """
+    __tablename__ = "document_access"
+    __table_args__ = (
+        Index("ix_document_access_document", "document_id"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    level = Column(Integer, nullable=False)  # PERMISSION_LEVELS / OWNER_LEVEL
+    can_download = Column(Boolean, nullable=False, default=True)
+    expires_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<DocumentAccess(user={self.user_id}, document={self.document_id}, level={self.level})>"
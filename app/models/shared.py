@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -14,8 +14,21 @@ class SharePermission(str, PyEnum):
     COMMENT = "comment"
     SHARE = "share"
 
+# Nivel entero por permiso: cada nivel incluye a los inferiores
+PERMISSION_LEVELS = {
+    SharePermission.READ: 1,
+    SharePermission.COMMENT: 2,
+    SharePermission.WRITE: 3,
+    SharePermission.SHARE: 4,
+}
+OWNER_LEVEL = 5
+
 class SharedDocument(Base):
     __tablename__ = "shared_documents"
+    __table_args__ = (
+        Index("ix_shared_documents_shared_with_document", "shared_with_id", "document_id"),
+        Index("ix_shared_documents_document", "document_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
@@ -55,22 +68,7 @@ class SharedDocument(Base):
 
     def has_permission(self, permission: SharePermission) -> bool:
         """Verifica permisos"""
-        permission_hierarchy = {
-            SharePermission.READ: [SharePermission.READ],
-            SharePermission.COMMENT: [SharePermission.READ, SharePermission.COMMENT],
-            SharePermission.WRITE: [
-                SharePermission.READ, 
-                SharePermission.COMMENT, 
-                SharePermission.WRITE
-            ],
-            SharePermission.SHARE: [
-                SharePermission.READ,
-                SharePermission.COMMENT,
-                SharePermission.WRITE,
-                SharePermission.SHARE
-            ]
-        }
-        return permission in permission_hierarchy.get(self.permission_level, [])
+        return PERMISSION_LEVELS.get(self.permission_level, 0) >= PERMISSION_LEVELS[permission]
 
     def __repr__(self):
         return f"<SharedDocument(document={self.document_id}, user={self.shared_with_id}, permission={self.permission_level})>"
\ No newline at end of file
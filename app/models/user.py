@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Enum, event
 from sqlalchemy.sql import func, expression
 from sqlalchemy.ext.mutable import MutableList
 from sqlalchemy.dialects.postgresql import ARRAY
@@ -6,6 +6,7 @@ from enum import Enum as PyEnum
 from typing import List, Dict, Any
 
 from app.database.mysql import Base
+from app.utils.cache import invalidate_user
 
 class UserRole(str, PyEnum):
     ADMIN = "admin"
@@ -82,4 +83,13 @@ class User(Base):
         self.password_history = [history_entry] + self.password_history[:4]
 
     def __repr__(self):
-        return f"<User(id={self.id}, email={self.email}, role={self.role})>"
\ No newline at end of file
+        return f"<User(id={self.id}, email={self.email}, role={self.role})>"
+
+@event.listens_for(User.hashed_password, "set")
+@event.listens_for(User.role, "set")
+@event.listens_for(User.permissions, "set")
+@event.listens_for(User.is_active, "set")
+def _invalidate_cached_user(target, value, oldvalue, initiator):
+    """Cached identities must not outlive a password, role or status change"""
+    if target.email is not None and value != oldvalue:
+        invalidate_user(email=target.email)
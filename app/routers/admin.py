@@ -0,0 +1,132 @@
+from typing import Annotated, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.config import settings
+from app.schemas.auth import UserInDB, UserRole
+from app.services.auth import AuthService
+from app.services.reembedding import get_reembedding_job
+from app.utils.profiling import ProfileSession, profiler
+
+router = APIRouter()
+
+ProfileFormat = Literal["collapsed", "speedscope"]
+
+async def require_admin(
+    current_user: Annotated[UserInDB, Depends(AuthService.get_current_user)]
+) -> UserInDB:
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
+
+def _require_profiling() -> None:
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiling is disabled"
+        )
+
+def _render(session: ProfileSession, fmt: ProfileFormat) -> Response:
+    if fmt == "speedscope":
+        return JSONResponse(
+            session.sampler.speedscope(),
+            headers={"Content-Disposition": f'attachment; filename="profile-{session.id}.speedscope.json"'}
+        )
+    return PlainTextResponse(session.sampler.collapsed())
+
+@router.post("/profile", dependencies=[Depends(require_admin), Depends(_require_profiling)])
+async def profile_for_duration(
+    seconds: float = Query(10, gt=0),
+    fmt: ProfileFormat = Query("collapsed", alias="format")
+):
+    """Samples every thread for `seconds` and returns the profile"""
+    if seconds > settings.PROFILING_MAX_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"seconds must be <= {settings.PROFILING_MAX_SECONDS}"
+        )
+    try:
+        session = await profiler.profile_for(seconds, settings.PROFILING_INTERVAL_MS / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return _render(session, fmt)
+
+@router.post(
+    "/profile/requests",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin), Depends(_require_profiling)]
+)
+async def profile_next_requests(
+    route: str = Query(..., min_length=1, description="Path prefix, e.g. /search"),
+    count: int = Query(10, ge=1)
+):
+    """Arms a session that samples while the next `count` requests under `route` run"""
+    if count > settings.PROFILING_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"count must be <= {settings.PROFILING_MAX_REQUESTS}"
+        )
+    try:
+        session = profiler.arm(route, count, settings.PROFILING_INTERVAL_MS / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"session_id": session.id, "route": route, "requests": count}
+
+@router.get("/profile/{session_id}", dependencies=[Depends(require_admin), Depends(_require_profiling)])
+async def get_profile(
+    session_id: str,
+    fmt: ProfileFormat = Query("collapsed", alias="format")
+):
+    """Profile of a request-scoped session; 202 while requests are still pending"""
+    session = profiler.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    if not session.done.is_set():
+        return JSONResponse(
+            {"session_id": session.id, "remaining": session.remaining, "in_flight": session.in_flight},
+            status_code=status.HTTP_202_ACCEPTED
+        )
+    return _render(session, fmt)
+
+@router.delete("/profile/{session_id}", dependencies=[Depends(require_admin), Depends(_require_profiling)])
+async def stop_profile(
+    session_id: str,
+    fmt: ProfileFormat = Query("collapsed", alias="format")
+):
+    """Stops a request-scoped session early and returns what was sampled"""
+    session = profiler.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    profiler.cancel(session)
+    return _render(session, fmt)
+
+@router.post(
+    "/embeddings/reindex",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin)]
+)
+async def start_reembedding(
+    model: Optional[str] = Query(None, description="Target model; EMBEDDING_MODEL by default")
+):
+    """Starts or resumes re-embedding every chunk; search switches over when it finishes"""
+    try:
+        return await get_reembedding_job().start(model)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/embeddings/reindex", dependencies=[Depends(require_admin)])
+async def reembedding_status():
+    return get_reembedding_job().status
+
+@router.delete("/embeddings/reindex", dependencies=[Depends(require_admin)])
+async def pause_reembedding():
+    """Pauses the job; its checkpoint is kept and the next start resumes from it"""
+    job = get_reembedding_job()
+    await job.stop()
+    return job.status
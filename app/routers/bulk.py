@@ -0,0 +1,53 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import get_db_session
+from app.schemas.auth import UserInDB
+from app.schemas.document import (
+    BatchUploadResult, BulkDocumentIds, BulkReprocess, BulkResult, BulkShare, BulkShareIds
+)
+from app.services.auth import AuthService
+from app.services.document import DocumentService
+from app.utils.uploads import receive_files
+
+router = APIRouter()
+
+CurrentUser = Annotated[UserInDB, Depends(AuthService.get_current_user)]
+Session = Annotated[AsyncSession, Depends(get_db_session)]
+
+@router.post("/{document_id}/share", response_model=BulkResult)
+async def bulk_share(document_id: int, share_data: BulkShare, current_user: CurrentUser, db: Session):
+    """Share one document with many users in a single transaction"""
+    return await DocumentService.bulk_share(db, document_id, current_user.id, share_data)
+
+@router.post("/revoke", response_model=BulkResult)
+async def bulk_revoke(body: BulkShareIds, current_user: CurrentUser, db: Session):
+    return await DocumentService.bulk_revoke(db, current_user.id, body.share_ids)
+
+@router.post("/delete", response_model=BulkResult)
+async def bulk_delete(body: BulkDocumentIds, current_user: CurrentUser, db: Session):
+    return await DocumentService.bulk_delete(db, current_user.id, body.document_ids)
+
+@router.post("/reprocess", response_model=BulkResult)
+async def bulk_reprocess(body: BulkReprocess, current_user: CurrentUser, db: Session):
+    """Queues documents for background re-processing; results say which were accepted.
+
+    Extracted text is reused from the stored artifact unless `force_extract` is set.
+    """
+    return await DocumentService.bulk_reprocess(
+        db, current_user.id, body.document_ids, force_extract=body.force_extract
+    )
+
+@router.post("/upload", response_model=BatchUploadResult)
+async def bulk_upload(request: Request, current_user: CurrentUser, db: Session):
+    """Multi-file upload: parts stream to disk, are validated in parallel and registered together"""
+    files = await receive_files(
+        request,
+        settings.UPLOAD_FOLDER,
+        max_files=settings.UPLOAD_MAX_FILES,
+        max_file_size=settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    )
+    return await DocumentService.create_documents(db, current_user.id, files)
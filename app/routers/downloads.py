@@ -0,0 +1,74 @@
+import asyncio
+import mimetypes
+import os
+from typing import Annotated, Optional
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db_session
+from app.schemas.auth import TokenUser
+from app.services.auth import AuthService
+from app.services.document import DocumentService
+from app.services.storage import get_storage
+
+router = APIRouter()
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires (RFC 9110 13.1.2)"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+@router.get("/{document_id}/download")
+async def download_document(
+    document_id: int,
+    current_user: Annotated[TokenUser, Depends(AuthService.get_token_user)],
+    db: Annotated[AsyncSession, Depends(get_db_session)],
+    if_none_match: Annotated[Optional[str], Header()] = None
+):
+    """Streams the stored file; supports ETag and If-None-Match, and Range on hot files.
+
+    FileResponse sends the file in chunks (or via the ASGI pathsend extension
+    when the server supports it), never loading it whole into memory. Cold
+    files (zstd and/or S3) are decompressed on the fly, without Range.
+    """
+    document = await DocumentService.get_downloadable_document(db, current_user.id, document_id)
+
+    etag = f'"{document.checksum}"' if document.checksum else None
+    if etag and if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    storage = get_storage()
+    media_type = mimetypes.guess_type(document.name)[0] or "application/octet-stream"
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        # Sin ETag propio, FileResponse genera uno a partir de mtime y tamaño
+        headers["ETag"] = etag
+
+    if not storage.is_local_plain(document.file_path):
+        headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(document.name)}"
+        return StreamingResponse(
+            storage.iter_content(document.file_path),
+            media_type=media_type,
+            headers=headers
+        )
+
+    if not await asyncio.to_thread(os.path.isfile, document.file_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+
+    return FileResponse(
+        document.file_path,
+        filename=document.name,
+        media_type=media_type,
+        headers=headers
+    )
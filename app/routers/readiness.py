@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.utils.startup import STARTUP_REPORT, is_warm
+
+router = APIRouter()
+
+@router.get("/ready", include_in_schema=False)
+async def ready() -> JSONResponse:
+    """Readiness probe: 503 until the background warm-up has loaded parsers and models"""
+    if settings.WARM_UP_ON_STARTUP and not is_warm():
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    return JSONResponse({"status": "ready", "startup": STARTUP_REPORT})
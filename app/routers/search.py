@@ -0,0 +1,40 @@
+from typing import Annotated, FrozenSet, List
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db_session
+from app.schemas.auth import TokenUser
+from app.schemas.document import ChunkSearchResult
+from app.services.auth import AuthService
+from app.services.access import AccessService
+from app.services.vector_store import VectorStoreService
+
+router = APIRouter()
+
+async def get_visible_document_ids(
+    current_user: Annotated[TokenUser, Depends(AuthService.get_token_user)],
+    db: Annotated[AsyncSession, Depends(get_db_session)]
+) -> FrozenSet[int]:
+    """Permission set of the current user, served from the per-user access cache"""
+    return await AccessService.get_accessible_document_ids(db, current_user.id)
+
+@router.get("", response_model=List[ChunkSearchResult])
+async def search_documents(
+    document_ids: Annotated[FrozenSet[int], Depends(get_visible_document_ids)],
+    q: str = Query(..., min_length=1, max_length=500),
+    k: int = Query(10, ge=1, le=50)
+):
+    """Search across every document the user owns or has shared with them"""
+    chunks = await VectorStoreService().search_chunks(q, document_ids, k)
+    return [
+        ChunkSearchResult(
+            document_id=int(chunk["document_id"]),
+            document_name=chunk.get("metadata", {}).get("document_name"),
+            chunk_index=chunk["chunk_index"],
+            chunk_text=chunk["chunk_text"],
+            similarity_score=chunk.get("similarity_score"),
+            rrf_score=chunk["rrf_score"]
+        )
+        for chunk in chunks
+    ]
@@ -0,0 +1,57 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db_session
+from app.schemas.auth import UserInDB
+from app.schemas.document import UploadResult, UploadSessionCreate, UploadSessionStatus
+from app.services.auth import AuthService
+from app.services.upload_sessions import UploadSessionService
+from app.utils.uploads import parse_content_range
+
+router = APIRouter()
+
+CurrentUser = Annotated[UserInDB, Depends(AuthService.get_current_user)]
+
+@router.post("", response_model=UploadSessionStatus, status_code=status.HTTP_201_CREATED)
+async def create_upload(data: UploadSessionCreate, current_user: CurrentUser):
+    """Starts a resumable upload; parts are then PUT with Content-Range in any order"""
+    return await UploadSessionService.create_session(current_user.id, data)
+
+@router.get("/{session_id}", response_model=UploadSessionStatus)
+async def get_upload(session_id: str, current_user: CurrentUser):
+    """Received bytes and missing ranges, to resume after a failure"""
+    return await UploadSessionService.get_status(session_id, current_user.id)
+
+@router.put("/{session_id}", response_model=UploadSessionStatus)
+async def upload_range(
+    session_id: str,
+    request: Request,
+    current_user: CurrentUser,
+    content_range: Annotated[str, Header()]
+):
+    try:
+        start, end, total = parse_content_range(content_range)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail=str(e)
+        )
+    return await UploadSessionService.write_range(
+        session_id, current_user.id, start, end, total, request.stream()
+    )
+
+@router.post("/{session_id}/complete", response_model=UploadResult)
+async def complete_upload(
+    session_id: str,
+    current_user: CurrentUser,
+    db: Annotated[AsyncSession, Depends(get_db_session)]
+):
+    """Verifies the hash, registers the document and queues it for processing"""
+    return await UploadSessionService.finalize(db, session_id, current_user.id)
+
+@router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload(session_id: str, current_user: CurrentUser):
+    await UploadSessionService.abort(session_id, current_user.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
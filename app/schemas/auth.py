@@ -55,4 +55,11 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: str | None = None
+    scopes: list[str] = []
+
+class TokenUser(BaseModel):
+    """Identity taken from signed token claims, without a database lookup"""
+    id: int
+    email: str
+    role: UserRole
     scopes: list[str] = []
\ No newline at end of file
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Literal, Optional, List, Tuple, Union
 from enum import Enum
 import re
 
@@ -37,6 +37,31 @@ class DocumentInDB(DocumentBase):
     class Config:
         from_attributes = True
 
+class DocumentSummary(BaseModel):
+    """Listing projection: no description, metadata or processing errors"""
+    id: int
+    name: str
+    file_type: str
+    file_size: int
+    status: DocumentStatus
+    tags: Optional[List[str]] = None
+    created_at: datetime
+    updated_at: datetime
+
+    @field_validator('tags', mode='before')
+    def split_tags(cls, v):
+        # create_document guarda los tags como texto separado por comas
+        if isinstance(v, str):
+            return [tag for tag in v.split(",") if tag]
+        return v
+
+    class Config:
+        from_attributes = True
+
+class DocumentPage(BaseModel):
+    items: List[DocumentSummary]
+    next_cursor: Optional[str] = None
+
 class DocumentShare(BaseModel):
     email: str
     permission_level: str = "read"
@@ -48,4 +73,76 @@ class DocumentShare(BaseModel):
     def validate_permission(cls, v):
         if v not in ["read", "write", "comment", "share"]:
             raise ValueError('Invalid permission level')
-        return v
\ No newline at end of file
+        return v
+
+class BulkShare(BaseModel):
+    emails: List[str] = Field(..., min_length=1, max_length=500)
+    permission_level: str = "read"
+    expires_at: Optional[datetime] = None
+    can_download: bool = True
+    message: Optional[str] = Field(None, max_length=500)
+
+    @field_validator('permission_level')
+    def validate_permission(cls, v):
+        if v not in ["read", "write", "comment", "share"]:
+            raise ValueError('Invalid permission level')
+        return v
+
+class BulkDocumentIds(BaseModel):
+    document_ids: List[int] = Field(..., min_length=1, max_length=500)
+
+class BulkReprocess(BulkDocumentIds):
+    # Vuelve a extraer el texto en lugar de reutilizar el artefacto guardado
+    force_extract: bool = False
+
+class BulkShareIds(BaseModel):
+    share_ids: List[int] = Field(..., min_length=1, max_length=500)
+
+class BulkItemResult(BaseModel):
+    id: Union[int, str]
+    status: Literal["ok", "queued", "not_found", "skipped", "rejected"]
+    detail: Optional[str] = None
+
+class BulkResult(BaseModel):
+    results: List[BulkItemResult]
+    succeeded: int
+    failed: int
+
+    @classmethod
+    def from_items(cls, results: List[BulkItemResult]) -> "BulkResult":
+        succeeded = sum(1 for r in results if r.status in ("ok", "queued"))
+        return cls(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
+class UploadResult(BaseModel):
+    filename: str
+    status: Literal["queued", "accepted", "rejected"]
+    document_id: Optional[int] = None
+    checksum: Optional[str] = None
+    detail: Optional[str] = None
+
+class BatchUploadResult(BaseModel):
+    results: List[UploadResult]
+    succeeded: int
+    failed: int
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=255)
+    size: int = Field(..., ge=0)
+    sha256: Optional[str] = Field(None, pattern=r'^[0-9a-fA-F]{64}$')
+
+class UploadSessionStatus(BaseModel):
+    id: str
+    filename: str
+    size: int
+    received_bytes: int
+    missing: List[Tuple[int, int]]
+    complete: bool
+    expires_at: datetime
+
+class ChunkSearchResult(BaseModel):
+    document_id: int
+    document_name: Optional[str] = None
+    chunk_index: int
+    chunk_text: str
+    similarity_score: Optional[float] = None
+    rrf_score: float
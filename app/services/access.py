@@ -0,0 +1,212 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.access import DocumentAccess
+from app.models.document import Document
+from app.models.shared import OWNER_LEVEL, PERMISSION_LEVELS, SharedDocument, SharePermission
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class AccessEntry(NamedTuple):
+    level: int
+    can_download: bool
+    expires_at: Optional[datetime]
+
+    def active(self, now: datetime) -> bool:
+        return self.expires_at is None or self.expires_at > now
+
+# Todos los accesos de un usuario, {document_id: AccessEntry}
+_access_cache: TTLCache[Dict[int, AccessEntry]] = TTLCache(
+    "document_access", settings.ACCESS_CACHE_SIZE, settings.ACCESS_CACHE_TTL
+)
+
+class AccessService:
+    @staticmethod
+    async def get_user_access(db: AsyncSession, user_id: int) -> Dict[int, AccessEntry]:
+        access = _access_cache.get(user_id)
+        if access is None:
+            result = await db.execute(
+                select(
+                    DocumentAccess.document_id,
+                    DocumentAccess.level,
+                    DocumentAccess.can_download,
+                    DocumentAccess.expires_at
+                ).where(DocumentAccess.user_id == user_id)
+            )
+            now = datetime.utcnow()
+            access, expired = {}, []
+            for row in result:
+                entry = AccessEntry(row.level, row.can_download, row.expires_at)
+                if entry.active(now):
+                    access[row.document_id] = entry
+                else:
+                    expired.append((user_id, row.document_id))
+            if expired:
+                # Al caducar el share más alto puede quedar otro válido de menor nivel
+                fallbacks = await AccessService._compute(db, expired, now)
+                access.update(
+                    (document_id, entry) for (_, document_id), entry in fallbacks.items()
+                )
+            _access_cache.set(user_id, access)
+        return access
+
+    @staticmethod
+    async def get_level(db: AsyncSession, user_id: int, document_id: int) -> int:
+        """0 when the user has no (unexpired) access"""
+        entry = (await AccessService.get_user_access(db, user_id)).get(document_id)
+        if entry is None or not entry.active(datetime.utcnow()):
+            return 0
+        return entry.level
+
+    @staticmethod
+    async def has_permission(
+        db: AsyncSession,
+        user_id: int,
+        document_id: int,
+        permission: SharePermission = SharePermission.READ
+    ) -> bool:
+        level = await AccessService.get_level(db, user_id, document_id)
+        return level >= PERMISSION_LEVELS[permission]
+
+    @staticmethod
+    async def get_accessible_document_ids(
+        db: AsyncSession,
+        user_id: int,
+        permission: SharePermission = SharePermission.READ
+    ) -> FrozenSet[int]:
+        min_level = PERMISSION_LEVELS[permission]
+        now = datetime.utcnow()
+        return frozenset(
+            document_id
+            for document_id, entry in (await AccessService.get_user_access(db, user_id)).items()
+            if entry.level >= min_level and entry.active(now)
+        )
+
+    @staticmethod
+    async def refresh(db: AsyncSession, user_id: int, document_id: int) -> Optional[AccessEntry]:
+        """Recomputes one (user, document) row from ownership and active shares.
+
+        Runs inside the caller's transaction; call invalidate() after commit.
+        """
+        entries = await AccessService.refresh_many(db, [(user_id, document_id)])
+        return entries.get((user_id, document_id))
+
+    @staticmethod
+    async def refresh_many(
+        db: AsyncSession,
+        pairs: Iterable[Tuple[int, int]]
+    ) -> Dict[Tuple[int, int], AccessEntry]:
+        """Batch version of refresh: three statements whatever the number of pairs"""
+        pairs = set(pairs)
+        if not pairs:
+            return {}
+        entries = await AccessService._compute(db, pairs, datetime.utcnow())
+
+        await db.execute(
+            delete(DocumentAccess).where(
+                tuple_(DocumentAccess.user_id, DocumentAccess.document_id).in_(list(pairs))
+            )
+        )
+        if entries:
+            await db.execute(insert(DocumentAccess), [
+                {
+                    "user_id": user_id,
+                    "document_id": document_id,
+                    "level": entry.level,
+                    "can_download": entry.can_download,
+                    "expires_at": entry.expires_at
+                }
+                for (user_id, document_id), entry in entries.items()
+            ])
+        return entries
+
+    @staticmethod
+    async def _compute(
+        db: AsyncSession,
+        pairs: Iterable[Tuple[int, int]],
+        now: datetime
+    ) -> Dict[Tuple[int, int], AccessEntry]:
+        """Effective access from ownership and the shares active at `now`, without writing it"""
+        pairs = set(pairs)
+        user_ids = {user_id for user_id, _ in pairs}
+        document_ids = {document_id for _, document_id in pairs}
+
+        owners = dict((await db.execute(
+            select(Document.id, Document.user_id).where(Document.id.in_(document_ids))
+        )).all())
+        shares = (await db.execute(
+            select(
+                SharedDocument.shared_with_id,
+                SharedDocument.document_id,
+                SharedDocument.permission_level,
+                SharedDocument.can_download,
+                SharedDocument.expires_at
+            ).where(
+                SharedDocument.document_id.in_(document_ids),
+                SharedDocument.shared_with_id.in_(user_ids),
+                SharedDocument.revoked_at.is_(None),
+                or_(
+                    SharedDocument.expires_at.is_(None),
+                    SharedDocument.expires_at > now
+                )
+            )
+        )).all()
+
+        shares_by_pair = defaultdict(list)
+        for share in shares:
+            shares_by_pair[(share.shared_with_id, share.document_id)].append(share)
+
+        entries = {}
+        for user_id, document_id in pairs:
+            if owners.get(document_id) == user_id:
+                entries[(user_id, document_id)] = AccessEntry(OWNER_LEVEL, True, None)
+            else:
+                entry = _merge_shares(shares_by_pair.get((user_id, document_id), ()), now)
+                if entry is not None:
+                    entries[(user_id, document_id)] = entry
+        return entries
+
+    @staticmethod
+    async def purge_expired(db: AsyncSession) -> int:
+        """Recomputes expired rows: lower shares still active replace them, the rest are deleted.
+
+        Reads already do this on the fly; running it keeps the table small and
+        the read path free of recomputation. Call invalidate() after commit.
+        """
+        expired = (await db.execute(
+            select(DocumentAccess.user_id, DocumentAccess.document_id)
+            .where(DocumentAccess.expires_at <= func.now())
+        )).all()
+        await AccessService.refresh_many(db, [tuple(row) for row in expired])
+        return len(expired)
+
+    @staticmethod
+    def invalidate(*user_ids: int) -> None:
+        for user_id in user_ids:
+            _access_cache.pop(user_id)
+
+def _merge_shares(shares, now: datetime) -> Optional[AccessEntry]:
+    """Highest level among the shares active at `now`; it expires with the last share granting it.
+
+    When it expires, merging again at that time falls back to the lower shares still active.
+    """
+    shares = [share for share in shares if share.expires_at is None or share.expires_at > now]
+    if not shares:
+        return None
+    level = max(PERMISSION_LEVELS.get(share.permission_level, 0) for share in shares)
+    granting = [share for share in shares if PERMISSION_LEVELS.get(share.permission_level, 0) == level]
+    expires_at = None
+    if all(share.expires_at is not None for share in granting):
+        expires_at = max(share.expires_at for share in granting)
+    return AccessEntry(
+        level,
+        any(share.can_download for share in shares),
+        expires_at
+    )
@@ -5,19 +5,18 @@ from typing import Optional, Annotated
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.database import get_db_session
 from app.models.user import User
-from app.schemas.auth import Token, TokenData, UserCreate, UserInDB
-from app.utils.security import generate_password_reset_token, verify_password_reset_token
+from app.schemas.auth import Token, TokenData, TokenUser, UserCreate, UserInDB
+from app.utils.cache import invalidate_user, user_cache
+from app.utils.security import SecurityUtils, generate_password_reset_token, verify_password_reset_token
 
 logger = logging.getLogger(__name__)
 
 # Security configurations
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="auth/login",
     scopes={
@@ -30,12 +29,13 @@ oauth2_scheme = OAuth2PasswordBearer(
 
 class AuthService:
     @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(plain_password: str, hashed_password: str) -> bool:
+        # PasswordHashingBusyError llega al handler global de main.py (429)
+        return await SecurityUtils.verify_password_async(plain_password, hashed_password)
 
     @staticmethod
-    def get_password_hash(password: str) -> str:
-        return pwd_context.hash(password)
+    async def get_password_hash(password: str) -> str:
+        return await SecurityUtils.get_password_hash_async(password)
 
     @staticmethod
     async def get_user(db: AsyncSession, email: str) -> Optional[UserInDB]:
@@ -54,7 +54,7 @@ class AuthService:
         user = await AuthService.get_user(db, email)
         if not user:
             return None
-        if not AuthService.verify_password(password, user.hashed_password):
+        if not await AuthService.verify_password(password, user.hashed_password):
             return None
         return user
 
@@ -72,6 +72,7 @@ class AuthService:
         
         to_encode.update({
             "exp": expire,
+            "iat": datetime.utcnow(),
             "scopes": scopes
         })
         encoded_jwt = jwt.encode(
@@ -82,10 +83,41 @@ class AuthService:
         return encoded_jwt
 
     @staticmethod
-    async def get_current_user(
-        token: Annotated[str, Depends(oauth2_scheme)],
-        db: Annotated[AsyncSession, Depends(get_db_session)]
-    ) -> UserInDB:
+    def create_user_token(
+        user: UserInDB,
+        expires_delta: Optional[timedelta] = None,
+        scopes: list[str] = []
+    ) -> str:
+        """Access token carrying the user id and role as signed claims"""
+        return AuthService.create_access_token(
+            {"sub": user.email, "uid": user.id, "role": user.role.value},
+            expires_delta=expires_delta,
+            scopes=scopes
+        )
+
+    @staticmethod
+    def issue_token(user: UserInDB, scopes: list[str] = []) -> Token:
+        """Login response; the token carries uid/role so get_token_user can skip the user lookup"""
+        expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        return Token(
+            access_token=AuthService.create_user_token(user, expires_delta, scopes),
+            token_type="bearer",
+            expires_in=int(expires_delta.total_seconds())
+        )
+
+    @staticmethod
+    async def login(db: AsyncSession, form_data: OAuth2PasswordRequestForm) -> Token:
+        user = await AuthService.authenticate_user(db, form_data.username, form_data.password)
+        if not user or not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect email or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return AuthService.issue_token(user, form_data.scopes)
+
+    @staticmethod
+    def _decode_token(token: str) -> dict:
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -97,19 +129,54 @@ class AuthService:
                 settings.SECRET_KEY, 
                 algorithms=[settings.ALGORITHM]
             )
-            email: str = payload.get("sub")
-            if email is None:
-                raise credentials_exception
-            token_scopes = payload.get("scopes", [])
-            token_data = TokenData(email=email, scopes=token_scopes)
         except JWTError:
             raise credentials_exception
-        
-        user = await AuthService.get_user(db, email=token_data.email)
-        if user is None:
+        if payload.get("sub") is None:
             raise credentials_exception
+        return payload
+
+    @staticmethod
+    async def _resolve_user(db: AsyncSession, payload: dict) -> UserInDB:
+        # Un mismo token resuelve siempre al mismo usuario hasta que se invalide
+        key = (payload["sub"], payload.get("iat"))
+        user = user_cache.get(key)
+        if user is None:
+            user = await AuthService.get_user(db, email=payload["sub"])
+            if user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            user_cache.set(key, user)
         return user
 
+    @staticmethod
+    async def get_current_user(
+        token: Annotated[str, Depends(oauth2_scheme)],
+        db: Annotated[AsyncSession, Depends(get_db_session)]
+    ) -> UserInDB:
+        payload = AuthService._decode_token(token)
+        return await AuthService._resolve_user(db, payload)
+
+    @staticmethod
+    async def get_token_user(
+        token: Annotated[str, Depends(oauth2_scheme)],
+        db: Annotated[AsyncSession, Depends(get_db_session)]
+    ) -> TokenUser:
+        """Identity for read-only routes; trusts signed claims when AUTH_TRUST_TOKEN_CLAIMS is set"""
+        payload = AuthService._decode_token(token)
+        scopes = payload.get("scopes", [])
+        if settings.AUTH_TRUST_TOKEN_CLAIMS and "uid" in payload and "role" in payload:
+            return TokenUser(
+                id=payload["uid"],
+                email=payload["sub"],
+                role=payload["role"],
+                scopes=scopes
+            )
+        user = await AuthService._resolve_user(db, payload)
+        return TokenUser(id=user.id, email=user.email, role=user.role, scopes=scopes)
+
     @staticmethod
     async def create_user(db: AsyncSession, user_create: UserCreate) -> UserInDB:
         existing_user = await AuthService.get_user(db, user_create.email)
@@ -119,7 +186,7 @@ class AuthService:
                 detail="Email already registered"
             )
         
-        hashed_password = AuthService.get_password_hash(user_create.password)
+        hashed_password = await AuthService.get_password_hash(user_create.password)
         db_user = User(
             email=user_create.email,
             hashed_password=hashed_password,
@@ -151,7 +218,8 @@ class AuthService:
                 detail="User not found"
             )
         
-        hashed_password = AuthService.get_password_hash(new_password)
+        hashed_password = await AuthService.get_password_hash(new_password)
         user.hashed_password = hashed_password
         await db.commit()
+        invalidate_user(email=email)
         return UserInDB.from_orm(user)
\ No newline at end of file
@@ -1,23 +1,64 @@
 import os
+import base64
+import json
 import logging
 from datetime import datetime
-from typing import Optional, List, AsyncGenerator
+from typing import Optional, List, AsyncGenerator, Tuple
 from pathlib import Path
 
 from fastapi import UploadFile, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, update, delete, insert, and_, or_
 
 from app.config import settings
 from app.database import get_db_session
-from app.models.document import Document, SharedDocument
-from app.schemas.document import DocumentCreate, DocumentShare
-from app.utils.file_processing import save_upload_file, extract_text_from_file
+from app.models.document import Document
+from app.models.access import DocumentAccess
+from app.models.shared import OWNER_LEVEL, SharedDocument
+from app.models.user import User
+from app.schemas.document import (
+    BatchUploadResult, BulkItemResult, BulkResult, BulkShare, DocumentCreate, DocumentPage,
+    DocumentShare, DocumentSummary, UploadResult
+)
+from app.utils.file_processing import save_upload_file
+from app.services.access import AccessService
+from app.services.processing_queue import get_processing_queue
+from app.services.storage import get_storage
+from app.services.text_artifacts import TextArtifactService
 from app.services.vector_store import VectorStoreService
 from app.services.ollama import OllamaService
+from app.utils.metrics import observe_stage
+from app.utils.uploads import StreamedFile, remove_files
 
 logger = logging.getLogger(__name__)
 
+# Columnas del listado; los campos de texto grandes se quedan fuera
+LISTING_COLUMNS = (
+    Document.id,
+    Document.name,
+    Document.file_type,
+    Document.file_size,
+    Document.status,
+    Document.tags,
+    Document.created_at,
+    Document.updated_at,
+)
+
+def _encode_cursor(created_at: datetime, document_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), document_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, document_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(document_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
 class DocumentService:
     @staticmethod
     async def create_document(
@@ -47,30 +88,152 @@ class DocumentService:
         )
         
         db.add(document)
+        await db.flush()
+        db.add(DocumentAccess(
+            user_id=user_id,
+            document_id=document.id,
+            level=OWNER_LEVEL,
+            can_download=True
+        ))
         await db.commit()
+        AccessService.invalidate(user_id)
         await db.refresh(document)
         return document
 
+    @staticmethod
+    async def create_documents(
+        db: AsyncSession,
+        user_id: int,
+        files: List[StreamedFile]
+    ) -> BatchUploadResult:
+        """Registers already-streamed files in one transaction and queues them for processing"""
+        accepted = [file for file in files if file.error is None]
+        documents = [
+            Document(
+                user_id=user_id,
+                name=file.filename,
+                file_path=file.path,
+                file_type=file.file_type,
+                file_size=file.size,
+                checksum=file.checksum
+            )
+            for file in accepted
+        ]
+
+        queued: List[bool] = []
+        if documents:
+            try:
+                db.add_all(documents)
+                await db.flush()
+                await db.execute(insert(DocumentAccess), [
+                    {
+                        "user_id": user_id,
+                        "document_id": document.id,
+                        "level": OWNER_LEVEL,
+                        "can_download": True
+                    }
+                    for document in documents
+                ])
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                await remove_files(accepted)
+                logger.error(f"Error registering uploaded documents: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Error registering uploaded documents"
+                )
+            AccessService.invalidate(user_id)
+            queued = get_processing_queue().enqueue_many(
+                (document.id, user_id) for document in documents
+            )
+
+        by_file = {
+            id(file): (document, was_queued)
+            for file, document, was_queued in zip(accepted, documents, queued)
+        }
+        results = []
+        for file in files:
+            if file.error:
+                results.append(UploadResult(filename=file.filename, status="rejected", detail=file.error))
+                continue
+            document, was_queued = by_file[id(file)]
+            results.append(UploadResult(
+                filename=file.filename,
+                status="queued" if was_queued else "accepted",
+                document_id=document.id,
+                checksum=file.checksum,
+                detail=None if was_queued else "Processing queue is full"
+            ))
+        succeeded = sum(1 for r in results if r.status != "rejected")
+        return BatchUploadResult(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
     @staticmethod
     async def get_user_documents(
         db: AsyncSession,
         user_id: int,
-        skip: int = 0,
+        cursor: Optional[str] = None,
         limit: int = 100
-    ) -> List[Document]:
-        result = await db.execute(
-            select(Document)
+    ) -> DocumentPage:
+        """Newest first; keyset over (created_at, id) so every page costs the same"""
+        query = (
+            select(*LISTING_COLUMNS)
             .where(Document.user_id == user_id)
-            .offset(skip)
-            .limit(limit)
+            .order_by(Document.created_at.desc(), Document.id.desc())
+            .limit(limit + 1)
+        )
+        if cursor:
+            created_at, document_id = _decode_cursor(cursor)
+            query = query.where(or_(
+                Document.created_at < created_at,
+                and_(Document.created_at == created_at, Document.id < document_id)
+            ))
+
+        rows = (await db.execute(query)).all()
+        items = [DocumentSummary.model_validate(row._mapping) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = _encode_cursor(last.created_at, last.id)
+        return DocumentPage(items=items, next_cursor=next_cursor)
+
+    @staticmethod
+    async def get_downloadable_document(
+        db: AsyncSession,
+        user_id: int,
+        document_id: int
+    ):
+        """Document row for a download, checked against the materialized access index"""
+        access = (await AccessService.get_user_access(db, user_id)).get(document_id)
+        if access is None or not access.active(datetime.utcnow()):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found"
+            )
+        if not access.can_download:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Download not allowed for this share"
+            )
+
+        result = await db.execute(
+            select(Document.name, Document.file_path, Document.checksum)
+            .where(Document.id == document_id)
         )
-        return result.scalars().all()
+        document = result.first()
+        if document is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found"
+            )
+        return document
 
     @staticmethod
     async def process_document(
         db: AsyncSession,
         document_id: int,
-        user_id: int
+        user_id: int,
+        force_extract: bool = False
     ) -> Document:
         # Get document with lock
         result = await db.execute(
@@ -93,14 +256,19 @@ class DocumentService:
             return document
         
         try:
-            # Extract text from file
-            text = await extract_text_from_file(document.file_path)
+            # Extract text from file, or reuse the artifact of an earlier run
+            with observe_stage("extract"):
+                extracted = await TextArtifactService.get_text(
+                    document.file_path,
+                    document.checksum,
+                    force=force_extract
+                )
             
-            # Process text and create embeddings
+            # Process text and create embeddings, segment by segment
             vector_service = VectorStoreService()
             await vector_service.create_and_store_embeddings(
                 document_id=str(document.id),
-                text=text,
+                text=extracted.segments(),
                 metadata={
                     "user_id": str(user_id),
                     "document_name": document.name,
@@ -167,10 +335,256 @@ class DocumentService:
             document_id=document_id,
             owner_id=owner_id,
             shared_with_id=shared_with.id,
-            permission_level=share_data.permission_level
+            permission_level=share_data.permission_level,
+            expires_at=share_data.expires_at,
+            can_download=share_data.can_download
         )
         
         db.add(shared_doc)
+        await db.flush()
+        await AccessService.refresh(db, shared_with.id, document_id)
         await db.commit()
+        AccessService.invalidate(shared_with.id)
         await db.refresh(shared_doc)
-        return shared_doc
\ No newline at end of file
+        return shared_doc
+
+    @staticmethod
+    async def revoke_share(
+        db: AsyncSession,
+        share_id: int,
+        owner_id: int
+    ) -> SharedDocument:
+        result = await db.execute(
+            select(SharedDocument)
+            .where(
+                SharedDocument.id == share_id,
+                SharedDocument.owner_id == owner_id
+            )
+        )
+        shared_doc = result.scalars().first()
+        if not shared_doc:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Share not found"
+            )
+
+        if shared_doc.revoked_at is None:
+            shared_doc.revoked_at = datetime.utcnow()
+            shared_doc.revoked_by = owner_id
+            await db.flush()
+            await AccessService.refresh(db, shared_doc.shared_with_id, shared_doc.document_id)
+            await db.commit()
+            AccessService.invalidate(shared_doc.shared_with_id)
+        return shared_doc
+
+    @staticmethod
+    async def reprocess_document(
+        db: AsyncSession,
+        document_id: int,
+        user_id: int,
+        force_extract: bool = False
+    ) -> Document:
+        """Drops existing embeddings and processes the document again.
+
+        The extracted text is reused unless `force_extract` is set, so only
+        chunking and embedding run again.
+        """
+        await VectorStoreService().delete_document_embeddings(str(document_id))
+        await db.execute(
+            update(Document)
+            .where(Document.id == document_id, Document.user_id == user_id)
+            .values(processed=False)
+        )
+        await db.commit()
+        return await DocumentService.process_document(db, document_id, user_id, force_extract)
+
+    @staticmethod
+    async def bulk_share(
+        db: AsyncSession,
+        document_id: int,
+        owner_id: int,
+        share_data: BulkShare
+    ) -> BulkResult:
+        """Shares one document with many users: one lookup per table, one commit"""
+        doc_result = await db.execute(
+            select(Document.id)
+            .where(
+                Document.id == document_id,
+                Document.user_id == owner_id
+            )
+        )
+        if doc_result.scalar() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found"
+            )
+
+        emails = list(dict.fromkeys(share_data.emails))
+        users = dict((await db.execute(
+            select(User.email, User.id).where(User.email.in_(emails))
+        )).all())
+        already_shared = set((await db.execute(
+            select(SharedDocument.shared_with_id).where(
+                SharedDocument.document_id == document_id,
+                SharedDocument.shared_with_id.in_(list(users.values())),
+                SharedDocument.revoked_at.is_(None),
+                # Un share caducado no cuenta: se puede volver a compartir
+                or_(
+                    SharedDocument.expires_at.is_(None),
+                    SharedDocument.expires_at > datetime.utcnow()
+                )
+            )
+        )).scalars().all())
+
+        results, recipients = [], []
+        for email in emails:
+            user_id = users.get(email)
+            if user_id is None:
+                results.append(BulkItemResult(id=email, status="not_found", detail="User not found"))
+            elif user_id == owner_id:
+                results.append(BulkItemResult(id=email, status="skipped", detail="Owner"))
+            elif user_id in already_shared:
+                results.append(BulkItemResult(id=email, status="skipped", detail="Already shared"))
+            else:
+                recipients.append(user_id)
+                results.append(BulkItemResult(id=email, status="ok"))
+
+        if recipients:
+            # executemany: un único INSERT para todos los destinatarios
+            await db.execute(insert(SharedDocument), [
+                {
+                    "document_id": document_id,
+                    "owner_id": owner_id,
+                    "shared_with_id": user_id,
+                    "permission_level": share_data.permission_level,
+                    "expires_at": share_data.expires_at,
+                    "can_download": share_data.can_download,
+                    "notification_message": share_data.message
+                }
+                for user_id in recipients
+            ])
+            await AccessService.refresh_many(db, [(user_id, document_id) for user_id in recipients])
+            await db.commit()
+            AccessService.invalidate(*recipients)
+        return BulkResult.from_items(results)
+
+    @staticmethod
+    async def bulk_revoke(
+        db: AsyncSession,
+        owner_id: int,
+        share_ids: List[int]
+    ) -> BulkResult:
+        share_ids = list(dict.fromkeys(share_ids))
+        shares = (await db.execute(
+            select(
+                SharedDocument.id,
+                SharedDocument.shared_with_id,
+                SharedDocument.document_id,
+                SharedDocument.revoked_at
+            ).where(
+                SharedDocument.id.in_(share_ids),
+                SharedDocument.owner_id == owner_id
+            )
+        )).all()
+        by_id = {share.id: share for share in shares}
+        to_revoke = [share for share in shares if share.revoked_at is None]
+
+        if to_revoke:
+            await db.execute(
+                update(SharedDocument)
+                .where(SharedDocument.id.in_([share.id for share in to_revoke]))
+                .values(revoked_at=datetime.utcnow(), revoked_by=owner_id)
+            )
+            await AccessService.refresh_many(
+                db, [(share.shared_with_id, share.document_id) for share in to_revoke]
+            )
+            await db.commit()
+            AccessService.invalidate(*{share.shared_with_id for share in to_revoke})
+
+        results = []
+        for share_id in share_ids:
+            share = by_id.get(share_id)
+            if share is None:
+                results.append(BulkItemResult(id=share_id, status="not_found", detail="Share not found"))
+            elif share.revoked_at is not None:
+                results.append(BulkItemResult(id=share_id, status="skipped", detail="Already revoked"))
+            else:
+                results.append(BulkItemResult(id=share_id, status="ok"))
+        return BulkResult.from_items(results)
+
+    @staticmethod
+    async def bulk_delete(
+        db: AsyncSession,
+        user_id: int,
+        document_ids: List[int]
+    ) -> BulkResult:
+        document_ids = list(dict.fromkeys(document_ids))
+        rows = (await db.execute(
+            select(Document.id, Document.file_path, Document.checksum).where(
+                Document.id.in_(document_ids),
+                Document.user_id == user_id
+            )
+        )).all()
+        owned = {document_id: file_path for document_id, file_path, _ in rows}
+        checksums = {checksum for _, _, checksum in rows if checksum}
+
+        if owned:
+            # Usuarios cuya caché de accesos incluye estos documentos
+            affected_users = set((await db.execute(
+                select(DocumentAccess.user_id).where(DocumentAccess.document_id.in_(list(owned)))
+            )).scalars().all())
+            # El delete Core no pasa por la cascada del ORM y la migración inicial
+            # no declara ON DELETE CASCADE en shared_documents
+            await db.execute(delete(SharedDocument).where(SharedDocument.document_id.in_(list(owned))))
+            await db.execute(delete(Document).where(Document.id.in_(list(owned))))
+            # Los artefactos de texto se comparten entre documentos con el mismo contenido
+            if checksums:
+                checksums -= set((await db.execute(
+                    select(Document.checksum).where(Document.checksum.in_(list(checksums)))
+                )).scalars().all())
+            await db.commit()
+            AccessService.invalidate(*affected_users)
+
+            vector_service = VectorStoreService()
+            for document_id, file_path in owned.items():
+                try:
+                    await vector_service.delete_document_embeddings(str(document_id))
+                    if file_path:
+                        await get_storage().delete(file_path)
+                except Exception as e:
+                    # El registro ya no existe; los restos se limpian sin fallar la operación
+                    logger.error(f"Cleanup of deleted document {document_id} failed: {str(e)}")
+            await TextArtifactService.delete(checksums)
+
+        return BulkResult.from_items([
+            BulkItemResult(id=document_id, status="ok")
+            if document_id in owned
+            else BulkItemResult(id=document_id, status="not_found", detail="Document not found")
+            for document_id in document_ids
+        ])
+
+    @staticmethod
+    async def bulk_reprocess(
+        db: AsyncSession,
+        user_id: int,
+        document_ids: List[int],
+        force_extract: bool = False
+    ) -> BulkResult:
+        document_ids = list(dict.fromkeys(document_ids))
+        owned = set((await db.execute(
+            select(Document.id).where(
+                Document.id.in_(document_ids),
+                Document.user_id == user_id
+            )
+        )).scalars().all())
+
+        queue = get_processing_queue()
+        results = []
+        for document_id in document_ids:
+            if document_id not in owned:
+                results.append(BulkItemResult(id=document_id, status="not_found", detail="Document not found"))
+            elif queue.enqueue(document_id, user_id, reprocess=True, force_extract=force_extract):
+                results.append(BulkItemResult(id=document_id, status="queued"))
+            else:
+                results.append(BulkItemResult(id=document_id, status="rejected", detail="Processing queue is full"))
+        return BulkResult.from_items(results)
@@ -0,0 +1,143 @@
+import logging
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.utils.resources import available_cpus
+
+logger = logging.getLogger(__name__)
+
+class SentenceTransformerEmbedder:
+    """PyTorch sentence-transformers runtime"""
+
+    def __init__(self, model_name: str, threads: int):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], normalize: bool = True) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=normalize
+        ).astype('float32')
+
+class OnnxEmbedder:
+    """ONNX Runtime export of the model with int8 dynamic quantization"""
+
+    def __init__(self, model_name: str, threads: int, export_dir: str):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=onnx requires onnxruntime (and optimum for the first export)"
+            ) from e
+
+        model_path = self._prepare(model_name, Path(export_dir))
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_path),
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    @staticmethod
+    def _prepare(model_name: str, export_dir: Path) -> Path:
+        """Exports the model to ONNX and quantizes it once; later starts reuse the files"""
+        quantized = export_dir / "model.int8.onnx"
+        if quantized.exists():
+            return quantized
+
+        exported = export_dir / "model.onnx"
+        if not exported.exists():
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+
+            logger.info(f"Exporting {model_name} to ONNX in {export_dir}")
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(export_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing {exported} to int8")
+        quantize_dynamic(str(exported), str(quantized), weight_type=QuantType.QInt8)
+        return quantized
+
+    def encode(self, texts: List[str], normalize: bool = True) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), settings.EMBEDDING_BATCH_SIZE):
+            tokens = self.tokenizer(
+                texts[start:start + settings.EMBEDDING_BATCH_SIZE],
+                padding=True,
+                truncation=True,
+                max_length=settings.EMBEDDING_MAX_LENGTH,
+                return_tensors="np"
+            )
+            feed = {
+                name: value.astype(np.int64)
+                for name, value in tokens.items()
+                if name in self.input_names
+            }
+            hidden = self.session.run(None, feed)[0]
+
+            # Mean pooling, igual que el modelo de sentence-transformers
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            batches.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+
+        embeddings = np.vstack(batches).astype('float32')
+        if normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+def create_embedder(
+    model_name: Optional[str] = None,
+    backend: Optional[str] = None
+):
+    """Embedding runtime selected by EMBEDDING_BACKEND, sized to the pod's CPU quota"""
+    model_name = model_name or settings.EMBEDDING_MODEL
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+    threads = settings.EMBEDDING_THREADS or available_cpus()
+    logger.info(f"Loading {backend} embedder for {model_name} with {threads} threads")
+
+    if backend == "onnx":
+        export_dir = Path(settings.EMBEDDING_ONNX_DIR) / model_name.replace("/", "__")
+        return OnnxEmbedder(model_name, threads, str(export_dir))
+    if backend == "sentence-transformers":
+        return SentenceTransformerEmbedder(model_name, threads)
+    raise ValueError(f"Unsupported EMBEDDING_BACKEND: {backend}")
+
+def benchmark(embedder, sentences: List[str], rounds: int = 3) -> float:
+    """Throughput in sentences/sec (best of several rounds, after one warm-up)"""
+    embedder.encode(sentences[:settings.EMBEDDING_BATCH_SIZE])
+    best = 0.0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        embedder.encode(sentences)
+        best = max(best, len(sentences) / (time.perf_counter() - started))
+    return best
+
+if __name__ == "__main__":
+    # python -m app.services.embeddings: compara el rendimiento de los dos runtimes
+    sample = [
+        f"Invoice {i} for part AB-{1000 + i} was approved by the regional office."
+        for i in range(512)
+    ]
+    for name in ("sentence-transformers", "onnx"):
+        print(f"{name}: {benchmark(create_embedder(backend=name), sample):.1f} sentences/sec")
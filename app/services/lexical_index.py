@@ -0,0 +1,156 @@
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Conserva códigos y referencias (AB-123.4, v2/rc1) como un único término
+TOKEN_PATTERN = re.compile(r"\w(?:[\w\-\./]*\w)?", re.UNICODE)
+COMPOUND_SEPARATORS = re.compile(r"[\-\./]")
+
+def tokenize(text: str) -> List[str]:
+    """Tokens en minúsculas; los códigos compuestos también aportan sus partes"""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if COMPOUND_SEPARATORS.search(token):
+            tokens.extend(part for part in COMPOUND_SEPARATORS.split(token) if part)
+    return tokens
+
+class _Postings:
+    """Compact postings list: parallel typed arrays instead of per-document objects"""
+    __slots__ = ("ids", "tfs", "lengths")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.tfs = array("I")
+        self.lengths = array("I")
+
+class LexicalIndex:
+    """In-process BM25 inverted index over chunk text, keyed by vector id"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, _Postings] = {}
+        self._lengths: Dict[int, int] = {}
+        self._deleted: set = set()
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: int, text: str) -> None:
+        if doc_id in self._lengths:
+            self.remove([doc_id])
+        if doc_id in self._deleted:
+            # Las postings antiguas del id deben desaparecer antes de reutilizarlo
+            self.compact()
+
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+            postings.ids.append(doc_id)
+            postings.tfs.append(tf)
+            postings.lengths.append(length)
+
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_ids: Iterable[int]) -> None:
+        """Marca los documentos como borrados; las postings se compactan en bloque"""
+        for doc_id in doc_ids:
+            length = self._lengths.pop(int(doc_id), None)
+            if length is not None:
+                self._total_length -= length
+                self._deleted.add(int(doc_id))
+
+        if len(self._deleted) > max(1000, len(self._lengths) // 5):
+            self.compact()
+
+    def compact(self) -> None:
+        if not self._deleted:
+            return
+        deleted = np.fromiter(self._deleted, dtype=np.int64)
+        for term in list(self._postings):
+            postings = self._postings[term]
+            ids = np.frombuffer(postings.ids, dtype=np.int64)
+            keep = ~np.isin(ids, deleted)
+            if keep.all():
+                continue
+            if not keep.any():
+                del self._postings[term]
+                continue
+            compacted = _Postings()
+            compacted.ids = array("q", ids[keep].tobytes())
+            compacted.tfs = array("I", np.frombuffer(postings.tfs, dtype=np.uint32)[keep].tobytes())
+            compacted.lengths = array("I", np.frombuffer(postings.lengths, dtype=np.uint32)[keep].tobytes())
+            self._postings[term] = compacted
+        self._deleted.clear()
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        id_filter: Optional[Callable[[np.ndarray], np.ndarray]] = None
+    ) -> List[Tuple[int, float]]:
+        """Top-k (vector id, BM25 score); id_filter returns a boolean mask over ids"""
+        n_docs = len(self._lengths)
+        if n_docs == 0 or k <= 0:
+            return []
+        avg_length = self._total_length / n_docs
+        deleted = np.fromiter(self._deleted, dtype=np.int64) if self._deleted else None
+
+        matched_ids = []
+        matched_scores = []
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            ids = np.frombuffer(postings.ids, dtype=np.int64)
+            tfs = np.frombuffer(postings.tfs, dtype=np.uint32).astype(np.float32)
+            lengths = np.frombuffer(postings.lengths, dtype=np.uint32).astype(np.float32)
+
+            mask = np.ones(len(ids), dtype=bool)
+            if deleted is not None:
+                mask &= ~np.isin(ids, deleted)
+            df = int(mask.sum())
+            if id_filter is not None:
+                mask &= id_filter(ids)
+            if not mask.any():
+                continue
+
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            tfs, lengths = tfs[mask], lengths[mask]
+            scores = idf * tfs * (self.k1 + 1) / (
+                tfs + self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            )
+            matched_ids.append(ids[mask])
+            matched_scores.append(scores)
+
+        if not matched_ids:
+            return []
+
+        unique_ids, inverse = np.unique(np.concatenate(matched_ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(matched_scores))
+        top = min(k, len(unique_ids))
+        best = np.argpartition(-totals, top - 1)[:top]
+        best = best[np.argsort(-totals[best])]
+        return [(int(unique_ids[i]), float(totals[i])) for i in best]
+
+def reciprocal_rank_fusion(
+    rankings: List[List[int]],
+    k: int = 60
+) -> List[Tuple[int, float]]:
+    """Fusiona rankings por RRF: score = sum(1 / (k + rank))"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
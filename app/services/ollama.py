@@ -1,31 +1,220 @@
+import asyncio
+import json
 import logging
-from typing import Optional, List, AsyncGenerator
+import time
+from typing import Optional, List, AsyncGenerator, Dict, Tuple, Iterable
 import httpx
 from httpx import Timeout
 
 from app.config import settings
-from app.exceptions import OllamaError
+from app.exceptions import OllamaError, OllamaUnavailableError
+from app.utils.metrics import OLLAMA_TTFT, OLLAMA_GENERATION, record_cache, track_queue
 
 logger = logging.getLogger(__name__)
 
-class OllamaService:
+def _model_tag(model: str) -> str:
+    """Normaliza nombres de modelo al formato de /api/ps (nombre:tag)"""
+    return model if ":" in model else f"{model}:latest"
+
+class OllamaBackend:
+    """Routing state for a single Ollama host"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+        self.retry_at = 0.0
+        self.loaded_models: set = set()
+
+    def is_available(self, now: float) -> bool:
+        # Un host marcado como caído vuelve a probarse tras el cooldown
+        return self.healthy or now >= self.retry_at
+
+    def __repr__(self):
+        return f"<OllamaBackend(url={self.url}, healthy={self.healthy}, outstanding={self.outstanding})>"
+
+class OllamaBackendPool:
+    """Health-aware routing across several Ollama hosts"""
+
+    def __init__(self, urls: Iterable[str]):
+        self.backends = [OllamaBackend(url) for url in urls]
+        if not self.backends:
+            raise ValueError("At least one Ollama backend is required")
+        self._client: Optional[httpx.AsyncClient] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+    def choose(self, model: str, exclude: Iterable[str] = ()) -> OllamaBackend:
+        """Least outstanding requests, penalising hosts that would have to load the model"""
+        now = time.monotonic()
+        tag = _model_tag(model)
+        candidates = [
+            backend for backend in self.backends
+            if backend.url not in exclude and backend.is_available(now)
+        ]
+        if not candidates:
+            raise OllamaUnavailableError("No healthy Ollama backend available")
+
+        def load(backend: OllamaBackend) -> Tuple[int, bool]:
+            cold = tag not in backend.loaded_models
+            return (
+                backend.outstanding + (settings.OLLAMA_COLD_MODEL_PENALTY if cold else 0),
+                not backend.healthy
+            )
+
+        return min(candidates, key=load)
+
+    def mark_success(self, backend: OllamaBackend, model: Optional[str] = None) -> None:
+        backend.failures = 0
+        backend.healthy = True
+        if model:
+            backend.loaded_models.add(_model_tag(model))
+
+    def mark_failure(self, backend: OllamaBackend) -> None:
+        backend.failures += 1
+        if backend.failures >= settings.OLLAMA_FAILURE_THRESHOLD:
+            if backend.healthy:
+                logger.warning(f"Marking Ollama backend {backend.url} as unhealthy")
+            backend.healthy = False
+            backend.retry_at = time.monotonic() + settings.OLLAMA_UNHEALTHY_COOLDOWN
+
+    async def refresh(self) -> None:
+        """Updates health and loaded models of every host from /api/ps"""
+        client = self._get_client()
+
+        async def probe(backend: OllamaBackend):
+            try:
+                response = await client.get(f"{backend.url}/api/ps")
+                response.raise_for_status()
+                backend.loaded_models = {
+                    m.get("name") or m.get("model")
+                    for m in response.json().get("models", [])
+                }
+                self.mark_success(backend)
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning(f"Ollama backend {backend.url} health check failed: {str(e)}")
+                self.mark_failure(backend)
+
+        await asyncio.gather(*(probe(backend) for backend in self.backends))
+
+    async def warm(self, model: str) -> None:
+        """Loads the model on healthy hosts that do not have it resident"""
+        client = self._get_client()
+        tag = _model_tag(model)
+
+        async def load(backend: OllamaBackend):
+            try:
+                # Un generate sin prompt solo carga el modelo en memoria
+                response = await client.post(
+                    f"{backend.url}/api/generate",
+                    json={"model": model, "keep_alive": settings.OLLAMA_KEEP_ALIVE}
+                )
+                response.raise_for_status()
+                backend.loaded_models.add(tag)
+            except httpx.HTTPError as e:
+                logger.warning(f"Could not warm {model} on {backend.url}: {str(e)}")
+
+        await asyncio.gather(*(
+            load(backend) for backend in self.backends
+            if backend.healthy and tag not in backend.loaded_models
+        ))
+
+    async def start(self) -> None:
+        if self._monitor is None:
+            self._monitor = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._monitor:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                if settings.OLLAMA_WARM_MODELS:
+                    await self.warm(settings.DEFAULT_MODEL)
+            except Exception as e:
+                logger.error(f"Ollama backend monitor error: {str(e)}")
+            await asyncio.sleep(settings.OLLAMA_HEALTH_INTERVAL)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=Timeout(settings.OLLAMA_HEALTH_TIMEOUT))
+        return self._client
+
+_backend_pool: Optional[OllamaBackendPool] = None
+
+def get_backend_pool() -> OllamaBackendPool:
+    """Pool compartido por el proceso, construido desde la configuración"""
+    global _backend_pool
+    if _backend_pool is None:
+        _backend_pool = OllamaBackendPool(settings.OLLAMA_BACKEND_URLS)
+        pool = _backend_pool
+        track_queue("ollama_outstanding", lambda: sum(b.outstanding for b in pool.backends))
+    return _backend_pool
+
+class SharedGeneration:
+    """Buffer of an in-flight generation that several requests can follow"""
+
     def __init__(self):
-        self.base_url = settings.OLLAMA_BASE_URL
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk: str) -> None:
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[Exception] = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """Replays the buffered chunks and then follows the live ones"""
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: position < len(self.chunks) or self.done
+                )
+                pending = self.chunks[position:]
+                done = self.done
+
+            position += len(pending)
+            for chunk in pending:
+                yield chunk
+
+            if done and position >= len(self.chunks):
+                if self.error:
+                    raise self.error
+                return
+
+class OllamaService:
+    # Generaciones en curso compartidas por todo el proceso, por (modelo, prompt)
+    _inflight: Dict[Tuple[str, str], SharedGeneration] = {}
+    track_queue("ollama_inflight", lambda: len(OllamaService._inflight))
+
+    def __init__(self, backends: Optional[List[str]] = None):
+        self.pool = OllamaBackendPool(backends) if backends else get_backend_pool()
         self.default_model = settings.DEFAULT_MODEL
         self.timeout = Timeout(settings.OLLAMA_TIMEOUT)
         self.client = httpx.AsyncClient(timeout=self.timeout)
+        self._tasks: set = set()
 
-    async def generate_response(
-        self,
-        prompt: str,
-        model: Optional[str] = None,
-        context: Optional[List[str]] = None,
-        stream: bool = False
-    ) -> AsyncGenerator[str, None]:
-        model = model or self.default_model
+    @staticmethod
+    def build_prompt(prompt: str, context: Optional[List[str]] = None) -> str:
         context_text = "\n\n".join(context) if context else ""
-        
-        full_prompt = f"""
+
+        return f"""
         Context information is below.
         ---------------------
         {context_text}
@@ -34,48 +223,135 @@ class OllamaService:
         Query: {prompt}
         Answer:
         """
-        
-        try:
-            if stream:
+
+    async def generate_response(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        context: Optional[List[str]] = None,
+        stream: bool = False
+    ) -> AsyncGenerator[str, None]:
+        model = model or self.default_model
+        full_prompt = self.build_prompt(prompt, context)
+
+        if not settings.OLLAMA_COALESCE_REQUESTS:
+            generation = self._start_generation(model, full_prompt, context)
+        else:
+            key = (model, full_prompt)
+            generation = self._inflight.get(key)
+            record_cache("ollama_singleflight", generation is not None)
+            if generation is None:
+                generation = self._start_generation(model, full_prompt, context, key)
+            else:
+                logger.debug(f"Joining in-flight generation for model {model}")
+
+        if stream:
+            async for chunk in generation.subscribe():
+                yield chunk
+        else:
+            parts = []
+            async for chunk in generation.subscribe():
+                parts.append(json.loads(chunk).get("response", ""))
+            yield "".join(parts)
+
+    def _start_generation(
+        self,
+        model: str,
+        full_prompt: str,
+        context: Optional[List[str]],
+        key: Optional[Tuple[str, str]] = None
+    ) -> SharedGeneration:
+        """Launches the upstream request as a task that outlives any single subscriber"""
+        generation = SharedGeneration()
+        if key is not None:
+            self._inflight[key] = generation
+
+        async def run():
+            started = time.perf_counter()
+            try:
+                async for chunk in self._stream_generate(model, full_prompt, context):
+                    if not generation.chunks:
+                        OLLAMA_TTFT.labels(model).observe(time.perf_counter() - started)
+                    await generation.publish(chunk)
+                await generation.finish()
+                OLLAMA_GENERATION.labels(model).observe(time.perf_counter() - started)
+            except Exception as e:
+                await generation.finish(e)
+            finally:
+                if key is not None and self._inflight.get(key) is generation:
+                    del self._inflight[key]
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return generation
+
+    async def _stream_generate(
+        self,
+        model: str,
+        full_prompt: str,
+        context: Optional[List[str]]
+    ) -> AsyncGenerator[str, None]:
+        """Streams raw JSON lines from Ollama's /api/generate, failing over between hosts"""
+        tried = set()
+        last_error: Optional[Exception] = None
+
+        for _ in range(settings.OLLAMA_MAX_ATTEMPTS):
+            try:
+                backend = self.pool.choose(model, exclude=tried)
+            except OllamaUnavailableError:
+                break
+            tried.add(backend.url)
+            started = False
+            backend.outstanding += 1
+
+            try:
                 async with self.client.stream(
                     "POST",
-                    f"{self.base_url}/api/generate",
+                    f"{backend.url}/api/generate",
                     json={
                         "model": model,
                         "prompt": full_prompt,
                         "stream": True,
-                        "context": context
+                        "context": context,
+                        "keep_alive": settings.OLLAMA_KEEP_ALIVE
                     }
                 ) as response:
                     response.raise_for_status()
                     async for chunk in response.aiter_lines():
                         if chunk.strip():
+                            started = True
                             yield chunk
-            else:
-                response = await self.client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": model,
-                        "prompt": full_prompt,
-                        "stream": False,
-                        "context": context
-                    }
-                )
-                response.raise_for_status()
-                data = response.json()
-                yield data.get("response", "")
-                
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Ollama API error: {str(e)}")
-            raise OllamaError(f"API request failed: {str(e)}")
-        except httpx.RequestError as e:
-            logger.error(f"Ollama connection error: {str(e)}")
-            raise OllamaError(f"Connection failed: {str(e)}")
-        except Exception as e:
-            logger.error(f"Unexpected Ollama error: {str(e)}")
-            raise OllamaError(f"Unexpected error: {str(e)}")
+                self.pool.mark_success(backend, model)
+                return
+
+            except httpx.HTTPStatusError as e:
+                # Solo los 5xx antes del primer token se reintentan en otro host
+                if e.response.status_code < 500 or started:
+                    logger.error(f"Ollama API error: {str(e)}")
+                    raise OllamaError(f"API request failed: {str(e)}")
+                self.pool.mark_failure(backend)
+                last_error = e
+            except httpx.RequestError as e:
+                self.pool.mark_failure(backend)
+                if started:
+                    logger.error(f"Ollama connection error: {str(e)}")
+                    raise OllamaError(f"Connection failed: {str(e)}")
+                last_error = e
+            except Exception as e:
+                logger.error(f"Unexpected Ollama error: {str(e)}")
+                raise OllamaError(f"Unexpected error: {str(e)}")
+            finally:
+                backend.outstanding -= 1
+
+            logger.warning(f"Ollama backend {backend.url} failed, retrying elsewhere: {str(last_error)}")
+
+        raise OllamaUnavailableError(f"No Ollama backend could serve the request: {str(last_error)}")
 
     async def close(self):
+        # Las generaciones lanzadas desde esta instancia pueden tener otros suscriptores
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
         await self.client.aclose()
 
     async def __aenter__(self):
@@ -87,4 +363,4 @@ class OllamaService:
 # Example usage:
 # async with OllamaService() as ollama:
 #     async for chunk in ollama.generate_response("Hello", stream=True):
-#         print(chunk)
\ No newline at end of file
+#         print(chunk)
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.utils.metrics import track_queue
+
+logger = logging.getLogger(__name__)
+
+class ProcessingQueue:
+    """In-process queue of documents to (re)process in the background"""
+
+    def __init__(self, workers: int, maxsize: int):
+        self.workers = workers
+        self.queue: asyncio.Queue[Tuple[int, int, bool, bool]] = asyncio.Queue(maxsize=maxsize)
+        self._tasks: List[asyncio.Task] = []
+
+    def enqueue(
+        self,
+        document_id: int,
+        user_id: int,
+        reprocess: bool = False,
+        force_extract: bool = False
+    ) -> bool:
+        """False when the queue is full; the caller reports it per item"""
+        try:
+            self.queue.put_nowait((document_id, user_id, reprocess, force_extract))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def enqueue_many(self, items: Iterable[Tuple[int, int]], reprocess: bool = False) -> List[bool]:
+        return [self.enqueue(document_id, user_id, reprocess) for document_id, user_id in items]
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker(), name=f"processing-{i}")
+                for i in range(self.workers)
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        # Import diferido: DocumentService encola trabajos aquí
+        from app.services.document import DocumentService
+
+        while True:
+            document_id, user_id, reprocess, force_extract = await self.queue.get()
+            try:
+                async with AsyncSessionLocal() as db:
+                    if reprocess:
+                        await DocumentService.reprocess_document(db, document_id, user_id, force_extract)
+                    else:
+                        await DocumentService.process_document(db, document_id, user_id)
+            except Exception as e:
+                logger.error(f"Background processing of document {document_id} failed: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+_processing_queue: Optional[ProcessingQueue] = None
+
+def get_processing_queue() -> ProcessingQueue:
+    global _processing_queue
+    if _processing_queue is None:
+        _processing_queue = ProcessingQueue(
+            settings.PROCESSING_WORKERS,
+            settings.PROCESSING_QUEUE_SIZE
+        )
+        queue = _processing_queue
+        track_queue("processing", queue.queue.qsize)
+    return _processing_queue
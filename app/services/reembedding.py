@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.database.mongodb import get_mongo_collection
+from app.services.vector_store import (
+    INDEX_STATE_ID, IndexGeneration, VectorStoreService, create_embedder, load_index_state
+)
+
+logger = logging.getLogger(__name__)
+
+# Nombre del pod en Kubernetes; los puntos romperían las rutas de campo de Mongo
+REPLICA_ID = socket.gethostname().replace(".", "_")
+
+def live_replicas(state: Dict) -> Dict[str, Dict]:
+    """Replicas that reported within REEMBED_REPLICA_TIMEOUT; silent ones are assumed gone"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.REEMBED_REPLICA_TIMEOUT)
+    return {
+        replica_id: replica
+        for replica_id, replica in (state.get("replicas") or {}).items()
+        if replica["seen_at"] > cutoff
+    }
+
+class ReembeddingJob:
+    """Re-embeds every stored chunk with a new model while search keeps using the old one.
+
+    The new vectors go to their own chunk field (embedding_g<generation>) and
+    their own FAISS index. Chunks stored while the job runs are written for
+    both generations, by every replica (see IndexStateWatcher). Progress is
+    checkpointed in MongoDB: a restarted job reloads the vectors already
+    computed and only encodes the rest. When every chunk is covered, search
+    switches to the new index in one assignment; the other replicas follow on
+    their next sync, and the old vectors are dropped once all of them have.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.status: Dict = {"state": "idle"}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @staticmethod
+    def _state_collection():
+        return get_mongo_collection(settings.MONGO_INDEX_STATE_COLLECTION)
+
+    @staticmethod
+    def _chunks():
+        return get_mongo_collection(settings.MONGO_VECTOR_COLLECTION)
+
+    async def start(self, model: Optional[str] = None) -> Dict:
+        """Starts (or resumes) re-embedding with `model`, EMBEDDING_MODEL by default"""
+        if self.running:
+            raise RuntimeError("A re-embedding job is already running")
+        model = model or settings.EMBEDDING_MODEL
+
+        state = await asyncio.to_thread(load_index_state)
+        active = state["active"]
+        if model == active["model"]:
+            raise ValueError(f"Stored vectors already use {model}")
+
+        building = state.get("building")
+        if not building or building["model"] != model:
+            # Otro modelo: se descarta el progreso anterior y empieza una generación nueva
+            if building:
+                await asyncio.to_thread(self._drop_field, building["field"])
+            generation = max(active["generation"], (building or {}).get("generation", 0)) + 1
+            building = {
+                "generation": generation,
+                "model": model,
+                "field": f"embedding_g{generation}",
+                "checkpoint": None,
+                "processed": 0,
+                "started_at": datetime.utcnow()
+            }
+            await asyncio.to_thread(self._save_state, {"active": active, "building": building})
+
+        self.status = {"state": "starting", "model": model, "generation": building["generation"]}
+        self._task = asyncio.create_task(self._run(building), name="reembedding")
+        return self.status
+
+    async def stop(self) -> None:
+        """Pauses the job; the checkpoint is kept and start() resumes from it"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, building: Dict) -> None:
+        service = None
+        try:
+            service = await asyncio.to_thread(VectorStoreService)
+            generation = service.building
+            # La instancia puede haber empezado ya la doble escritura de esta generación
+            if generation is None or generation.generation != building["generation"]:
+                embedder = await asyncio.to_thread(create_embedder, building["model"])
+                generation = service.new_generation(
+                    building["generation"], building["model"], building["field"], embedder=embedder
+                )
+                service.begin_build(generation)
+
+            self.status.update(state="loading", processed=building["processed"])
+            loaded = await self._load_existing(generation)
+            self.status.update(state="embedding", loaded=loaded)
+            await self._embed_remaining(generation, building)
+
+            await self._cutover(service, generation, building)
+            self.status["state"] = "done"
+            logger.info(f"Search now uses {generation.model} (generation {generation.generation})")
+        except asyncio.CancelledError:
+            if service:
+                service.abort_build()
+            self.status["state"] = "paused"
+            raise
+        except Exception as e:
+            if service:
+                service.abort_build()
+            self.status.update(state="failed", error=str(e))
+            logger.error(f"Re-embedding failed: {str(e)}")
+
+    async def _load_existing(self, generation: IndexGeneration, document_ids: Optional[List[str]] = None) -> int:
+        """Adds vectors computed before a restart (or dual-written) to the new index"""
+        query = {generation.field: {"$exists": True}}
+        if document_ids is not None:
+            query["document_id"] = {"$in": document_ids}
+        loaded, last_id = 0, None
+        while True:
+            batch = await asyncio.to_thread(
+                self._fetch, query, {"vector_id": 1, generation.field: 1}, last_id
+            )
+            if not batch:
+                return loaded
+            last_id = batch[-1]["_id"]
+            vectors = np.vstack([
+                np.frombuffer(chunk[generation.field], dtype=np.float16) for chunk in batch
+            ]).astype("float32")
+            ids = np.array([chunk["vector_id"] for chunk in batch], dtype=np.int64)
+            # remove_ids evita duplicados con lo ya añadido por la doble escritura
+            generation.index_id_map.remove_ids(ids)
+            generation.index_id_map.add_with_ids(vectors, ids)
+            loaded += len(batch)
+
+    async def _embed_remaining(self, generation: IndexGeneration, building: Dict) -> None:
+        budget = min(max(settings.REEMBED_CPU_BUDGET, 0.05), 1.0)
+        while True:
+            batch = await asyncio.to_thread(
+                self._fetch,
+                {generation.field: {"$exists": False}},
+                {"vector_id": 1, "chunk_text": 1},
+                building["checkpoint"]
+            )
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            vectors = await asyncio.to_thread(
+                generation.embedder.encode, [chunk["chunk_text"] for chunk in batch]
+            )
+            busy = time.perf_counter() - started
+
+            await asyncio.to_thread(self._store_batch, generation.field, batch, vectors)
+            # FAISS se modifica solo desde el event loop, como en create_and_store_embeddings
+            ids = np.array([chunk["vector_id"] for chunk in batch], dtype=np.int64)
+            generation.index_id_map.add_with_ids(vectors, ids)
+
+            building["checkpoint"] = batch[-1]["_id"]
+            building["processed"] += len(batch)
+            await asyncio.to_thread(self._save_checkpoint, building)
+            self.status["processed"] = building["processed"]
+
+            # Ciclo de trabajo: encode ocupa como mucho `budget` del tiempo real
+            await asyncio.sleep(busy * (1 - budget) / budget)
+
+    async def _cutover(self, service: VectorStoreService, generation: IndexGeneration, building: Dict) -> None:
+        # Las demás réplicas solo escriben ambos vectores desde que ven la generación
+        # en construcción: se espera a todas y se repasan los chunks que ingirieron antes
+        self.status["state"] = "waiting_for_replicas"
+        while not await asyncio.to_thread(self._replicas_building, generation.generation):
+            await asyncio.sleep(settings.REEMBED_SYNC_INTERVAL)
+        self.status["state"] = "embedding"
+        building["checkpoint"] = None
+        await self._embed_remaining(generation, building)
+
+        self.status["state"] = "switching"
+        previous = service.cutover()
+        active = {"generation": generation.generation, "model": generation.model, "field": generation.field}
+        # El campo anterior lo borra IndexStateWatcher cuando ninguna réplica lo usa
+        retired = {"generation": previous.generation, "field": previous.field}
+        await asyncio.to_thread(self._save_state, {"active": active, "building": None, "retired": retired})
+
+    def _replicas_building(self, generation: int) -> bool:
+        with self._state_collection() as collection:
+            state = collection.find_one({"_id": INDEX_STATE_ID}) or {}
+        # active None: la réplica aún no ha creado el índice y lo hará con el estado actual
+        return all(
+            replica_id == REPLICA_ID or replica["active"] is None or replica["building"] == generation
+            for replica_id, replica in live_replicas(state).items()
+        )
+
+    def _fetch(self, query: Dict, projection: Dict, after) -> List[Dict]:
+        if after is not None:
+            query = {**query, "_id": {"$gt": after}}
+        with self._chunks() as collection:
+            return list(
+                collection.find(query, projection)
+                .sort("_id", 1)
+                .limit(settings.REEMBED_BATCH_SIZE)
+            )
+
+    def _store_batch(self, field: str, batch: List[Dict], vectors: np.ndarray) -> None:
+        from bson import Binary
+
+        with self._chunks() as collection:
+            collection.bulk_write([
+                UpdateOne(
+                    {"_id": chunk["_id"]},
+                    {"$set": {field: Binary(vector.astype(np.float16).tobytes())}}
+                )
+                for chunk, vector in zip(batch, vectors)
+            ], ordered=False)
+
+    def _save_checkpoint(self, building: Dict) -> None:
+        with self._state_collection() as collection:
+            collection.update_one(
+                {"_id": INDEX_STATE_ID},
+                {"$set": {
+                    "building.checkpoint": building["checkpoint"],
+                    "building.processed": building["processed"],
+                    "building.updated_at": datetime.utcnow()
+                }}
+            )
+
+    def _save_state(self, state: Dict) -> None:
+        with self._state_collection() as collection:
+            collection.update_one({"_id": INDEX_STATE_ID}, {"$set": state}, upsert=True)
+
+    def _drop_field(self, field: str) -> None:
+        """Frees the vectors of a retired generation"""
+        with self._chunks() as collection:
+            collection.update_many({field: {"$exists": True}}, {"$unset": {field: ""}})
+
+class IndexStateWatcher:
+    """Keeps this replica's search index in step with vector_index_state.
+
+    The re-embedding job runs in one pod. Every replica polls the shared state:
+    it dual-writes while a generation is being built, rebuilds its index from
+    the new vectors after the cutover and reports which generations it uses,
+    so the old vectors are only dropped when no live replica searches them.
+    """
+
+    def __init__(self, job: ReembeddingJob):
+        self.job = job
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None and settings.REEMBED_SYNC_INTERVAL > 0:
+            self._task = asyncio.create_task(self._run(), name="index-state-watcher")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync_once()
+            except Exception as e:
+                logger.error(f"Index state sync failed: {str(e)}")
+            await asyncio.sleep(settings.REEMBED_SYNC_INTERVAL)
+
+    async def sync_once(self) -> None:
+        state = await asyncio.to_thread(load_index_state)
+        # Sin instancia este pod no escribe ni busca vectores; al crearla lee el estado
+        service = VectorStoreService._instance
+        if service is not None and not self.job.running:
+            await self._follow(service, state)
+
+        report = {
+            "active": service.active.generation if service else None,
+            "building": service.building.generation if service and service.building else None,
+            "seen_at": datetime.utcnow()
+        }
+        live = live_replicas(state)
+        gone = [replica_id for replica_id in state.get("replicas") or {} if replica_id not in live]
+        await asyncio.to_thread(self._report, report, [r for r in gone if r != REPLICA_ID])
+
+        retired = state.get("retired")
+        replicas = {**live, REPLICA_ID: report}
+        if retired and all(
+            replica["active"] in (None, state["active"]["generation"]) for replica in replicas.values()
+        ):
+            await asyncio.to_thread(self._retire, retired)
+
+    async def _follow(self, service: VectorStoreService, state: Dict) -> None:
+        active, building = state["active"], state.get("building")
+        if service.active.generation != active["generation"]:
+            await self._switch(service, active)
+        elif building and (service.building is None or service.building.generation != building["generation"]):
+            # Doble escritura: los chunks que ingiere este pod llevan también el vector nuevo
+            service.begin_build(await self._new_generation(service, building))
+            logger.info(f"Dual-writing embeddings for {building['model']} (generation {building['generation']})")
+        elif not building and service.building is not None:
+            service.abort_build()
+
+    async def _switch(self, service: VectorStoreService, active: Dict) -> None:
+        """Rebuilds this replica's index from the vectors of the new active generation"""
+        generation = service.building
+        if generation is None or generation.generation != active["generation"]:
+            generation = await self._new_generation(service, active)
+            service.begin_build(generation)
+        # Como generación en construcción recibe los chunks nuevos mientras se carga
+        await self.job._load_existing(generation, [str(d) for d in service.document_chunks])
+        service.cutover()
+        logger.info(f"Search now uses {generation.model} (generation {generation.generation})")
+
+    @staticmethod
+    async def _new_generation(service: VectorStoreService, spec: Dict) -> IndexGeneration:
+        embedder = await asyncio.to_thread(create_embedder, spec["model"])
+        return service.new_generation(spec["generation"], spec["model"], spec["field"], embedder=embedder)
+
+    def _report(self, report: Dict, gone: List[str]) -> None:
+        update = {"$set": {f"replicas.{REPLICA_ID}": report}}
+        if gone:
+            update["$unset"] = {f"replicas.{replica_id}": "" for replica_id in gone}
+        with self.job._state_collection() as collection:
+            collection.update_one({"_id": INDEX_STATE_ID}, update)
+
+    def _retire(self, retired: Dict) -> None:
+        """Drops the vectors of the previous generation; idempotent if several replicas race"""
+        self.job._drop_field(retired["field"])
+        with self.job._state_collection() as collection:
+            collection.update_one(
+                {"_id": INDEX_STATE_ID, "retired.field": retired["field"]},
+                {"$unset": {"retired": ""}}
+            )
+        logger.info(f"Dropped vectors of generation {retired['generation']}")
+
+_reembedding_job: Optional[ReembeddingJob] = None
+_index_state_watcher: Optional[IndexStateWatcher] = None
+
+def get_reembedding_job() -> ReembeddingJob:
+    global _reembedding_job
+    if _reembedding_job is None:
+        _reembedding_job = ReembeddingJob()
+    return _reembedding_job
+
+def get_index_state_watcher() -> IndexStateWatcher:
+    global _index_state_watcher
+    if _index_state_watcher is None:
+        _index_state_watcher = IndexStateWatcher(get_reembedding_job())
+    return _index_state_watcher
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.utils.metrics import track_queue
+
+logger = logging.getLogger(__name__)
+
+class RerankerService:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Initialize the re-ranker (singleton pattern); the model loads on first use"""
+        self.model = None
+        self._load_lock = threading.Lock()
+        # Un único hilo: el CPU del pod es limitado y las peticiones no deben encolarse
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self.pending = 0
+        track_queue("rerank", lambda: self.pending)
+
+    def _load_model(self):
+        with self._load_lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+
+                logger.info(f"Loading cross-encoder {settings.RERANK_MODEL}")
+                self.model = CrossEncoder(
+                    settings.RERANK_MODEL,
+                    max_length=settings.RERANK_MAX_LENGTH,
+                    device='cpu'
+                )
+        return self.model
+
+    def _score(self, query: str, texts: List[str]) -> np.ndarray:
+        """Scores every (query, chunk) pair in a single batched forward pass"""
+        model = self._load_model()
+        return np.asarray(model.predict(
+            [(query, text) for text in texts],
+            batch_size=len(texts),
+            show_progress_bar=False
+        ))
+
+    async def rerank(
+        self,
+        query: str,
+        chunks: List[Dict],
+        k: int,
+        budget_ms: Optional[int] = None
+    ) -> List[Dict]:
+        """Best k chunks by cross-encoder score, or the incoming order if over budget"""
+        if len(chunks) <= 1:
+            return chunks[:k]
+
+        budget_ms = budget_ms or settings.RERANK_TIMEOUT_MS
+        if self.pending:
+            logger.warning("Re-ranker busy, keeping retrieval order")
+            return chunks[:k]
+
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor,
+            self._score,
+            query,
+            [chunk['chunk_text'] for chunk in chunks]
+        )
+        future.add_done_callback(self._release)
+
+        try:
+            scores = await asyncio.wait_for(asyncio.shield(future), timeout=budget_ms / 1000)
+        except asyncio.TimeoutError:
+            logger.warning(f"Re-ranking exceeded {budget_ms}ms budget, keeping retrieval order")
+            return chunks[:k]
+        except Exception as e:
+            logger.error(f"Re-ranking failed: {str(e)}")
+            return chunks[:k]
+
+        order = np.argsort(-scores, kind="stable")[:k]
+        reranked = []
+        for i in order:
+            chunk = chunks[int(i)]
+            chunk['rerank_score'] = float(scores[i])
+            reranked.append(chunk)
+        return reranked
+
+    def _release(self, _future) -> None:
+        self.pending -= 1
@@ -0,0 +1,412 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+
+import httpx
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.document import Document
+
+logger = logging.getLogger(__name__)
+
+S3_SCHEME = "s3://"
+ZSTD_SUFFIX = ".zst"
+CHUNK_SIZE = 1024 * 1024
+
+def is_compressed(location: str) -> bool:
+    return location.endswith(ZSTD_SUFFIX)
+
+def logical_name(location: str) -> str:
+    """Nombre del original (sin .zst), del que se deriva el extractor"""
+    name = location.rsplit("/", 1)[-1]
+    return name[:-len(ZSTD_SUFFIX)] if is_compressed(name) else name
+
+def _compress_file(source: str, target: str) -> None:
+    import zstandard
+
+    compressor = zstandard.ZstdCompressor(level=settings.STORAGE_ZSTD_LEVEL)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        compressor.copy_stream(src, dst, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+def _decompress_file(source: str, target: str) -> None:
+    import zstandard
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        zstandard.ZstdDecompressor().copy_stream(src, dst, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+class LocalStorage:
+    """Files on the uploads volume; the location is the absolute path"""
+
+    async def put(self, source_path: str, name: str) -> str:
+        target = os.path.join(settings.UPLOAD_FOLDER, name)
+        await asyncio.to_thread(os.replace, source_path, target)
+        return target
+
+    async def stream(self, location: str) -> AsyncIterator[bytes]:
+        handle = await asyncio.to_thread(open, location, "rb")
+        try:
+            while chunk := await asyncio.to_thread(handle.read, CHUNK_SIZE):
+                yield chunk
+        finally:
+            handle.close()
+
+    async def download_to(self, location: str, target: str) -> None:
+        import shutil
+
+        await asyncio.to_thread(shutil.copyfile, location, target)
+
+    async def delete(self, location: str) -> None:
+        try:
+            await asyncio.to_thread(os.remove, location)
+        except FileNotFoundError:
+            pass
+
+class S3Storage:
+    """S3-compatible object store (AWS, MinIO) over httpx with SigV4 signing.
+
+    Path-style addressing; locations are s3://bucket/key. Payloads are sent
+    as UNSIGNED-PAYLOAD so files stream without a second hashing pass.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        prefix: str = "",
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=httpx.Timeout(60, connect=5)
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    def _split(self, location: str):
+        bucket, _, key = location[len(S3_SCHEME):].partition("/")
+        return bucket, key
+
+    def _signed_headers(self, method: str, url: httpx.URL, headers: Optional[dict] = None) -> dict:
+        now = datetime.utcnow()
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date = now.strftime("%Y%m%d")
+        payload_hash = "UNSIGNED-PAYLOAD"
+
+        signed = {k.lower(): str(v).strip() for k, v in (headers or {}).items()}
+        signed.update({
+            "host": url.netloc.decode(),
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": payload_hash,
+        })
+        signed_names = ";".join(sorted(signed))
+        canonical_request = "\n".join([
+            method,
+            url.raw_path.decode().split("?", 1)[0],
+            "",
+            "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+            signed_names,
+            payload_hash,
+        ])
+        scope = f"{date}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (date, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        signed["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_names}, Signature={signature}"
+        )
+        return signed
+
+    def _url(self, bucket: str, key: str) -> httpx.URL:
+        return httpx.URL(f"{self.endpoint}/{bucket}/{quote(key, safe='/-_.~')}")
+
+    async def put(self, source_path: str, name: str) -> str:
+        key = f"{self.prefix}{name}"
+        url = self._url(self.bucket, key)
+        size = await asyncio.to_thread(os.path.getsize, source_path)
+        headers = self._signed_headers("PUT", url, {"content-length": size})
+
+        async def body() -> AsyncIterator[bytes]:
+            async for chunk in LocalStorage().stream(source_path):
+                yield chunk
+
+        response = await self._get_client().put(url, content=body(), headers=headers)
+        response.raise_for_status()
+        return f"{S3_SCHEME}{self.bucket}/{key}"
+
+    async def stream(self, location: str) -> AsyncIterator[bytes]:
+        url = self._url(*self._split(location))
+        async with self._get_client().stream("GET", url, headers=self._signed_headers("GET", url)) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+
+    async def download_to(self, location: str, target: str) -> None:
+        handle = await asyncio.to_thread(open, target, "wb")
+        try:
+            async for chunk in self.stream(location):
+                await asyncio.to_thread(handle.write, chunk)
+        finally:
+            handle.close()
+
+    async def delete(self, location: str) -> None:
+        url = self._url(*self._split(location))
+        response = await self._get_client().delete(url, headers=self._signed_headers("DELETE", url))
+        if response.status_code != 404:
+            response.raise_for_status()
+
+class StorageService:
+    """Resolves a Document.file_path to its backend and hides compression.
+
+    Hot files are plain paths on the uploads volume. Cold files may be
+    zstd-compressed (suffix .zst) and/or live in S3 (s3://bucket/key).
+    """
+
+    def __init__(self, local: Optional[LocalStorage] = None, cold: Optional[S3Storage] = None):
+        self.local = local or LocalStorage()
+        self.cold = cold
+
+    def backend(self, location: str):
+        if location.startswith(S3_SCHEME):
+            if self.cold is None:
+                raise RuntimeError("S3 storage is not configured")
+            return self.cold
+        return self.local
+
+    def is_local_plain(self, location: str) -> bool:
+        return not location.startswith(S3_SCHEME) and not is_compressed(location)
+
+    @asynccontextmanager
+    async def local_path(self, location: str) -> AsyncIterator[str]:
+        """A local, uncompressed path for the duration of the block (for parsers)"""
+        if self.is_local_plain(location):
+            yield location
+            return
+
+        suffix = Path(logical_name(location)).suffix
+        fd, target = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        fetched = None
+        try:
+            source = location
+            if location.startswith(S3_SCHEME):
+                if is_compressed(location):
+                    fd, fetched = tempfile.mkstemp(suffix=ZSTD_SUFFIX)
+                    os.close(fd)
+                source = fetched or target
+                await self.cold.download_to(location, source)
+            if is_compressed(location):
+                await asyncio.to_thread(_decompress_file, source, target)
+            yield target
+        finally:
+            for path in (target, fetched):
+                if path:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    async def iter_content(self, location: str) -> AsyncIterator[bytes]:
+        """Original bytes, decompressed on the fly, without buffering the file"""
+        chunks = self.backend(location).stream(location)
+        if not is_compressed(location):
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        import zstandard
+
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        async for chunk in chunks:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+
+    async def delete(self, location: str) -> None:
+        await self.backend(location).delete(location)
+
+    async def archive(self, location: str) -> str:
+        """Copies a hot file to the cold tier and returns the copy's location.
+
+        The hot original is left in place: the caller deletes it only after
+        the new location has been committed.
+        """
+        if not self.is_local_plain(location):
+            return location
+
+        name = Path(location).name
+        compress = Path(name).suffix.lower()[1:] in settings.STORAGE_COMPRESS_EXTENSIONS
+        if not compress and self.cold is None:
+            # Tier frío local y formato binario (pdf, docx...): no hay nada que ganar
+            return location
+
+        source = location
+        try:
+            if compress:
+                source = f"{location}{ZSTD_SUFFIX}.{uuid.uuid4().hex[:8]}.tmp"
+                await asyncio.to_thread(_compress_file, location, source)
+                name = f"{name}{ZSTD_SUFFIX}"
+
+            if self.cold is not None:
+                return await self.cold.put(source, name)
+            return await self.local.put(source, name)
+        finally:
+            if source != location:
+                # Temporal comprimido: ya subido, movido con os.replace o fallido
+                await self.local.delete(source)
+
+    async def close(self) -> None:
+        if self.cold:
+            await self.cold.close()
+
+_storage: Optional[StorageService] = None
+
+def get_storage() -> StorageService:
+    global _storage
+    if _storage is None:
+        cold = None
+        if settings.STORAGE_COLD_BACKEND == "s3":
+            cold = S3Storage(
+                settings.S3_ENDPOINT_URL,
+                settings.S3_BUCKET,
+                settings.S3_ACCESS_KEY,
+                settings.S3_SECRET_KEY,
+                region=settings.S3_REGION,
+                prefix=settings.S3_PREFIX
+            )
+        _storage = StorageService(cold=cold)
+    return _storage
+
+class StorageTiering:
+    """Periodically moves documents older than STORAGE_COLD_AFTER_DAYS to the cold tier"""
+
+    def __init__(self, storage: StorageService, session_factory=AsyncSessionLocal):
+        self.storage = storage
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None and settings.STORAGE_TIERING_INTERVAL_HOURS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                moved = await self.run_once()
+                if moved:
+                    logger.info(f"Moved {moved} documents to cold storage")
+            except Exception as e:
+                logger.error(f"Storage tiering failed: {str(e)}")
+            await asyncio.sleep(settings.STORAGE_TIERING_INTERVAL_HOURS * 3600)
+
+    @staticmethod
+    def _is_hot():
+        return (
+            Document.file_path.notlike(f"{S3_SCHEME}%"),
+            Document.file_path.notlike(f"%{ZSTD_SUFFIX}")
+        )
+
+    async def run_once(self, batch_size: int = 100) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=settings.STORAGE_COLD_AFTER_DAYS)
+        moved, last_id = 0, 0
+        while True:
+            async with self.session_factory() as db:
+                document_ids = (await db.execute(
+                    select(Document.id)
+                    .where(Document.id > last_id, Document.created_at < cutoff, *self._is_hot())
+                    .order_by(Document.id)
+                    .limit(batch_size)
+                )).scalars().all()
+            if not document_ids:
+                return moved
+
+            last_id = document_ids[-1]
+            for document_id in document_ids:
+                if await self.archive_document(document_id):
+                    moved += 1
+            if len(document_ids) < batch_size:
+                return moved
+
+    async def archive_document(self, document_id: int) -> bool:
+        """Archives one document: copy, commit the new location, then delete the hot original.
+
+        A failure at any step leaves the row pointing at the hot original,
+        which still exists; the partial cold copy is removed.
+        """
+        location = new_location = None
+        async with self.session_factory() as db:
+            try:
+                # SKIP LOCKED: varias réplicas pueden ejecutar el tiering sin pisarse;
+                # el bloqueo cubre un único documento
+                location = (await db.execute(
+                    select(Document.file_path)
+                    .where(Document.id == document_id, *self._is_hot())
+                    .with_for_update(skip_locked=True)
+                )).scalar()
+                if location is None:
+                    return False
+                new_location = await self.storage.archive(location)
+                if new_location == location:
+                    return False
+                await db.execute(
+                    update(Document)
+                    .where(Document.id == document_id)
+                    .values(file_path=new_location)
+                )
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Archiving document {document_id} ({location}) failed: {str(e)}")
+                if new_location and new_location != location:
+                    try:
+                        await self.storage.delete(new_location)
+                    except Exception as cleanup_error:
+                        logger.warning(f"Could not delete cold copy {new_location}: {str(cleanup_error)}")
+                return False
+
+        await self.storage.local.delete(location)
+        return True
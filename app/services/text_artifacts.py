@@ -0,0 +1,151 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import uuid
+from typing import Iterable, Iterator, List, Optional, Union
+
+from app.config import settings
+from app.utils.file_processing import EXTRACTOR_VERSION, ExtractedText, FileProcessor
+from app.utils.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+class StoredText:
+    """Extracted text backed by an artifact file and read back one segment at a time"""
+
+    def __init__(self, path: str, page_offsets: List[int]):
+        self.path = path
+        self.page_offsets = page_offsets
+
+    def segments(self) -> Iterator[str]:
+        return TextArtifactService._segments(self.path)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.segments())
+
+class TextArtifactService:
+    """Extracted text cached on the shared volume as zstd-compressed JSON.
+
+    Artifacts are keyed by file checksum and EXTRACTOR_VERSION, so re-chunking
+    or re-embedding a document skips PDF parsing and OCR, and identical files
+    uploaded by different users share one artifact.
+
+    An artifact is a zstd stream of JSON lines: a header with the page
+    offsets, then one line per segment. Streamed formats are written and read
+    back segment by segment, so their text is never held whole in memory.
+    """
+
+    @staticmethod
+    def _path(checksum: str, version: int = EXTRACTOR_VERSION) -> str:
+        return os.path.join(settings.ARTIFACT_FOLDER, f"{checksum}.v{version}.json.zst")
+
+    @staticmethod
+    def _read(path: str) -> Optional[StoredText]:
+        """Reads only the header; the segments are decompressed as they are consumed"""
+        import zstandard
+
+        try:
+            with open(path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                header = json.loads(io.TextIOWrapper(reader, encoding="utf-8").readline())
+        except FileNotFoundError:
+            return None
+        return StoredText(path, header["page_offsets"])
+
+    @staticmethod
+    def _segments(path: str) -> Iterator[str]:
+        import zstandard
+
+        with open(path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            lines = io.TextIOWrapper(reader, encoding="utf-8")
+            next(lines)
+            for line in lines:
+                yield json.loads(line)
+
+    @staticmethod
+    def _write(path: str, segments: Iterable[str], page_offsets: List[int]) -> None:
+        import zstandard
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: otra réplica puede estar leyendo el mismo artefacto
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            compressor = zstandard.ZstdCompressor(level=settings.STORAGE_ZSTD_LEVEL)
+            with open(tmp_path, "wb") as f, compressor.stream_writer(f) as writer:
+                writer.write(json.dumps({"page_offsets": page_offsets}).encode() + b"\n")
+                for segment in segments:
+                    writer.write(json.dumps(segment, ensure_ascii=False).encode() + b"\n")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    async def load(checksum: str) -> Optional[StoredText]:
+        try:
+            extracted = await asyncio.to_thread(TextArtifactService._read, TextArtifactService._path(checksum))
+        except Exception as e:
+            # Artefacto corrupto: se trata como fallo de caché y se regenera
+            logger.warning(f"Unreadable text artifact for {checksum}: {str(e)}")
+            extracted = None
+        record_cache("text_artifact", extracted is not None)
+        return extracted
+
+    @staticmethod
+    async def save(checksum: str, extracted: ExtractedText) -> None:
+        try:
+            await asyncio.to_thread(
+                TextArtifactService._write,
+                TextArtifactService._path(checksum),
+                extracted.segments(),
+                extracted.page_offsets
+            )
+        except Exception as e:
+            # El artefacto es solo una caché: el procesado sigue aunque no se pueda guardar
+            logger.warning(f"Could not store text artifact for {checksum}: {str(e)}")
+
+    @staticmethod
+    async def get_text(
+        file_path: str,
+        checksum: Optional[str],
+        force: bool = False
+    ) -> Union[ExtractedText, StoredText]:
+        """Cached extraction of a stored file; `force` re-runs the extractor and replaces the artifact.
+
+        Consumers should iterate segments(): for streamed formats the result
+        is read back from the artifact instead of being held in memory.
+        """
+        if checksum and not force:
+            stored = await TextArtifactService.load(checksum)
+            if stored is not None:
+                return stored
+
+        if checksum and FileProcessor.is_streamed(file_path):
+            # El artefacto hace de búfer en disco entre el extractor y el chunker
+            path = TextArtifactService._path(checksum)
+            await FileProcessor.stream_segments(
+                file_path, lambda segments: TextArtifactService._write(path, segments, [0])
+            )
+            return StoredText(path, [0])
+
+        # Sin checksum (documentos anteriores a su cálculo) el texto se extrae en memoria
+        extracted = await FileProcessor.extract_document(file_path)
+        if checksum:
+            await TextArtifactService.save(checksum, extracted)
+        return extracted
+
+    @staticmethod
+    async def delete(checksums: Iterable[str]) -> None:
+        """Removes the artifacts of every extractor version for these checksums"""
+        def remove():
+            for checksum in checksums:
+                for version in range(1, EXTRACTOR_VERSION + 1):
+                    try:
+                        os.remove(TextArtifactService._path(checksum, version))
+                    except FileNotFoundError:
+                        pass
+
+        await asyncio.to_thread(remove)
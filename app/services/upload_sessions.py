@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Tuple
+
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.mongodb import get_mongo_collection
+from app.schemas.document import UploadResult, UploadSessionCreate, UploadSessionStatus
+from app.services.document import DocumentService
+from app.utils.uploads import (
+    MAGIC_HEAD_BYTES, StreamedFile, merge_ranges, missing_ranges, remove_files, validate_file_type
+)
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def _not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Upload session not found"
+    )
+
+class UploadSessionService:
+    """Resumable uploads: a preallocated file filled by byte ranges, in any order.
+
+    Session state lives in MongoDB so any replica sharing the upload volume can
+    accept parts. Ranges are appended with $push, which keeps concurrent parts
+    race-free; they are merged when read.
+    """
+
+    _indexes_ready = False
+    _last_cleanup = 0.0
+
+    @staticmethod
+    def _collection():
+        return get_mongo_collection(settings.MONGO_UPLOAD_COLLECTION)
+
+    @classmethod
+    def _ensure_indexes(cls) -> None:
+        if not cls._indexes_ready:
+            with cls._collection() as collection:
+                # TTL: Mongo borra las sesiones abandonadas
+                collection.create_index("expires_at", expireAfterSeconds=0)
+                collection.create_index("user_id")
+            cls._indexes_ready = True
+
+    @staticmethod
+    def _status(session: dict) -> UploadSessionStatus:
+        merged = merge_ranges(session.get("ranges", []))
+        missing = missing_ranges(merged, session["size"])
+        return UploadSessionStatus(
+            id=session["_id"],
+            filename=session["filename"],
+            size=session["size"],
+            received_bytes=sum(end - start for start, end in merged),
+            # Rangos inclusivos, como en Content-Range
+            missing=[(start, end - 1) for start, end in missing],
+            complete=not missing,
+            expires_at=session["expires_at"]
+        )
+
+    @staticmethod
+    async def _get(session_id: str, user_id: int) -> dict:
+        def find():
+            with UploadSessionService._collection() as collection:
+                return collection.find_one({"_id": session_id, "user_id": user_id})
+
+        session = await asyncio.to_thread(find)
+        if session is None:
+            raise _not_found()
+        return session
+
+    @staticmethod
+    async def create_session(user_id: int, data: UploadSessionCreate) -> UploadSessionStatus:
+        if data.size > settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File size exceeds {settings.MAX_UPLOAD_SIZE_MB}MB limit"
+            )
+        extension = Path(data.filename).suffix.lower()[1:]
+        if extension not in settings.ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"File type not allowed: {extension}"
+            )
+
+        session_id = uuid.uuid4().hex
+        path = os.path.join(settings.UPLOAD_FOLDER, f"{session_id}.{extension}.part")
+        session = {
+            "_id": session_id,
+            "user_id": user_id,
+            "filename": os.path.basename(data.filename),
+            "size": data.size,
+            "sha256": data.sha256,
+            "path": path,
+            "ranges": [],
+            "created_at": datetime.utcnow(),
+            "expires_at": datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+        }
+
+        def prepare():
+            UploadSessionService._ensure_indexes()
+            UploadSessionService._cleanup_stale_parts()
+            Path(settings.UPLOAD_FOLDER).mkdir(parents=True, exist_ok=True)
+            _preallocate(path, data.size)
+            with UploadSessionService._collection() as collection:
+                collection.insert_one(session)
+
+        await asyncio.to_thread(prepare)
+        return UploadSessionService._status(session)
+
+    @staticmethod
+    async def get_status(session_id: str, user_id: int) -> UploadSessionStatus:
+        return UploadSessionService._status(await UploadSessionService._get(session_id, user_id))
+
+    @staticmethod
+    async def write_range(
+        session_id: str,
+        user_id: int,
+        start: int,
+        end: int,
+        total: int,
+        body: AsyncIterator[bytes]
+    ) -> UploadSessionStatus:
+        """Writes body at [start, end) of the session file; the range only counts if complete"""
+        session = await UploadSessionService._get(session_id, user_id)
+        if total != session["size"]:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail=f"Content-Range total must be {session['size']}"
+            )
+
+        fd = await asyncio.to_thread(os.open, session["path"], os.O_WRONLY)
+        offset = start
+        try:
+            async for chunk in body:
+                if offset + len(chunk) > end:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Body is longer than Content-Range"
+                    )
+                await asyncio.to_thread(os.pwrite, fd, chunk, offset)
+                offset += len(chunk)
+        finally:
+            await asyncio.to_thread(os.close, fd)
+
+        if offset != end:
+            # Parte incompleta (p. ej. conexión cortada): no se registra, el cliente la reenvía
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Received {offset - start} of {end - start} bytes"
+            )
+
+        def record():
+            with UploadSessionService._collection() as collection:
+                return collection.find_one_and_update(
+                    {"_id": session_id},
+                    {"$push": {"ranges": [start, end]}},
+                    return_document=ReturnDocument.AFTER
+                )
+
+        session = await asyncio.to_thread(record)
+        if session is None:
+            raise _not_found()
+        return UploadSessionService._status(session)
+
+    @staticmethod
+    async def finalize(db: AsyncSession, session_id: str, user_id: int) -> UploadResult:
+        session = await UploadSessionService._get(session_id, user_id)
+        upload = UploadSessionService._status(session)
+        if not upload.complete:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload incomplete, missing ranges: {upload.missing}"
+            )
+
+        checksum, head = await asyncio.to_thread(_hash_file, session["path"])
+        if session.get("sha256") and session["sha256"].lower() != checksum:
+            await UploadSessionService.abort(session_id, user_id)
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Checksum mismatch, upload discarded"
+            )
+
+        final_path = session["path"][:-len(".part")]
+        await asyncio.to_thread(os.replace, session["path"], final_path)
+        file = StreamedFile(
+            filename=session["filename"],
+            path=final_path,
+            size=session["size"],
+            checksum=checksum
+        )
+        await validate_file_type(file, head)
+        if file.error:
+            await remove_files([file])
+
+        result = await DocumentService.create_documents(db, user_id, [file])
+        await asyncio.to_thread(UploadSessionService._delete_session, session_id)
+        return result.results[0]
+
+    @staticmethod
+    async def abort(session_id: str, user_id: int) -> None:
+        session = await UploadSessionService._get(session_id, user_id)
+        await remove_files([StreamedFile(filename=session["filename"], path=session["path"])])
+        await asyncio.to_thread(UploadSessionService._delete_session, session_id)
+
+    @staticmethod
+    def _delete_session(session_id: str) -> None:
+        with UploadSessionService._collection() as collection:
+            collection.delete_one({"_id": session_id})
+
+    @classmethod
+    def _cleanup_stale_parts(cls) -> None:
+        """Removes .part files older than the session TTL, at most once an hour"""
+        now = time.time()
+        if now - cls._last_cleanup < 3600:
+            return
+        cls._last_cleanup = now
+        max_age = settings.UPLOAD_SESSION_TTL_HOURS * 3600
+        for path in Path(settings.UPLOAD_FOLDER).glob("*.part"):
+            try:
+                if now - path.stat().st_mtime > max_age:
+                    path.unlink()
+            except OSError as e:
+                logger.warning(f"Could not delete stale upload {path}: {str(e)}")
+
+def _preallocate(path: str, size: int) -> None:
+    with open(path, "wb") as f:
+        if size and hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(f.fileno(), 0, size)
+        else:
+            f.truncate(size)
+
+def _hash_file(path: str) -> Tuple[str, bytes]:
+    hasher = hashlib.sha256()
+    head = b""
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            if not head:
+                head = block[:MAGIC_HEAD_BYTES]
+            hasher.update(block)
+    return hasher.hexdigest(), head
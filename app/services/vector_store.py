@@ -1,149 +1,408 @@
 import logging
+import threading
 import numpy as np
-import faiss
-from typing import List, Dict, Optional
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from sentence_transformers import SentenceTransformer
-from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, List, Dict, Optional, Iterable, Union
+from bson import Binary
+from pymongo import ReturnDocument
 
 from app.config import settings
 from app.database.mongodb import get_mongo_collection
 from app.exceptions import VectorStoreError
+from app.services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from app.services.reranker import RerankerService
+from app.services.embeddings import create_embedder
+from app.utils.metrics import observe_stage
 
 logger = logging.getLogger(__name__)
 
+# Los ids de FAISS codifican (documento, chunk) para que no colisionen entre documentos
+CHUNK_ID_BITS = 20
+CHUNK_ID_MASK = (1 << CHUNK_ID_BITS) - 1
+
+def make_vector_id(document_id: int, chunk_index: int) -> int:
+    return (int(document_id) << CHUNK_ID_BITS) | chunk_index
+
+def vector_id_document(vector_id: int) -> int:
+    return int(vector_id) >> CHUNK_ID_BITS
+
+# Documento de estado con la generación activa del índice (modelo y campo de Mongo)
+INDEX_STATE_ID = "embeddings"
+
+def load_index_state() -> Dict:
+    """Active generation; the first call records EMBEDDING_MODEL as the model of the stored vectors"""
+    with get_mongo_collection(settings.MONGO_INDEX_STATE_COLLECTION) as collection:
+        return collection.find_one_and_update(
+            {"_id": INDEX_STATE_ID},
+            {"$setOnInsert": {"active": {
+                "generation": 0,
+                "model": settings.EMBEDDING_MODEL,
+                "field": "embedding"
+            }}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+@dataclass
+class IndexGeneration:
+    """An embedding model with its FAISS index and the chunk field holding its vectors"""
+    generation: int
+    model: str
+    field: str
+    embedder: Any
+    index_id_map: Any
+
+    @property
+    def dimension(self) -> int:
+        return self.embedder.dimension
+
 class VectorStoreService:
     _instance = None
+    # El warm-up de arranque puede crear la instancia desde otro hilo
+    _instance_lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialize()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._initialize()
+                    cls._instance = instance
         return cls._instance
 
     def _initialize(self):
         """Initialize the vector store service (singleton pattern)"""
+        # faiss y el modelo de embeddings se cargan aquí, no al importar el módulo
+        import faiss
+
         logger.info("Initializing VectorStoreService")
-        
-        # Initialize embeddings model
-        self.embedding_model = SentenceTransformer(
-            settings.EMBEDDING_MODEL,
-            device='cpu'
-        )
-        self.embedding_size = self.embedding_model.get_sentence_embedding_dimension()
-        
-        # Initialize FAISS index
-        self.index = faiss.IndexFlatL2(self.embedding_size)
-        self.index_id_map = faiss.IndexIDMap(self.index)
+
+        # El modelo activo es el de los vectores guardados, no el de la configuración
+        try:
+            state = load_index_state()
+        except Exception as e:
+            logger.warning(f"Could not read vector index state: {str(e)}")
+            state = {"active": {"generation": 0, "model": settings.EMBEDDING_MODEL, "field": "embedding"}}
+        active, building = state["active"], state.get("building")
+        if active["model"] != settings.EMBEDDING_MODEL:
+            logger.warning(
+                f"EMBEDDING_MODEL is {settings.EMBEDDING_MODEL} but stored vectors use "
+                f"{active['model']}; run the re-embedding job to switch"
+            )
+
+        # Initialize embeddings model and FAISS index (inner product over normalized vectors = cosine)
+        self.active = self.new_generation(active["generation"], active["model"], active["field"])
+        # Índice en construcción durante un re-embedding; recibe también los chunks nuevos.
+        # Si el job corre en otro pod, este escribe ambos vectores desde el principio
+        self.building: Optional[IndexGeneration] = None
+        if building:
+            self.building = self.new_generation(building["generation"], building["model"], building["field"])
+
+        # BM25 index over chunk text for exact matches (codes, names)
+        self.lexical_index = LexicalIndex(k1=settings.BM25_K1, b=settings.BM25_B)
+
+        # Chunks per indexed document, used to build FAISS id selectors
+        self.document_chunks: Dict[int, int] = {}
         
         # MongoDB collection for metadata
         self.collection_name = settings.MONGO_VECTOR_COLLECTION
+        try:
+            with get_mongo_collection(self.collection_name) as collection:
+                collection.create_index("vector_id")
+                collection.create_index("document_id")
+        except Exception as e:
+            logger.warning(f"Could not ensure vector collection indexes: {str(e)}")
 
     async def create_and_store_embeddings(
         self,
         document_id: str,
-        text: str,
+        text: Union[str, Iterable[str]],
         metadata: Dict
     ) -> int:
-        """Process text and store embeddings with metadata"""
+        """Process text and store embeddings with metadata.
+
+        `text` may also be an iterable of segments (see TextArtifactService):
+        chunks are embedded and stored in batches as the segments arrive, so a
+        large extraction is never held in memory as a whole.
+        """
+        segments = [text] if isinstance(text, str) else text
+        # Generate embeddings for the index being built as well during a re-embedding
+        generations = [g for g in (self.active, self.building) if g is not None]
+        batch_size = max(settings.EMBEDDING_BATCH_SIZE, 1) * 8
+        chunk_ids: List[int] = []
+        stored = 0
         try:
-            # Chunk the text
-            chunks = self._chunk_text(text)
-            
-            # Generate embeddings
-            embeddings = self.embedding_model.encode(
-                chunks,
-                show_progress_bar=False,
-                convert_to_numpy=True
-            ).astype('float32')
-            
-            # Prepare documents for MongoDB
-            operations = []
-            chunk_ids = []
-            
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                chunk_id = f"{document_id}_{i}"
-                chunk_ids.append(chunk_id)
-                
-                operations.append({
-                    'chunk_id': chunk_id,
-                    'document_id': document_id,
-                    'chunk_text': chunk,
-                    'embedding': embedding.tolist(),
-                    'metadata': metadata,
-                    'chunk_index': i
-                })
-            
-            # Store in MongoDB and FAISS
-            with get_mongo_collection(self.collection_name) as collection:
-                # Add to FAISS index
-                ids = np.array([i for i in range(len(chunk_ids))])
-                self.index_id_map.add_with_ids(embeddings, ids)
-                
-                # Insert into MongoDB
-                result = collection.insert_many(operations)
-                logger.info(f"Stored {len(result.inserted_ids)} chunks for document {document_id}")
-                
-                return len(result.inserted_ids)
-                
+            pending: List[str] = []
+            for segment in segments:
+                with observe_stage("chunk"):
+                    pending += self._chunk_text(segment)
+                while len(pending) >= batch_size:
+                    stored += self._store_chunks(document_id, pending[:batch_size], chunk_ids, generations, metadata)
+                    del pending[:batch_size]
+            if pending:
+                stored += self._store_chunks(document_id, pending, chunk_ids, generations, metadata)
+
+            # Solo ahora el documento entra en los selectores de búsqueda
+            self.document_chunks[int(document_id)] = len(chunk_ids)
+            logger.info(f"Stored {stored} chunks for document {document_id}")
+            return stored
+
         except Exception as e:
             logger.error(f"Error storing embeddings: {str(e)}")
+            self._discard_chunks(document_id, chunk_ids, generations)
             raise VectorStoreError(f"Failed to store embeddings: {str(e)}")
 
+    def _store_chunks(
+        self,
+        document_id: str,
+        chunks: List[str],
+        chunk_ids: List[int],
+        generations: List[IndexGeneration],
+        metadata: Dict
+    ) -> int:
+        """Embeds one batch and adds it to FAISS, BM25 and MongoDB; appends its ids to chunk_ids"""
+        start = len(chunk_ids)
+        if start + len(chunks) > CHUNK_ID_MASK:
+            raise VectorStoreError(f"Document {document_id} has too many chunks (over {CHUNK_ID_MASK})")
+
+        with observe_stage("embed"):
+            embeddings = [g.embedder.encode(chunks) for g in generations]
+
+        # Prepare documents for MongoDB
+        batch_ids = [make_vector_id(document_id, start + i) for i in range(len(chunks))]
+        operations = [
+            {
+                'chunk_id': f"{document_id}_{start + i}",
+                'vector_id': batch_ids[i],
+                'document_id': document_id,
+                'chunk_text': chunk,
+                'metadata': metadata,
+                'chunk_index': start + i,
+                **{
+                    g.field: Binary(vectors[i].astype(np.float16).tobytes())
+                    for g, vectors in zip(generations, embeddings)
+                }
+            }
+            for i, chunk in enumerate(chunks)
+        ]
+
+        # Store in MongoDB and FAISS
+        with get_mongo_collection(self.collection_name) as collection:
+            # Antes de añadir: si algo falla, _discard_chunks los quita de todas partes
+            chunk_ids.extend(batch_ids)
+            ids = np.array(batch_ids, dtype=np.int64)
+            with observe_stage("faiss_add"):
+                for g, vectors in zip(generations, embeddings):
+                    g.index_id_map.add_with_ids(vectors, ids)
+            with observe_stage("lexical_add"):
+                for vector_id, chunk in zip(batch_ids, chunks):
+                    self.lexical_index.add(vector_id, chunk)
+
+            with observe_stage("mongo_insert"):
+                result = collection.insert_many(operations)
+            return len(result.inserted_ids)
+
+    def _discard_chunks(
+        self,
+        document_id: str,
+        chunk_ids: List[int],
+        generations: List[IndexGeneration]
+    ) -> None:
+        """Removes the batches already stored by a failed create_and_store_embeddings"""
+        if not chunk_ids:
+            return
+        try:
+            ids = np.array(chunk_ids, dtype=np.int64)
+            for g in generations:
+                g.index_id_map.remove_ids(ids)
+            self.lexical_index.remove(chunk_ids)
+            with get_mongo_collection(self.collection_name) as collection:
+                collection.delete_many({"document_id": document_id, "vector_id": {"$in": chunk_ids}})
+        except Exception as e:
+            logger.error(f"Could not discard partial embeddings of document {document_id}: {str(e)}")
+
     async def search_similar_chunks(
         self,
         document_id: str,
         query: str,
         k: int = 5
     ) -> List[Dict]:
-        """Search for similar text chunks"""
+        """Search for similar text chunks within one document"""
+        return await self.search_chunks(query, [int(document_id)], k)
+
+    async def search_chunks(
+        self,
+        query: str,
+        document_ids: Iterable[int],
+        k: int = 5,
+        rerank: Optional[bool] = None
+    ) -> List[Dict]:
+        """Search chunks of the given documents, fusing dense and BM25 rankings"""
+        rerank = settings.RERANK_ENABLED if rerank is None else rerank
         try:
+            targets = np.array(
+                [d for d in set(document_ids) if d in self.document_chunks],
+                dtype=np.int64
+            )
+            if len(targets) == 0:
+                return []
+            # Con re-ranking se sobre-recuperan candidatos y el cross-encoder elige los k
+            keep = max(k, settings.RERANK_CANDIDATES) if rerank else k
+            candidates = max(keep, settings.HYBRID_CANDIDATES)
+
             # Embed the query
-            query_embedding = self.embedding_model.encode(
-                query,
-                show_progress_bar=False
-            ).astype('float32').reshape(1, -1)
-            
-            # Search in FAISS
-            distances, indices = self.index_id_map.search(query_embedding, k)
+            # Una sola referencia: un cambio de generación no mezcla modelo e índice
+            active = self.active
+            with observe_stage("embed_query"):
+                query_embedding = active.embedder.encode([query])
             
+            import faiss
+
+            # Search in FAISS restricted to the allowed documents
+            params = faiss.SearchParameters(sel=self._document_selector(targets))
+            with observe_stage("search_dense"):
+                similarities, indices = active.index_id_map.search(
+                    query_embedding,
+                    candidates,
+                    params=params
+                )
+            # Los resultados ya vienen ordenados; se descartan los que no llegan al umbral
+            dense = {
+                int(vector_id): min(float(similarity), 1.0)
+                for vector_id, similarity in zip(indices[0], similarities[0])
+                if vector_id != -1 and similarity >= settings.MIN_SIMILARITY_SCORE
+            }
+            rankings = [list(dense)]
+
+            if settings.HYBRID_SEARCH_ENABLED:
+                with observe_stage("search_lexical"):
+                    lexical = self.lexical_index.search(
+                        query,
+                        candidates,
+                        id_filter=lambda ids: np.isin(ids >> CHUNK_ID_BITS, targets)
+                    )
+                rankings.append([vector_id for vector_id, _ in lexical])
+
+            fused = reciprocal_rank_fusion(rankings, k=settings.RRF_K)[:keep]
+            if not fused:
+                return []
+
             # Get chunks from MongoDB
-            with get_mongo_collection(self.collection_name) as collection:
-                chunks = list(collection.find({
-                    "document_id": document_id,
-                    "chunk_index": {"$in": [int(i) for i in indices[0]]}
-                }).sort("chunk_index", 1))
-                
-                # Add similarity scores
-                for chunk, distance in zip(chunks, distances[0]):
-                    chunk['similarity_score'] = 1 / (1 + distance)
+            with get_mongo_collection(self.collection_name) as collection, observe_stage("search_fetch"):
+                found = {
+                    chunk['vector_id']: chunk
+                    for chunk in collection.find({
+                        "vector_id": {"$in": [vector_id for vector_id, _ in fused]}
+                    })
+                }
                 
-                return chunks
+                # Keep fused order and add scores
+                chunks = []
+                for vector_id, rrf_score in fused:
+                    chunk = found.get(vector_id)
+                    if chunk is None:
+                        continue
+                    # Similitud coseno; None para aciertos solo léxicos
+                    chunk['similarity_score'] = dense.get(vector_id)
+                    chunk['rrf_score'] = rrf_score
+                    chunks.append(chunk)
+
+            if rerank:
+                with observe_stage("rerank"):
+                    return await RerankerService().rerank(query, chunks, k)
+            return chunks
                 
         except Exception as e:
             logger.error(f"Error searching chunks: {str(e)}")
             raise VectorStoreError(f"Search failed: {str(e)}")
 
+    def new_generation(self, generation: int, model: str, field: str, embedder=None) -> IndexGeneration:
+        """Empty FAISS index for `model`; vectors are added by the caller"""
+        import faiss
+
+        embedder = embedder or create_embedder(model_name=model)
+        return IndexGeneration(
+            generation=generation,
+            model=model,
+            field=field,
+            embedder=embedder,
+            index_id_map=faiss.IndexIDMap(self._build_index(embedder.dimension))
+        )
+
+    def begin_build(self, generation: IndexGeneration) -> None:
+        """From now on new chunks are embedded for both the active and the new generation"""
+        self.building = generation
+
+    def abort_build(self) -> None:
+        self.building = None
+
+    def cutover(self) -> IndexGeneration:
+        """Makes the generation being built the active one; returns the previous one"""
+        if self.building is None:
+            raise VectorStoreError("No index generation is being built")
+        previous, self.active, self.building = self.active, self.building, None
+        return previous
+
+    @staticmethod
+    def _build_index(dimension: int):
+        """Inner-product index stored as float32, float16 or 8-bit scalar quantized"""
+        import faiss
+
+        metric = faiss.METRIC_INNER_PRODUCT
+        quantization = settings.VECTOR_QUANTIZATION.lower()
+
+        if quantization == "fp16":
+            return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, metric)
+        if quantization == "int8":
+            index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, metric)
+            # Los vectores normalizados están acotados: se entrena con un rango fijo
+            # en lugar de esperar a tener datos
+            bound = settings.VECTOR_INT8_RANGE
+            index.train(np.vstack([
+                np.full(dimension, -bound),
+                np.full(dimension, bound)
+            ]).astype('float32'))
+            return index
+        if quantization == "none":
+            return faiss.IndexFlatIP(dimension)
+        raise ValueError(f"Unsupported VECTOR_QUANTIZATION: {settings.VECTOR_QUANTIZATION}")
+
+    def _document_selector(self, document_ids: np.ndarray):
+        """FAISS id selector covering every chunk of the given documents"""
+        import faiss
+
+        if len(document_ids) == 1:
+            document_id = int(document_ids[0])
+            return faiss.IDSelectorRange(
+                make_vector_id(document_id, 0),
+                make_vector_id(document_id, self.document_chunks[document_id])
+            )
+
+        ids = np.concatenate([
+            make_vector_id(int(d), 0) + np.arange(self.document_chunks[int(d)], dtype=np.int64)
+            for d in document_ids
+        ])
+        return faiss.IDSelectorBatch(ids)
+
     def _chunk_text(self, text: str) -> List[str]:
         """Improved text chunking with overlap and paragraph awareness"""
-        # Implement your preferred chunking strategy here
-        # Example: Split by paragraphs first, then by sentences if needed
-        paragraphs = [p for p in text.split('\n') if p.strip()]
         chunks = []
-        current_chunk = ""
-        
-        for para in paragraphs:
-            if len(current_chunk) + len(para) <= settings.CHUNK_SIZE:
-                current_chunk += para + "\n"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = para + "\n"
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        # \f (SEGMENT_BREAK de los extractores) es un límite duro: grupos de filas
+        # con su cabecera nunca se mezclan ni se parten por saltos de línea arbitrarios
+        for segment in text.split('\f'):
+            paragraphs = [p for p in segment.split('\n') if p.strip()]
+            current_chunk = ""
+
+            for para in paragraphs:
+                if len(current_chunk) + len(para) <= settings.CHUNK_SIZE:
+                    current_chunk += para + "\n"
+                else:
+                    if current_chunk:
+                        chunks.append(current_chunk.strip())
+                    current_chunk = para + "\n"
+
+            if current_chunk:
+                chunks.append(current_chunk.strip())
         
         return chunks
 
@@ -152,13 +411,23 @@ class VectorStoreService:
         try:
             with get_mongo_collection(self.collection_name) as collection:
                 # Find all chunks for this document
-                chunks = collection.find({"document_id": document_id})
-                chunk_indices = [chunk['chunk_index'] for chunk in chunks]
+                chunks = collection.find(
+                    {"document_id": document_id},
+                    {"vector_id": 1, "chunk_index": 1}
+                )
+                vector_ids = [
+                    chunk.get('vector_id', make_vector_id(document_id, chunk['chunk_index']))
+                    for chunk in chunks
+                ]
                 
-                # Remove from FAISS
-                if chunk_indices:
-                    ids_to_remove = np.array(chunk_indices)
-                    self.index_id_map.remove_ids(ids_to_remove)
+                # Remove from FAISS and the lexical index
+                if vector_ids:
+                    ids_to_remove = np.array(vector_ids, dtype=np.int64)
+                    for g in (self.active, self.building):
+                        if g is not None:
+                            g.index_id_map.remove_ids(ids_to_remove)
+                    self.lexical_index.remove(vector_ids)
+                self.document_chunks.pop(int(document_id), None)
                 
                 # Delete from MongoDB
                 result = collection.delete_many({"document_id": document_id})
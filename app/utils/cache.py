@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+from app.config import settings
+from app.utils.metrics import record_cache
+
+V = TypeVar("V")
+
+class TTLCache(Generic[V]):
+    """Bounded LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._data.move_to_end(key)
+            record_cache(self.name, True)
+            return entry[1]
+        if entry is not None:
+            del self._data[key]
+        record_cache(self.name, False)
+        return None
+
+    def set(self, key: Hashable, value: V) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def invalidate(self, predicate: Callable[[Hashable, V], bool]) -> int:
+        """Drops every entry matching predicate(key, value); O(n), for rare events"""
+        stale = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+        for key in stale:
+            del self._data[key]
+        return len(stale)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+# Usuarios resueltos por get_current_user, clave (email, iat del token)
+user_cache: TTLCache[Any] = TTLCache("user", settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+
+def invalidate_user(email: Optional[str] = None, user_id: Optional[int] = None) -> None:
+    """Forgets every cached token of a user after a password, role or status change"""
+    user_cache.invalidate(
+        lambda key, user: (email is not None and key[0] == email)
+        or (user_id is not None and user.id == user_id)
+    )
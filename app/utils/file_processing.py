@@ -1,24 +1,216 @@
 import os
+import asyncio
 import logging
 import magic
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Iterable, Iterator, Sequence, Tuple
 from fastapi import UploadFile, HTTPException, status
 import aiofiles
 import aiofiles.os
-import PyPDF2
-import docx
-import pandas as pd
-from pptx import Presentation
 import csv
-from PIL import Image
-import pytesseract
 from io import BytesIO
 import json
 import xml.etree.ElementTree as ET
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
+# Subir al cambiar cualquier extractor: invalida los artefactos de texto guardados
+EXTRACTOR_VERSION = 4
+
+@dataclass
+class ExtractedText:
+    text: str
+    # Offset en `text` donde empieza cada página (o diapositiva); [0] si no hay páginas
+    page_offsets: List[int] = field(default_factory=lambda: [0])
+
+    @classmethod
+    def from_pages(cls, pages: List[str]) -> "ExtractedText":
+        offsets, position = [], 0
+        for page in pages:
+            offsets.append(position)
+            position += len(page)
+        return cls("".join(pages), offsets or [0])
+
+    def segments(self) -> Iterator[str]:
+        yield self.text
+
+# Límite duro entre segmentos (p. ej. grupos de filas): el chunker nunca junta texto de ambos lados
+SEGMENT_BREAK = "\f"
+
+def _format_row(row: Sequence) -> str:
+    cells = ["" if value is None else str(value).strip() for value in row]
+    while cells and not cells[-1]:
+        cells.pop()
+    return " | ".join(cells)
+
+def _pack(items: Iterable[str], prefix: str = "") -> Iterator[str]:
+    """Packs whole items into segments of at most CHUNK_SIZE characters, each starting with prefix"""
+    group: List[str] = []
+    size = 0
+    for item in items:
+        if group and len(prefix) + size + len(item) + 1 > settings.CHUNK_SIZE:
+            yield prefix + "\n".join(group) + SEGMENT_BREAK
+            group, size = [], 0
+        group.append(item)
+        size += len(item) + 1
+    if group:
+        yield prefix + "\n".join(group) + SEGMENT_BREAK
+
+def row_groups(rows: Iterable[Sequence], title: str = "") -> Iterator[str]:
+    """Consumes rows one at a time and yields groups of at most CHUNK_SIZE characters.
+
+    Every group repeats the header row (the first non-empty one), so each
+    chunk can be understood on its own, and ends with SEGMENT_BREAK.
+    """
+    lines = (line for line in map(_format_row, rows) if line)
+    header = next(lines, None)
+    if header is None:
+        return
+    prefix = f"{title}\n{header}\n" if title else f"{header}\n"
+    empty = True
+    for group in _pack(lines, prefix):
+        empty = False
+        yield group
+    if empty:
+        # Solo cabecera
+        yield prefix + SEGMENT_BREAK
+
+def _clean(text: Any) -> str:
+    return " ".join(str(text).split())
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def xml_records(source) -> Iterator[str]:
+    """'root/part/name: text' lines from iterparse, one record per child of the root.
+
+    Elements are cleared and detached as soon as their tail text is known, so
+    memory stays bounded by the nesting depth rather than the file size.
+    Records larger than CHUNK_SIZE are emitted in pieces.
+    """
+    tags: List[str] = []
+    elements: List[ET.Element] = []
+    # Último hijo abierto o cerrado de cada elemento de la pila; su tail sigue pendiente
+    last_child: List[Optional[ET.Element]] = []
+    record: List[str] = []
+    size = 0
+
+    def text_of(value: Optional[str]) -> List[str]:
+        if value and value.strip():
+            return [f"{'/'.join(tags)}: {_clean(value)}"]
+        return []
+
+    def tail_of(parent: ET.Element, child: ET.Element) -> List[str]:
+        # El tail de un hijo solo se conoce al llegar al siguiente hermano o al cierre del padre
+        parent.remove(child)
+        return text_of(child.tail)
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        lines = []
+        if event == "start":
+            if elements:
+                # Contenido mixto: el texto previo del padre va antes que el hijo
+                previous = last_child[-1]
+                lines += text_of(elements[-1].text) if previous is None else tail_of(elements[-1], previous)
+                last_child[-1] = elem
+            tags.append(_local_name(elem.tag))
+            elements.append(elem)
+            last_child.append(None)
+            path = "/".join(tags)
+            lines += [
+                f"{path}@{_local_name(name)}: {_clean(value)}"
+                for name, value in elem.attrib.items() if value.strip()
+            ]
+        else:
+            previous = last_child[-1]
+            lines += text_of(elem.text) if previous is None else tail_of(elem, previous)
+            # clear() también borra el tail, que el parser puede haber leído ya
+            tail = elem.tail
+            elem.clear()
+            elem.tail = tail
+            tags.pop()
+            elements.pop()
+            last_child.pop()
+
+        record += lines
+        size += sum(len(line) + 1 for line in lines)
+        if record and ((event == "end" and len(tags) <= 1) or size >= settings.CHUNK_SIZE):
+            yield "\n".join(record)
+            record, size = [], 0
+    if record:
+        yield "\n".join(record)
+
+def _json_events(value: Any) -> Iterator[Tuple[str, Any]]:
+    """ijson.basic_parse-style events for an already loaded document (fallback without ijson)"""
+    if isinstance(value, dict):
+        yield "start_map", None
+        for key, item in value.items():
+            yield "map_key", key
+            yield from _json_events(item)
+        yield "end_map", None
+    elif isinstance(value, list):
+        yield "start_array", None
+        for item in value:
+            yield from _json_events(item)
+        yield "end_array", None
+    elif value is None:
+        yield "null", None
+    elif isinstance(value, bool):
+        yield "boolean", value
+    elif isinstance(value, (int, float)):
+        yield "number", value
+    else:
+        yield "string", value
+
+def json_records(events: Iterable[Tuple[str, Any]]) -> Iterator[str]:
+    """'orders[].sku: value' lines, one record per member of the top-level container.
+
+    Built from parse events, so only the current path and record are held in
+    memory. Records larger than CHUNK_SIZE are emitted in pieces.
+    """
+    segments: List[Optional[str]] = []  # clave actual en objetos, "[]" en arrays
+    record: List[str] = []
+    size = 0
+
+    def render() -> str:
+        path = "".join(
+            segment if segment == "[]" else f".{segment}"
+            for segment in segments if segment is not None
+        )
+        return path.removeprefix("[]").removeprefix(".")
+
+    for event, value in events:
+        line = None
+        if event == "start_map":
+            segments.append(None)
+        elif event == "start_array":
+            segments.append("[]")
+        elif event == "map_key":
+            segments[-1] = value
+        elif event in ("end_map", "end_array"):
+            segments.pop()
+        elif value is not None and value != "":
+            value = ("true" if value else "false") if event == "boolean" else _clean(value)
+            path = render()
+            line = f"{path}: {value}" if path else value
+
+        if line:
+            record.append(line)
+            size += len(line) + 1
+        # Un miembro del contenedor raíz terminó (o el registro ya llena un chunk)
+        member_done = len(segments) <= 1 and event not in ("start_map", "start_array", "map_key")
+        if record and (member_done or size >= settings.CHUNK_SIZE):
+            yield "\n".join(record)
+            record, size = [], 0
+    if record:
+        yield "\n".join(record)
+
+# Los parsers (PyPDF2, docx, pptx, openpyxl, ijson, PIL, pytesseract) se importan en cada
+# extractor para no cargarlos al arrancar el proceso
+
 class FileProcessor:
     SUPPORTED_MIME_TYPES = {
         'application/pdf': 'pdf',
@@ -59,6 +251,21 @@ class FileProcessor:
                 detail=f"Error saving file: {str(e)}"
             )
 
+    @staticmethod
+    def detect_file_type(head: bytes, filename: str) -> str:
+        """Extensión según libmagic; ValueError si no se soporta o no coincide con el nombre"""
+        mime = magic.from_buffer(head, mime=True)
+        file_extension = FileProcessor.SUPPORTED_MIME_TYPES.get(mime)
+
+        if not file_extension:
+            raise ValueError(f"Unsupported file type: {mime}")
+
+        # Validar extensión vs contenido
+        if Path(filename).suffix.lower()[1:] != file_extension:
+            raise ValueError("File extension doesn't match content")
+
+        return file_extension
+
     @staticmethod
     async def _validate_file_type(file: UploadFile) -> str:
         """Valida el tipo de archivo usando magic"""
@@ -66,47 +273,67 @@ class FileProcessor:
         file_content = await file.read(2048)
         await file.seek(0)  # Rewind after reading
         
-        mime = magic.from_buffer(file_content, mime=True)
-        file_extension = FileProcessor.SUPPORTED_MIME_TYPES.get(mime)
-        
-        if not file_extension:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Unsupported file type: {mime}"
-            )
-        
-        # Validar extensión vs contenido
-        if Path(file.filename).suffix.lower()[1:] != file_extension:
+        try:
+            return FileProcessor.detect_file_type(file_content, file.filename)
+        except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File extension doesn't match content"
+                detail=str(e)
             )
-        
-        return file_extension
 
     @staticmethod
     async def extract_text(file_path: str) -> str:
         """Extrae texto de varios formatos de archivo"""
+        return (await FileProcessor.extract_document(file_path)).text
+
+    @staticmethod
+    def is_streamed(file_path: str) -> bool:
+        """True for formats extracted segment by segment (see stream_segments)"""
+        return _extension(file_path) in SEGMENT_EXTRACTORS
+
+    @staticmethod
+    async def stream_segments(file_path: str, consume: Callable[[Iterator[str]], Any]) -> Any:
+        """Runs consume() in a worker thread over the segments of a streamed format.
+
+        Segments are produced while consume() iterates them, so memory stays
+        bounded by one segment whatever the size of the file.
+        """
+        from app.services.storage import get_storage
+
+        extractor = SEGMENT_EXTRACTORS[_extension(file_path)]
+        async with get_storage().local_path(file_path) as local_path:
+            return await asyncio.to_thread(lambda: consume(extractor(local_path)))
+
+    @staticmethod
+    async def extract_document(file_path: str) -> ExtractedText:
+        """Extrae texto y offsets de página, en cualquier tier de storage"""
+        # Import diferido: el servicio de storage depende de la base de datos
+        from app.services.storage import get_storage
+
         try:
-            file_extension = Path(file_path).suffix.lower()[1:]
-            
+            file_extension = _extension(file_path)
+            if file_extension in SEGMENT_EXTRACTORS:
+                # Texto completo en memoria; el procesado usa stream_segments
+                return ExtractedText(await FileProcessor.stream_segments(file_path, "".join))
+
             handlers = {
                 'pdf': FileProcessor._extract_from_pdf,
                 'docx': FileProcessor._extract_from_docx,
-                'csv': FileProcessor._extract_from_csv,
                 'txt': FileProcessor._extract_from_txt,
-                'json': FileProcessor._extract_from_json,
                 'pptx': FileProcessor._extract_from_pptx,
-                'xlsx': FileProcessor._extract_from_xlsx,
                 'jpg': FileProcessor._extract_from_image,
-                'png': FileProcessor._extract_from_image,
-                'xml': FileProcessor._extract_from_xml
+                'png': FileProcessor._extract_from_image
             }
             
             if file_extension not in handlers:
                 raise ValueError(f"Unsupported file extension: {file_extension}")
             
-            return await handlers[file_extension](file_path)
+            # Los parsers necesitan un archivo local sin comprimir
+            async with get_storage().local_path(file_path) as local_path:
+                extracted = await handlers[file_extension](local_path)
+            if isinstance(extracted, list):
+                return ExtractedText.from_pages(extracted)
+            return ExtractedText(extracted)
             
         except Exception as e:
             logger.error(f"Error extracting text: {str(e)}")
@@ -116,28 +343,33 @@ class FileProcessor:
             )
 
     @staticmethod
-    async def _extract_from_pdf(file_path: str) -> str:
-        """Extrae texto de PDFs"""
-        text = ""
+    async def _extract_from_pdf(file_path: str) -> List[str]:
+        """Extrae texto de PDFs, una entrada por página"""
+        import PyPDF2
+
         async with aiofiles.open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(await file.read())
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        return text
+            reader = PyPDF2.PdfReader(BytesIO(await file.read()))
+            return [page.extract_text() + "\n" for page in reader.pages]
 
     @staticmethod
     async def _extract_from_docx(file_path: str) -> str:
         """Extrae texto de documentos Word"""
+        import docx
+
         doc = docx.Document(file_path)
         return "\n".join([para.text for para in doc.paragraphs])
 
     @staticmethod
-    async def _extract_from_csv(file_path: str) -> str:
-        """Extrae texto de CSV"""
-        async with aiofiles.open(file_path, 'r') as file:
-            content = await file.read()
-            df = pd.read_csv(BytesIO(content.encode()))
-            return df.to_string(index=False)
+    def _segments_from_csv(file_path: str) -> Iterator[str]:
+        """Grupos de filas de un CSV con su cabecera, leídos fila a fila"""
+        with open(file_path, newline="", encoding="utf-8-sig", errors="replace") as file:
+            sample = file.read(64 * 1024)
+            file.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+            except csv.Error:
+                dialect = csv.excel
+            yield from row_groups(csv.reader(file, dialect))
 
     @staticmethod
     async def _extract_from_txt(file_path: str) -> str:
@@ -146,43 +378,54 @@ class FileProcessor:
             return await file.read()
 
     @staticmethod
-    async def _extract_from_json(file_path: str) -> str:
-        """Extrae texto de JSON"""
-        async with aiofiles.open(file_path, 'r') as file:
-            data = json.loads(await file.read())
-            return str(data)
+    def _segments_from_json(file_path: str) -> Iterator[str]:
+        """Registros 'ruta: valor' de un JSON; sin ijson el documento se carga entero al parsear"""
+        try:
+            import ijson
+        except ImportError:
+            ijson = None
+
+        with open(file_path, 'rb') as file:
+            events = ijson.basic_parse(file) if ijson else _json_events(json.load(file))
+            yield from _pack(json_records(events))
 
     @staticmethod
-    async def _extract_from_pptx(file_path: str) -> str:
-        """Extrae texto de PowerPoint"""
+    async def _extract_from_pptx(file_path: str) -> List[str]:
+        """Extrae texto de PowerPoint, una entrada por diapositiva"""
+        from pptx import Presentation
+
         prs = Presentation(file_path)
-        text = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text.append(shape.text)
-        return "\n".join(text)
+        return [
+            "".join(shape.text + "\n" for shape in slide.shapes if hasattr(shape, "text"))
+            for slide in prs.slides
+        ]
 
     @staticmethod
-    async def _extract_from_xlsx(file_path: str) -> str:
-        """Extrae texto de Excel"""
-        df = pd.read_excel(file_path, engine='openpyxl')
-        return df.to_string(index=False)
+    def _segments_from_xlsx(file_path: str) -> Iterator[str]:
+        """Grupos de filas de cada hoja de Excel, con el título de la hoja; read_only lee en streaming"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                yield from row_groups(sheet.iter_rows(values_only=True), title=f"Sheet: {sheet.title}")
+        finally:
+            workbook.close()
 
     @staticmethod
     async def _extract_from_image(file_path: str) -> str:
         """Extrae texto de imágenes usando OCR"""
+        from PIL import Image
+        import pytesseract
+
         async with aiofiles.open(file_path, 'rb') as file:
             image = Image.open(BytesIO(await file.read()))
             return pytesseract.image_to_string(image)
 
     @staticmethod
-    async def _extract_from_xml(file_path: str) -> str:
-        """Extrae texto de XML"""
-        async with aiofiles.open(file_path, 'r') as file:
-            tree = ET.parse(BytesIO((await file.read()).encode()))
-            root = tree.getroot()
-            return ET.tostring(root, encoding='unicode', method='text')
+    def _segments_from_xml(file_path: str) -> Iterator[str]:
+        """Registros 'ruta: texto' de un XML, leídos con iterparse"""
+        return _pack(xml_records(file_path))
 
     @staticmethod
     async def clean_up(file_path: str) -> None:
@@ -191,4 +434,18 @@ class FileProcessor:
             if await aiofiles.os.path.exists(file_path):
                 await aiofiles.os.remove(file_path)
         except Exception as e:
-            logger.warning(f"Could not delete file {file_path}: {str(e)}")
\ No newline at end of file
+            logger.warning(f"Could not delete file {file_path}: {str(e)}")
+
+def _extension(file_path: str) -> str:
+    # Import diferido: el servicio de storage depende de la base de datos
+    from app.services.storage import logical_name
+
+    return Path(logical_name(file_path)).suffix.lower()[1:]
+
+# Formatos que se extraen por segmentos sin cargar el texto entero
+SEGMENT_EXTRACTORS: Dict[str, Callable[[str], Iterator[str]]] = {
+    'csv': FileProcessor._segments_from_csv,
+    'xlsx': FileProcessor._segments_from_xlsx,
+    'json': FileProcessor._segments_from_json,
+    'xml': FileProcessor._segments_from_xml,
+}
@@ -1,14 +1,56 @@
+import copy
 import logging
-import json
-from typing import Dict, Any, Optional
-from datetime import datetime
+import queue
+import random
+import time
+import uuid
+import zlib
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Any, Optional, List
+
+import orjson
 from fastapi import Request
-from starlette.middleware.base import RequestResponseEndpoint
+
+from app.config import settings
+
+# Id de la petición en curso, propagado a todos los logs emitidos durante ella
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Atributos estándar de LogRecord; el resto son campos "extra"
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request", "request_id", "request_data"
+}
+
+def _extract_request_data(request: Request) -> Dict[str, Any]:
+    allowed = settings.LOG_HEADER_ALLOWLIST
+    return {
+        "method": request.method,
+        "path": request.url.path,
+        "headers": {k: v for k, v in request.headers.items() if k in allowed},
+        "client": {
+            "host": request.client.host if request.client else None,
+            "port": request.client.port if request.client else None
+        }
+    }
 
 class JSONFormatter(logging.Formatter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._last_second = -1
+        self._last_prefix = ""
+
+    def _timestamp(self, created: float) -> str:
+        # El prefijo se formatea una vez por segundo; solo cambian los milisegundos
+        second = int(created)
+        if second != self._last_second:
+            self._last_second = second
+            self._last_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        return f"{self._last_prefix}.{int((created - second) * 1000):03d}Z"
+
     def format(self, record: logging.LogRecord) -> str:
         log_data: Dict[str, Any] = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "message": record.getMessage(),
             "logger": record.name,
@@ -18,70 +60,179 @@ class JSONFormatter(logging.Formatter):
             "thread": record.threadName,
         }
 
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            log_data["request_id"] = request_id
+
         if record.exc_info:
             log_data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_data["exception"] = record.exc_text
 
-        if hasattr(record, 'request'):
-            log_data.update(self._extract_request_data(record.request))
+        if hasattr(record, 'request_data'):
+            log_data["request"] = record.request_data
+        elif hasattr(record, 'request'):
+            log_data["request"] = _extract_request_data(record.request)
 
-        if hasattr(record, 'extra'):
-            log_data.update(record.extra)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                log_data[key] = value
 
-        return json.dumps(log_data)
+        return orjson.dumps(log_data, default=str).decode()
 
-    def _extract_request_data(self, request: Request) -> Dict[str, Any]:
-        return {
-            "request": {
-                "method": request.method,
-                "url": str(request.url),
-                "headers": dict(request.headers),
-                "client": {
-                    "host": request.client.host if request.client else None,
-                    "port": request.client.port if request.client else None
-                }
-            }
-        }
+class RequestIdFilter(logging.Filter):
+    """Adds the current request id to every record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of INFO/DEBUG records from high-volume loggers.
+
+    Sampling is decided per request id, so a sampled request keeps all its
+    lines; warnings and errors always pass.
+    """
+
+    def __init__(self, rate: float, logger_names: List[str]):
+        super().__init__()
+        self.threshold = int(rate * 10000)
+        self.logger_names = tuple(logger_names)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.threshold >= 10000 or record.levelno > logging.INFO:
+            return True
+        if not record.name.startswith(self.logger_names):
+            return True
+        request_id = getattr(record, "request_id", None) or request_id_var.get()
+        if request_id:
+            return zlib.crc32(request_id.encode()) % 10000 < self.threshold
+        return random.randrange(10000) < self.threshold
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Enqueues records without blocking; formatting and I/O happen in the listener thread"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._exception_formatter = logging.Formatter()
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A diferencia de QueueHandler.prepare, no mezcla la traza en el mensaje
+        # y resuelve ya los objetos que no deben cruzar de hilo (Request)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        request = record.__dict__.pop("request", None)
+        if request is not None:
+            record.request_data = _extract_request_data(request)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[QueueListener] = None
+
+def enable_async_logging(logger_names: Optional[List[str]] = None) -> None:
+    """Moves the handlers of the given loggers behind a single queue + listener thread"""
+    global _listener
+    if _listener is not None:
+        return
+
+    # Solo los loggers que ya tenían handlers, para no duplicar registros por propagación
+    loggers = [
+        logger
+        for logger in [logging.getLogger()] + [logging.getLogger(n) for n in (logger_names or [])]
+        if logger.handlers
+    ]
+    targets = []
+    for logger in loggers:
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            if handler not in targets:
+                targets.append(handler)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE, settings.LOG_SAMPLED_LOGGERS))
+    for logger in loggers:
+        logger.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, *targets, respect_handler_level=True)
+    _listener.start()
+
+def stop_async_logging() -> None:
+    """Flushes pending records; call on shutdown"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 class RequestLoggerMiddleware:
-    async def __call__(
-        self,
-        request: Request,
-        call_next: RequestResponseEndpoint
-    ):
-        logger = logging.getLogger("api")
-        
+    """ASGI middleware: assigns a request id and logs one line per request"""
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("api")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
         try:
-            # Log request
-            logger.info(
-                "Request received",
+            await self.app(scope, receive, send_wrapper)
+            self.logger.info(
+                "Request completed",
                 extra={
-                    "request": request,
-                    "type": "http.request"
+                    "type": "http.request",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status_code": status_code,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2)
                 }
             )
-            
-            response = await call_next(request)
-            
-            # Log response
-            logger.info(
-                "Response sent",
-                extra={
-                    "status_code": response.status_code,
-                    "type": "http.response"
-                }
-            )
-            
-            return response
-        except Exception as e:
-            logger.error(
+        except Exception:
+            self.logger.error(
                 "Request processing failed",
                 exc_info=True,
                 extra={
-                    "request": request,
-                    "type": "http.error"
+                    "type": "http.error",
+                    "method": scope["method"],
+                    "path": scope["path"]
                 }
             )
             raise
+        finally:
+            request_id_var.reset(token)
 
 def setup_logging(log_level: str = "INFO") -> None:
     """Configura logging estructurado"""
@@ -103,6 +254,8 @@ def setup_logging(log_level: str = "INFO") -> None:
         lib_logger.setLevel("WARNING")
         lib_logger.propagate = True
 
+    enable_async_logging()
+
 def get_logger(name: Optional[str] = None) -> logging.Logger:
     """Obtiene logger configurado"""
     logger = logging.getLogger(name or "app")
@@ -111,4 +264,4 @@ def get_logger(name: Optional[str] = None) -> logging.Logger:
 
 # Ejemplo de uso:
 # logger = get_logger(__name__)
-# logger.info("Mensaje informativo", extra={"key": "value"})
\ No newline at end of file
+# logger.info("Mensaje informativo", extra={"key": "value"})
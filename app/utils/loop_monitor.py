@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from app.utils.metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG
+from app.utils.profiling import capture_stack
+
+logger = logging.getLogger(__name__)
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+def blocking_location(frame) -> str:
+    """Innermost frame inside the app package, i.e. the call site that blocked the loop"""
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_ROOT):
+            return f"{os.path.relpath(filename, os.path.dirname(_APP_ROOT))}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+class LoopLagMonitor:
+    """Heartbeat on the event loop plus a watchdog thread that catches it stalled.
+
+    The heartbeat measures lag after the fact; the watchdog notices a beat
+    that is overdue and snapshots the loop thread's stack while the blocking
+    call is still running.
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self._last_beat = time.perf_counter()
+        self._beat = 0
+        self._reported_beat = -1
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog:
+            self._watchdog.join()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            scheduled = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            EVENT_LOOP_LAG.observe(max(now - scheduled - self.interval, 0.0))
+            self._last_beat = now
+            self._beat += 1
+
+    def _watch(self) -> None:
+        # Comprueba varias veces por intervalo para capturar la pila mientras sigue bloqueado
+        while not self._stop.wait(self.interval / 2):
+            self.check()
+
+    def check(self) -> None:
+        stalled = time.perf_counter() - self._last_beat - self.interval
+        beat = self._beat
+        if stalled < self.threshold or beat == self._reported_beat:
+            return
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        # Una sola captura por bloqueo
+        self._reported_beat = beat
+        location = blocking_location(frame)
+        EVENT_LOOP_BLOCKED.labels(location).inc()
+        logger.warning(
+            f"Event loop blocked for {stalled * 1000:.0f}ms at {location}",
+            extra={
+                "type": "event_loop.blocked",
+                "blocked_ms": round(stalled * 1000, 1),
+                "location": location,
+                "stack": capture_stack(frame)
+            }
+        )
@@ -0,0 +1,157 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+
+# Buckets pensados para la API (ms) y para etapas lentas (OCR, generación)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=REQUEST_BUCKETS
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served"
+)
+STAGE_LATENCY = Histogram(
+    "document_ai_stage_duration_seconds",
+    "Duration of ingest, search and generation stages",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+OLLAMA_TTFT = Histogram(
+    "ollama_time_to_first_token_seconds",
+    "Time until Ollama streams the first token",
+    ["model"],
+    buckets=STAGE_BUCKETS
+)
+OLLAMA_GENERATION = Histogram(
+    "ollama_generation_duration_seconds",
+    "Total Ollama generation time",
+    ["model"],
+    buckets=STAGE_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit/miss)",
+    ["cache", "result"]
+)
+QUEUE_DEPTH = Gauge(
+    "queue_depth",
+    "Work waiting or running in in-process queues and pools",
+    ["queue"]
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between a scheduled heartbeat and when the event loop ran it",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Times the event loop stalled past the threshold, by innermost application frame",
+    ["location"]
+)
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Database connection pool usage",
+    ["pool", "state"]
+)
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """Mide la duración de una etapa del pipeline"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - started)
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def track_queue(queue: str, depth: Callable[[], float]) -> None:
+    """Registra una función que devuelve la profundidad actual de una cola"""
+    QUEUE_DEPTH.labels(queue).set_function(depth)
+
+def track_mysql_pool(engine) -> None:
+    pool = engine.pool
+    POOL_CONNECTIONS.labels("mysql", "size").set_function(pool.size)
+    POOL_CONNECTIONS.labels("mysql", "checked_out").set_function(pool.checkedout)
+    POOL_CONNECTIONS.labels("mysql", "overflow").set_function(lambda: max(pool.overflow(), 0))
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks checked-out MongoDB connections from pymongo pool events"""
+
+    def __init__(self):
+        self.checked_out = POOL_CONNECTIONS.labels("mongo", "checked_out")
+        self.open = POOL_CONNECTIONS.labels("mongo", "open")
+
+    def connection_created(self, event):
+        self.open.inc()
+
+    def connection_closed(self, event):
+        self.open.dec()
+
+    def connection_checked_out(self, event):
+        self.checked_out.inc()
+
+    def connection_checked_in(self, event):
+        self.checked_out.dec()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware: request latency per route template, no body buffering"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            # La plantilla de la ruta (no la URL) mantiene acotada la cardinalidad
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], route, str(status_code)).observe(
+                time.perf_counter() - started
+            )
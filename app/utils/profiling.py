@@ -0,0 +1,203 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+Stack = Tuple[str, ...]
+
+def _frame_label(code) -> str:
+    path = code.co_filename.rsplit(os.sep, 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+def capture_stack(frame) -> List[str]:
+    """Frames from outermost to innermost, labelled by function and definition line"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+class StackSampler:
+    """Samples the stacks of every thread (event loop and executor pools) from a daemon thread"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self.paused = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.started_at is not None:
+            self.duration = time.perf_counter() - self.started_at
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if not self.paused:
+                self.sample()
+
+    def sample(self) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            # El nombre del hilo es la raíz: separa event loop, pools de extracción/embeddings...
+            thread = f"thread:{names.get(ident, ident)}"
+            self.counts[(thread, *capture_stack(frame))] += 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, one 'a;b;c count' line per stack"""
+        return "\n".join(
+            f"{';'.join(stack)} {count}"
+            for stack, count in self.counts.most_common()
+        ) + "\n"
+
+    def speedscope(self) -> dict:
+        """speedscope.app file with one sampled profile per thread"""
+        frames: List[dict] = []
+        frame_index: Dict[str, int] = {}
+        profiles: Dict[str, dict] = {}
+
+        for stack, count in self.counts.items():
+            thread, frames_in_stack = stack[0], stack[1:]
+            indexes = []
+            for label in frames_in_stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indexes.append(frame_index[label])
+            profile = profiles.setdefault(thread, {
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": [],
+                "weights": []
+            })
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * self.interval)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+            "name": "document-ai profile",
+            "exporter": "document-ai"
+        }
+
+class ProfileSession:
+    """A profiling run bounded by time or by a number of matching requests"""
+
+    def __init__(self, interval: float, route: Optional[str] = None, requests: int = 0):
+        self.id = uuid.uuid4().hex
+        self.route = route
+        self.remaining = requests
+        self.in_flight = 0
+        self.sampler = StackSampler(interval)
+        self.done = asyncio.Event()
+
+    def matches(self, path: str) -> bool:
+        return self.route is not None and path.startswith(self.route)
+
+class Profiler:
+    """Process-wide profiling control; only one session runs at a time"""
+
+    def __init__(self, keep: int = 5):
+        self.active: Optional[ProfileSession] = None
+        self.finished: "OrderedDict[str, ProfileSession]" = OrderedDict()
+        self.keep = keep
+
+    async def profile_for(self, seconds: float, interval: float) -> ProfileSession:
+        session = self._begin(ProfileSession(interval))
+        session.sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._finish(session)
+        return session
+
+    def arm(self, route: str, requests: int, interval: float) -> ProfileSession:
+        """Samples only while requests under `route` are in flight, for the next N of them"""
+        session = self._begin(ProfileSession(interval, route=route, requests=requests))
+        session.sampler.paused = True
+        session.sampler.start()
+        return session
+
+    def cancel(self, session: ProfileSession) -> None:
+        if not session.done.is_set():
+            self._finish(session)
+
+    def get(self, session_id: str) -> Optional[ProfileSession]:
+        if self.active and self.active.id == session_id:
+            return self.active
+        return self.finished.get(session_id)
+
+    def request_started(self, path: str) -> Optional[ProfileSession]:
+        session = self.active
+        if session is None or not session.matches(path) or session.remaining <= 0:
+            return None
+        session.remaining -= 1
+        session.in_flight += 1
+        session.sampler.paused = False
+        return session
+
+    def request_finished(self, session: ProfileSession) -> None:
+        session.in_flight -= 1
+        if session.in_flight == 0:
+            session.sampler.paused = True
+            if session.remaining <= 0 and self.active is session:
+                self._finish(session)
+
+    def _begin(self, session: ProfileSession) -> ProfileSession:
+        if self.active is not None:
+            raise RuntimeError("A profiling session is already running")
+        self.active = session
+        return session
+
+    def _finish(self, session: ProfileSession) -> None:
+        session.sampler.stop()
+        session.done.set()
+        if self.active is session:
+            self.active = None
+        self.finished[session.id] = session
+        while len(self.finished) > self.keep:
+            self.finished.popitem(last=False)
+
+profiler = Profiler()
+
+class ProfilingMiddleware:
+    """ASGI hook for request-scoped profiling; a single attribute check when idle"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if profiler.active is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        session = profiler.request_started(scope["path"])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if session is not None:
+                profiler.request_finished(session)
@@ -0,0 +1,37 @@
+import math
+import os
+from pathlib import Path
+from typing import Optional
+
+CGROUP_V2_CPU_MAX = Path("/sys/fs/cgroup/cpu.max")
+CGROUP_V1_QUOTA = Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+CGROUP_V1_PERIOD = Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+
+def cpu_quota() -> Optional[float]:
+    """Límite de CPU del contenedor (cgroup v2 o v1), None si no hay límite"""
+    try:
+        if CGROUP_V2_CPU_MAX.exists():
+            quota, period = CGROUP_V2_CPU_MAX.read_text().split()[:2]
+            if quota == "max":
+                return None
+            return int(quota) / int(period)
+        if CGROUP_V1_QUOTA.exists():
+            quota = int(CGROUP_V1_QUOTA.read_text())
+            if quota <= 0:
+                return None
+            return quota / int(CGROUP_V1_PERIOD.read_text())
+    except (OSError, ValueError):
+        return None
+    return None
+
+def available_cpus() -> int:
+    """CPUs usables por el proceso: afinidad acotada por la cuota del cgroup"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
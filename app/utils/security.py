@@ -1,14 +1,23 @@
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Callable, Optional, List, TypeVar
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from pydantic import BaseModel
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
+from app.exceptions import PasswordHashingBusyError
 from app.models.user import User
 from app.database import get_db_session
+from app.utils.cache import invalidate_user
+from app.utils.metrics import track_queue
+from app.utils.resources import available_cpus
+
+T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +44,43 @@ class SecurityUtils:
     def get_password_hash(password: str) -> str:
         return SecurityUtils.pwd_context.hash(password)
 
+    _hash_executor: Optional[ThreadPoolExecutor] = None
+    _hash_pending = 0
+
+    @classmethod
+    def _get_hash_executor(cls) -> ThreadPoolExecutor:
+        if cls._hash_executor is None:
+            workers = settings.PASSWORD_HASH_WORKERS or min(available_cpus(), 4)
+            cls._hash_executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="password-hash"
+            )
+            track_queue("password_hash", lambda: cls._hash_pending)
+        return cls._hash_executor
+
+    @classmethod
+    async def _run_hashing(cls, func: Callable[..., T], *args) -> T:
+        """Runs bcrypt/argon2 off the event loop; sheds load past the queue limit"""
+        if cls._hash_pending >= settings.PASSWORD_HASH_QUEUE_LIMIT:
+            raise PasswordHashingBusyError("Password hashing queue is full")
+
+        cls._hash_pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(cls._get_hash_executor(), func, *args)
+        finally:
+            cls._hash_pending -= 1
+
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        return await SecurityUtils._run_hashing(
+            SecurityUtils.verify_password, plain_password, hashed_password
+        )
+
+    @staticmethod
+    async def get_password_hash_async(password: str) -> str:
+        return await SecurityUtils._run_hashing(SecurityUtils.get_password_hash, password)
+
     @staticmethod
     async def validate_password_complexity(password: str) -> bool:
         """Valida complejidad de contraseña"""
@@ -65,10 +111,10 @@ class SecurityUtils:
         if not user or not user.password_history:
             return False
             
-        # Verificar contra las últimas N contraseñas
-        recent_history = user.password_history[-history_depth:]
-        for old_password in recent_history:
-            if SecurityUtils.verify_password(new_password, old_password.password_hash):
+        # Verificar contra las últimas N contraseñas de una en una: cada petición ocupa
+        # como mucho un hueco del pool de hashing y se para en la primera coincidencia
+        for old_password in user.password_history[-history_depth:]:
+            if await SecurityUtils.verify_password_async(new_password, old_password.password_hash):
                 return True
         return False
 
@@ -116,7 +162,7 @@ class SecurityUtils:
         if await SecurityUtils.check_password_history(db, user_id, new_password):
             raise ValueError("Password was used recently")
         
-        new_hash = SecurityUtils.get_password_hash(new_password)
+        new_hash = await SecurityUtils.get_password_hash_async(new_password)
         new_history = PasswordHistory(
             password_hash=new_hash,
             changed_at=datetime.utcnow()
@@ -131,6 +177,8 @@ class SecurityUtils:
             )
         )
         await db.commit()
+        # update() masivo no dispara los eventos de atributo del modelo
+        invalidate_user(user_id=user_id)
 
     @staticmethod
     def generate_secure_random(length: int = 32) -> str:
@@ -0,0 +1,64 @@
+import asyncio
+import importlib
+import logging
+import time
+from typing import Callable, Dict
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Dependencias pesadas que ya no se importan al arrancar, en orden de carga
+HEAVY_IMPORTS = [
+    "numpy",
+    "faiss",
+    "torch",
+    "sentence_transformers",
+    "openpyxl",
+    "PyPDF2",
+    "docx",
+    "pptx",
+    "PIL.Image",
+    "pytesseract",
+]
+
+# Segundos por import/paso del warm-up, para el informe de arranque
+STARTUP_REPORT: Dict[str, float] = {}
+
+_warm = asyncio.Event()
+
+def is_warm() -> bool:
+    return _warm.is_set()
+
+def _timed(step: str, func: Callable, *args) -> None:
+    started = time.perf_counter()
+    try:
+        func(*args)
+    except Exception as e:
+        logger.warning(f"Warm-up step {step} failed: {str(e)}")
+    finally:
+        STARTUP_REPORT[step] = time.perf_counter() - started
+
+def _load_models() -> None:
+    from app.services.vector_store import VectorStoreService
+
+    _timed("model:embeddings", VectorStoreService)
+    if settings.RERANK_ENABLED:
+        from app.services.reranker import RerankerService
+
+        _timed("model:reranker", RerankerService()._load_model)
+
+async def warm_up() -> None:
+    """Imports parsers and loads models in a worker thread after the app is serving"""
+    started = time.perf_counter()
+    for module in HEAVY_IMPORTS:
+        await asyncio.to_thread(_timed, f"import:{module}", importlib.import_module, module)
+    await asyncio.to_thread(_load_models)
+    STARTUP_REPORT["total"] = time.perf_counter() - started
+    _warm.set()
+
+    report = ", ".join(
+        f"{step}={seconds:.2f}s"
+        for step, seconds in sorted(STARTUP_REPORT.items(), key=lambda item: -item[1])
+    )
+    logger.info(f"Warm-up complete: {report}")
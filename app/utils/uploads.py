@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import aiofiles
+from fastapi import HTTPException, Request, status
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+from app.utils.file_processing import FileProcessor
+
+logger = logging.getLogger(__name__)
+
+# Bytes iniciales que necesita libmagic
+MAGIC_HEAD_BYTES = 2048
+
+@dataclass
+class StreamedFile:
+    filename: str
+    path: Optional[str]
+    size: int = 0
+    checksum: Optional[str] = None
+    file_type: Optional[str] = None
+    error: Optional[str] = None
+
+class _PartWriter:
+    """Writes one multipart file part to disk while hashing it"""
+
+    def __init__(self, filename: str, path: str, handle, max_size: int):
+        self.file = StreamedFile(filename=filename, path=path)
+        self.handle = handle
+        self.max_size = max_size
+        self.hasher = hashlib.sha256()
+        self.head = bytearray()
+
+    @classmethod
+    async def open(cls, upload_dir: str, filename: str, max_size: int) -> "_PartWriter":
+        # Nombre único en disco: lotes de carpetas repiten nombres de archivo
+        path = os.path.join(upload_dir, f"{uuid.uuid4().hex}{Path(filename).suffix.lower()}")
+        handle = await aiofiles.open(path, "wb")
+        return cls(filename, path, handle, max_size)
+
+    async def write(self, data: bytes) -> None:
+        if self.file.error:
+            return
+        self.file.size += len(data)
+        if self.file.size > self.max_size:
+            self.file.error = f"File size exceeds {settings.MAX_FILE_SIZE_MB}MB limit"
+            return
+        if len(self.head) < MAGIC_HEAD_BYTES:
+            self.head += data[:MAGIC_HEAD_BYTES - len(self.head)]
+        self.hasher.update(data)
+        await self.handle.write(data)
+
+    async def close(self) -> StreamedFile:
+        await self.handle.close()
+        if self.file.error is None:
+            self.file.checksum = self.hasher.hexdigest()
+        return self.file
+
+def merge_ranges(ranges: Iterable[Sequence[int]]) -> List[Tuple[int, int]]:
+    """Merges half-open [start, end) byte ranges, overlapping or adjacent"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted((int(r[0]), int(r[1])) for r in ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def missing_ranges(merged: List[Tuple[int, int]], size: int) -> List[Tuple[int, int]]:
+    """Gaps in [0, size) not covered by the merged ranges"""
+    missing, position = [], 0
+    for start, end in merged:
+        if start > position:
+            missing.append((position, start))
+        position = max(position, end)
+    if position < size:
+        missing.append((position, size))
+    return missing
+
+def parse_content_range(header: Optional[str]) -> Tuple[int, int, int]:
+    """'bytes start-end/total' -> half-open (start, end, total); ValueError if malformed"""
+    if not header or not header.startswith("bytes "):
+        raise ValueError("Content-Range must be 'bytes start-end/total'")
+    span, _, total = header[6:].partition("/")
+    first, _, last = span.partition("-")
+    start, end, total = int(first), int(last) + 1, int(total)
+    if start < 0 or end <= start or end > total:
+        raise ValueError("Content-Range out of bounds")
+    return start, end, total
+
+async def validate_file_type(file: StreamedFile, head: bytes) -> None:
+    """Sets file.file_type, or file.error when libmagic or ALLOWED_EXTENSIONS reject it"""
+    try:
+        file_type = await asyncio.to_thread(FileProcessor.detect_file_type, head, file.filename)
+    except ValueError as e:
+        file.error = str(e)
+        return
+    if file_type not in settings.ALLOWED_EXTENSIONS:
+        file.error = f"File type not allowed: {file_type}"
+    else:
+        file.file_type = file_type
+
+async def remove_files(files: List[StreamedFile]) -> None:
+    for file in files:
+        if file.path:
+            try:
+                await asyncio.to_thread(os.remove, file.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not delete file {file.path}: {str(e)}")
+            file.path = None
+
+async def receive_files(
+    request: Request,
+    upload_dir: str,
+    max_files: int,
+    max_file_size: int
+) -> List[StreamedFile]:
+    """Streams every file part of a multipart body to disk as it arrives.
+
+    libmagic validation of a part runs in a worker thread while the next part
+    is still being received. Rejected files are removed; their entries keep
+    the reason in `error`.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a multipart/form-data body"
+        )
+
+    # Los callbacks del parser son síncronos: se acumulan eventos y se procesan tras cada write
+    events: List[Tuple[str, object]] = []
+    headers: Dict[bytes, bytes] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("headers", dict(headers)))
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    await asyncio.to_thread(Path(upload_dir).mkdir, parents=True, exist_ok=True)
+    files: List[StreamedFile] = []
+    validations: List[asyncio.Task] = []
+    current: Optional[_PartWriter] = None
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event, payload in events:
+                if event == "headers":
+                    _, options = parse_options_header(payload.get(b"content-disposition", b""))
+                    filename = options.get(b"filename")
+                    if filename is None:
+                        continue  # campo de formulario, no archivo
+                    filename = os.path.basename(filename.decode("utf-8", errors="replace")) or "upload"
+                    if len(files) >= max_files:
+                        files.append(StreamedFile(filename, None, error=f"More than {max_files} files"))
+                        continue
+                    current = await _PartWriter.open(upload_dir, filename, max_file_size)
+                elif event == "data" and current is not None:
+                    await current.write(payload)
+                elif event == "end" and current is not None:
+                    file = await current.close()
+                    files.append(file)
+                    if file.error is None:
+                        validations.append(asyncio.create_task(validate_file_type(file, bytes(current.head))))
+                    current = None
+            events.clear()
+        parser.finalize()
+        await asyncio.gather(*validations)
+    except BaseException:
+        for task in validations:
+            task.cancel()
+        if current is not None:
+            await current.close()
+            files.append(current.file)
+        await remove_files(files)
+        raise
+
+    await remove_files([file for file in files if file.error])
+    return files
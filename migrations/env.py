@@ -18,6 +18,7 @@ from app.database.mysql import Base
 from app.models.user import User, UserRole, UserPermission
 from app.models.document import Document, DocumentStatus
 from app.models.shared import SharedDocument, SharePermission
+from app.models.access import DocumentAccess
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,34 @@
+"""Composite index for keyset pagination of documents
+
+Revision ID: 7b1c4d9e2f60
+Revises: 3040290442ab
+Create Date: 2026-10-19 10:12:41.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1c4d9e2f60'
+down_revision: Union[str, None] = '3040290442ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Cubre el filtro por usuario y el orden (created_at, id) del listado
+    op.create_index(
+        'ix_documents_user_created_id',
+        'documents',
+        ['user_id', 'created_at', 'id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_documents_user_created_id', table_name='documents')
@@ -0,0 +1,81 @@
+"""Materialized document access levels and sharing indexes
+
+Revision ID: c4e8a1f37d25
+Revises: 7b1c4d9e2f60
+Create Date: 2026-10-19 11:03:17.540982
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f37d25'
+down_revision: Union[str, None] = '7b1c4d9e2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Mismo orden que PERMISSION_LEVELS / OWNER_LEVEL en app.models.shared
+LEVEL_SQL = (
+    "CASE s.permission_level "
+    "WHEN 'read' THEN 1 WHEN 'comment' THEN 2 WHEN 'write' THEN 3 WHEN 'share' THEN 4 "
+    "ELSE 0 END"
+)
+OWNER_LEVEL = 5
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('document_access',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('level', sa.Integer(), nullable=False),
+    sa.Column('can_download', sa.Boolean(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'document_id')
+    )
+    op.create_index('ix_document_access_document', 'document_access', ['document_id'], unique=False)
+    op.create_index(
+        'ix_shared_documents_shared_with_document',
+        'shared_documents',
+        ['shared_with_id', 'document_id'],
+        unique=False
+    )
+    op.create_index('ix_shared_documents_document', 'shared_documents', ['document_id'], unique=False)
+
+    # Backfill: propietarios primero, después los shares activos agregados por (usuario, documento)
+    op.execute(
+        "INSERT INTO document_access (user_id, document_id, level, can_download, expires_at) "
+        f"SELECT user_id, id, {OWNER_LEVEL}, 1, NULL FROM documents"
+    )
+
+    # Las columnas de revocación/caducidad pueden no existir en bases creadas solo con migraciones
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('shared_documents')}
+    conditions = ["d.user_id <> s.shared_with_id"]
+    if 'revoked_at' in columns:
+        conditions.append("s.revoked_at IS NULL")
+    expires = "NULL"
+    if 'expires_at' in columns:
+        conditions.append("(s.expires_at IS NULL OR s.expires_at > NOW())")
+        expires = "CASE WHEN SUM(s.expires_at IS NULL) > 0 THEN NULL ELSE MAX(s.expires_at) END"
+    can_download = "MAX(s.can_download)" if 'can_download' in columns else "1"
+
+    op.execute(
+        "INSERT INTO document_access (user_id, document_id, level, can_download, expires_at) "
+        f"SELECT s.shared_with_id, s.document_id, MAX({LEVEL_SQL}), {can_download}, {expires} "
+        "FROM shared_documents s JOIN documents d ON d.id = s.document_id "
+        f"WHERE {' AND '.join(conditions)} "
+        "GROUP BY s.shared_with_id, s.document_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_shared_documents_document', table_name='shared_documents')
+    op.drop_index('ix_shared_documents_shared_with_document', table_name='shared_documents')
+    op.drop_index('ix_document_access_document', table_name='document_access')
+    op.drop_table('document_access')
@@ -90,8 +90,11 @@ async def test_user(db):
 
 @pytest.fixture
 async def test_document(db, test_user):
+    from app.models.access import DocumentAccess
     from app.models.document import Document
-    
+    from app.models.shared import OWNER_LEVEL
+    from app.services.access import AccessService
+
     doc = Document(
         user_id=test_user.id,
         name="Test Document",
@@ -101,7 +104,16 @@ async def test_document(db, test_user):
         status="uploaded"
     )
     db.add(doc)
+    await db.flush()
+    # Fila de acceso del propietario, como en DocumentService.create_document
+    db.add(DocumentAccess(
+        user_id=test_user.id,
+        document_id=doc.id,
+        level=OWNER_LEVEL,
+        can_download=True
+    ))
     await db.commit()
+    AccessService.invalidate(test_user.id)
     return doc
 
 @pytest.fixture
@@ -42,4 +42,39 @@ async def test_get_current_user(client, auth_headers):
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
     assert data["email"] == "test@example.com"
-    assert "hashed_password" not in data
\ No newline at end of file
+    assert "hashed_password" not in data
+
+@pytest.mark.asyncio
+async def test_login_token_carries_identity_claims(db, test_user, mocker):
+    from fastapi.security import OAuth2PasswordRequestForm
+    from app.services.auth import AuthService
+
+    form = OAuth2PasswordRequestForm(username=test_user.email, password="testpass123", scope="me")
+    token = await AuthService.login(db, form)
+    payload = AuthService._decode_token(token.access_token)
+    assert payload["uid"] == test_user.id
+    assert payload["scopes"] == ["me"]
+
+    # Con AUTH_TRUST_TOKEN_CLAIMS la identidad sale del token, sin consultar la base de datos
+    mocker.patch("app.services.auth.settings.AUTH_TRUST_TOKEN_CLAIMS", True)
+    get_user = mocker.patch.object(AuthService, "get_user")
+    user = await AuthService.get_token_user(token.access_token, db)
+    assert user.id == test_user.id and user.role == test_user.role
+    assert not get_user.called
+
+@pytest.mark.asyncio
+async def test_saturated_hashing_pool_returns_429(client, mocker):
+    from app.exceptions import PasswordHashingBusyError
+
+    mocker.patch(
+        "app.utils.security.SecurityUtils.get_password_hash_async",
+        side_effect=PasswordHashingBusyError("Password hashing queue is full")
+    )
+    response = await client.post("/auth/register", json={
+        "email": "busy@example.com",
+        "password": "StrongPass123!",
+        "password_confirm": "StrongPass123!",
+        "full_name": "Busy User"
+    })
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.headers["retry-after"] == "1"
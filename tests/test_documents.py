@@ -42,4 +42,221 @@ async def test_process_document(client, auth_headers, test_document, mocker):
     )
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
-    assert data["message"] == "Document processed successfully"
\ No newline at end of file
+    assert data["message"] == "Document processed successfully"
+
+@pytest.mark.asyncio
+async def test_search_across_visible_documents(client, auth_headers, test_document, mocker):
+    search = mocker.patch(
+        "app.services.vector_store.VectorStoreService.search_chunks",
+        return_value=[{
+            "document_id": str(test_document.id),
+            "metadata": {"document_name": "Test Document"},
+            "chunk_index": 0,
+            "chunk_text": "Test content",
+            "similarity_score": 0.9,
+            "rrf_score": 0.03
+        }]
+    )
+
+    response = await client.get("/search", params={"q": "content"}, headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data[0]["document_id"] == test_document.id
+    assert search.call_args.args[1] == frozenset({test_document.id})
+
+@pytest.mark.asyncio
+async def test_user_documents_keyset_pagination(db, test_user):
+    from datetime import datetime
+    from app.models.document import Document
+    from app.services.document import DocumentService
+
+    created_at = datetime(2025, 1, 1)
+    for i in range(5):
+        db.add(Document(
+            user_id=test_user.id,
+            name=f"Document {i}",
+            file_path=f"/test/{i}.pdf",
+            file_type="application/pdf",
+            file_size=1024,
+            status="uploaded",
+            created_at=created_at
+        ))
+    await db.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = await DocumentService.get_user_documents(db, test_user.id, cursor=cursor, limit=2)
+        seen.extend(doc.id for doc in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    # Mismo created_at: el id desempata sin saltar ni repetir filas
+    assert seen == sorted(seen, reverse=True)
+    assert len(set(seen)) == 5
+
+@pytest.mark.asyncio
+async def test_share_and_revoke_update_access_index(db, test_user, test_document):
+    from app.models.user import User
+    from app.models.shared import SharePermission
+    from app.schemas.document import DocumentShare
+    from app.services.access import AccessService
+    from app.services.document import DocumentService
+
+    reader = User(email="reader@example.com", hashed_password="x", full_name="Reader")
+    db.add(reader)
+    await db.commit()
+
+    share = await DocumentService.share_document(
+        db, test_document.id, test_user.id,
+        DocumentShare(email=reader.email, permission_level="write")
+    )
+    assert await AccessService.has_permission(db, reader.id, test_document.id, SharePermission.WRITE)
+    assert test_document.id in await AccessService.get_accessible_document_ids(db, reader.id)
+
+    await DocumentService.revoke_share(db, share.id, test_user.id)
+    assert not await AccessService.has_permission(db, reader.id, test_document.id)
+
+@pytest.mark.asyncio
+async def test_bulk_share_reports_per_recipient(client, auth_headers, db, test_document):
+    from app.models.user import User
+
+    db.add_all([
+        User(email=f"reader{i}@example.com", hashed_password="x", full_name=f"Reader {i}")
+        for i in range(3)
+    ])
+    await db.commit()
+
+    response = await client.post(
+        f"/documents/bulk/{test_document.id}/share",
+        json={
+            "emails": [f"reader{i}@example.com" for i in range(3)]
+            + ["missing@example.com", "test@example.com"],
+            "permission_level": "read"
+        },
+        headers=auth_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["succeeded"] == 3
+    assert [r["status"] for r in data["results"]] == ["ok", "ok", "ok", "not_found", "skipped"]
+
+@pytest.mark.asyncio
+async def test_bulk_share_reshares_after_expiry(db, test_user, test_document):
+    from datetime import datetime, timedelta
+    from app.models.shared import SharedDocument, SharePermission
+    from app.models.user import User
+    from app.schemas.document import BulkShare
+    from app.services.access import AccessService
+    from app.services.document import DocumentService
+
+    reader = User(email="reader@example.com", hashed_password="x", full_name="Reader")
+    db.add(reader)
+    await db.flush()
+    db.add(SharedDocument(
+        document_id=test_document.id,
+        owner_id=test_user.id,
+        shared_with_id=reader.id,
+        permission_level=SharePermission.READ,
+        expires_at=datetime.utcnow() - timedelta(days=1)
+    ))
+    await db.commit()
+
+    result = await DocumentService.bulk_share(
+        db, test_document.id, test_user.id, BulkShare(emails=[reader.email])
+    )
+    assert [r.status for r in result.results] == ["ok"]
+    assert await AccessService.has_permission(db, reader.id, test_document.id)
+
+@pytest.mark.asyncio
+async def test_bulk_delete_removes_shared_documents(client, auth_headers, db, test_user, test_document, mocker):
+    from sqlalchemy import select
+    from app.models.document import Document
+    from app.models.shared import SharedDocument
+    from app.models.user import User
+    from app.schemas.document import DocumentShare
+    from app.services.access import AccessService
+    from app.services.document import DocumentService
+
+    mocker.patch("app.services.vector_store.VectorStoreService.delete_document_embeddings")
+    reader = User(email="reader@example.com", hashed_password="x", full_name="Reader")
+    db.add(reader)
+    await db.commit()
+    await DocumentService.share_document(
+        db, test_document.id, test_user.id,
+        DocumentShare(email=reader.email, permission_level="read")
+    )
+
+    response = await client.post(
+        "/documents/bulk/delete",
+        json={"document_ids": [test_document.id]},
+        headers=auth_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["succeeded"] == 1
+    assert (await db.execute(select(Document).where(Document.id == test_document.id))).first() is None
+    assert (await db.execute(select(SharedDocument))).first() is None
+    assert not await AccessService.has_permission(db, reader.id, test_document.id)
+
+@pytest.mark.asyncio
+async def test_bulk_upload_reports_per_file_status(client, auth_headers, tmp_path, mocker):
+    import hashlib
+    from app.config import settings
+
+    mocker.patch.object(settings, "UPLOAD_FOLDER", str(tmp_path))
+    mocker.patch(
+        "app.utils.file_processing.magic.from_buffer",
+        side_effect=lambda head, mime: "text/plain" if head.startswith(b"plain") else "application/x-dosexec"
+    )
+    queued = mocker.patch("app.services.processing_queue.ProcessingQueue.enqueue", return_value=True)
+
+    response = await client.post(
+        "/documents/bulk/upload",
+        files=[
+            ("files", ("a.txt", b"plain text a", "text/plain")),
+            ("files", ("b.txt", b"plain text b", "text/plain")),
+            ("files", ("c.txt", b"MZ binary", "text/plain")),
+        ],
+        headers=auth_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["queued", "queued", "rejected"]
+    assert results[0]["checksum"] == hashlib.sha256(b"plain text a").hexdigest()
+    assert queued.call_count == 2
+    # Solo quedan en disco los archivos aceptados
+    assert len(list(tmp_path.iterdir())) == 2
+
+@pytest.mark.asyncio
+async def test_download_supports_range_and_etag(client, auth_headers, db, test_user, tmp_path):
+    import hashlib
+    from app.models.access import DocumentAccess
+    from app.models.document import Document
+    from app.models.shared import OWNER_LEVEL
+
+    content = b"0123456789" * 100
+    path = tmp_path / "report.txt"
+    path.write_bytes(content)
+    checksum = hashlib.sha256(content).hexdigest()
+    doc = Document(
+        user_id=test_user.id,
+        name="report.txt",
+        file_path=str(path),
+        file_type="txt",
+        file_size=len(content),
+        checksum=checksum
+    )
+    db.add(doc)
+    await db.flush()
+    db.add(DocumentAccess(user_id=test_user.id, document_id=doc.id, level=OWNER_LEVEL, can_download=True))
+    await db.commit()
+
+    url = f"/documents/{doc.id}/download"
+    response = await client.get(url, headers={**auth_headers, "Range": "bytes=10-19"})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == content[10:20]
+    assert response.headers["etag"] == f'"{checksum}"'
+
+    response = await client.get(url, headers={**auth_headers, "If-None-Match": f'W/"{checksum}"'})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
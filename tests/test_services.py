@@ -42,4 +42,386 @@ async def test_vector_store_service(mocker):
     chunks = await service.create_and_store_embeddings(
         "doc1", "test text", {"meta": "data"}
     )
-    assert chunks == 3
\ No newline at end of file
+    assert chunks == 3
+
+@pytest.mark.asyncio
+async def test_ollama_coalesces_identical_generations(mocker):
+    import asyncio
+    import json
+    from app.services.ollama import OllamaService
+
+    calls = []
+    release = asyncio.Event()
+
+    async def fake_stream(model, full_prompt, context):
+        calls.append((model, full_prompt))
+        await release.wait()
+        for token in ["Hola", " mundo"]:
+            yield json.dumps({"response": token})
+
+    service = OllamaService()
+    mocker.patch.object(service, "_stream_generate", side_effect=fake_stream)
+
+    async def collect(stream):
+        return [c async for c in service.generate_response("q", context=["ctx"], stream=stream)]
+
+    streaming = asyncio.create_task(collect(True))
+    blocking = asyncio.create_task(collect(False))
+    await asyncio.sleep(0)
+    release.set()
+
+    streamed, answer = await asyncio.gather(streaming, blocking)
+    assert len(calls) == 1
+    assert [json.loads(c)["response"] for c in streamed] == ["Hola", " mundo"]
+    assert answer == ["Hola mundo"]
+    await service.close()
+
+@pytest.mark.asyncio
+async def test_ollama_fails_over_to_healthy_backend():
+    import httpx
+    from app.services.ollama import OllamaService
+
+    hits = []
+
+    def stub(request: httpx.Request) -> httpx.Response:
+        hits.append(request.url.host)
+        if request.url.host == "down":
+            return httpx.Response(503)
+        return httpx.Response(200, text='{"response": "ok", "done": true}\n')
+
+    service = OllamaService(backends=["http://down:11434", "http://up:11434"])
+    service.pool.backends[1].outstanding = 1  # El host caído parece el menos cargado
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(stub))
+
+    answer = [c async for c in service.generate_response("q")]
+
+    assert answer == ["ok"]
+    assert hits == ["down", "up"]
+    assert service.pool.backends[0].failures == 1
+    assert "llama3:latest" in service.pool.backends[1].loaded_models
+    await service.close()
+
+def test_lexical_index_matches_exact_codes():
+    from app.services.lexical_index import LexicalIndex
+
+    index = LexicalIndex()
+    index.add(1, "Replacement seal for pump AB-1234")
+    index.add(2, "General maintenance of pumps and valves")
+    index.add(3, "Seal kit for AB-9999")
+
+    assert [doc_id for doc_id, _ in index.search("AB-1234", 5)][0] == 1
+
+    index.remove([1])
+    assert [doc_id for doc_id, _ in index.search("AB-1234", 5)] == [3]
+    assert index.search("seal", 5, id_filter=lambda ids: ids != 3) == []
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    from app.services.lexical_index import reciprocal_rank_fusion
+
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [doc_id for doc_id, _ in fused] == [1, 3, 2]
+
+@pytest.mark.asyncio
+async def test_reranker_reorders_within_budget(mocker):
+    import numpy as np
+    from app.services.reranker import RerankerService
+
+    reranker = RerankerService()
+    mocker.patch.object(reranker, "_score", return_value=np.array([0.1, 0.9, 0.5]))
+    chunks = [{"chunk_text": t} for t in ["a", "b", "c"]]
+
+    best = await reranker.rerank("q", chunks, k=2, budget_ms=1000)
+    assert [c["chunk_text"] for c in best] == ["b", "c"]
+
+@pytest.mark.asyncio
+async def test_reranker_falls_back_when_over_budget(mocker):
+    import time
+    import numpy as np
+    from app.services.reranker import RerankerService
+
+    def slow_score(query, texts):
+        time.sleep(0.2)
+        return np.array([0.1, 0.9, 0.5])
+
+    reranker = RerankerService()
+    mocker.patch.object(reranker, "_score", side_effect=slow_score)
+    chunks = [{"chunk_text": t} for t in ["a", "b", "c"]]
+
+    best = await reranker.rerank("q", chunks, k=2, budget_ms=10)
+    assert [c["chunk_text"] for c in best] == ["a", "b"]
+
+@pytest.mark.parametrize("quantization", ["none", "fp16", "int8"])
+def test_vector_index_scores_are_cosine(mocker, quantization):
+    import numpy as np
+    from app.services.vector_store import VectorStoreService, settings
+
+    mocker.patch.object(settings, "VECTOR_QUANTIZATION", quantization)
+    index = VectorStoreService._build_index(64)
+
+    vectors = np.random.default_rng(0).normal(size=(20, 64)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index.add(vectors)
+
+    scores, ids = index.search(vectors[:5], 1)
+    assert list(ids[:, 0]) == [0, 1, 2, 3, 4]
+    assert np.allclose(scores[:, 0], 1.0, atol=0.02)
+
+def test_onnx_embedder_matches_pytorch(tmp_path, mocker):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("optimum.onnxruntime")
+    import numpy as np
+    from app.services import embeddings
+
+    mocker.patch.object(embeddings.settings, "EMBEDDING_ONNX_DIR", str(tmp_path))
+    sentences = [
+        "Replacement seal for pump AB-1234",
+        "Quarterly maintenance report for the Madrid plant",
+        "El contrato se renueva automáticamente cada año",
+    ]
+
+    reference = embeddings.create_embedder(backend="sentence-transformers").encode(sentences)
+    quantized = embeddings.create_embedder(backend="onnx").encode(sentences)
+
+    cosine = (reference * quantized).sum(axis=1)
+    assert quantized.shape == reference.shape
+    assert np.all(cosine > 0.98)
+
+def test_access_merge_falls_back_to_lower_share_after_expiry():
+    from datetime import datetime
+    from types import SimpleNamespace
+    from app.models.shared import PERMISSION_LEVELS, SharePermission
+    from app.services.access import _merge_shares
+
+    shares = [
+        SimpleNamespace(permission_level=SharePermission.READ, can_download=False, expires_at=None),
+        SimpleNamespace(permission_level=SharePermission.WRITE, can_download=True, expires_at=datetime(2030, 1, 1)),
+        SimpleNamespace(permission_level=SharePermission.WRITE, can_download=True, expires_at=datetime(2031, 1, 1)),
+    ]
+    entry = _merge_shares(shares, datetime(2026, 1, 1))
+
+    assert entry.level == PERMISSION_LEVELS[SharePermission.WRITE]
+    assert entry.expires_at == datetime(2031, 1, 1)
+    assert entry.can_download
+    assert not entry.active(datetime(2032, 1, 1))
+
+    # Caducado el WRITE, queda el READ sin caducidad
+    fallback = _merge_shares(shares, datetime(2032, 1, 1))
+    assert fallback.level == PERMISSION_LEVELS[SharePermission.READ]
+    assert fallback.expires_at is None
+    assert not fallback.can_download
+    assert _merge_shares(shares[1:], datetime(2032, 1, 1)) is None
+
+@pytest.mark.asyncio
+async def test_processing_queue_rejects_when_full():
+    from app.services.processing_queue import ProcessingQueue
+
+    queue = ProcessingQueue(workers=1, maxsize=2)
+    assert queue.enqueue(1, 10)
+    assert queue.enqueue(2, 10)
+    assert not queue.enqueue(3, 10)
+    assert queue.queue.qsize() == 2
+
+@pytest.mark.asyncio
+async def test_storage_archives_text_to_s3_compressed(tmp_path, mocker):
+    import httpx
+    from app.services.storage import S3Storage, StorageService
+
+    mocker.patch("app.services.storage.settings.STORAGE_COMPRESS_EXTENSIONS", {"txt"})
+    objects = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["authorization"].startswith("AWS4-HMAC-SHA256 Credential=key/")
+        if request.method == "PUT":
+            objects[request.url.path] = request.read()
+            return httpx.Response(200)
+        if request.method == "GET":
+            return httpx.Response(200, content=objects[request.url.path])
+        objects.pop(request.url.path)
+        return httpx.Response(204)
+
+    cold = S3Storage("http://minio:9000", "docs", "key", "secret", transport=httpx.MockTransport(handler))
+    storage = StorageService(cold=cold)
+    original = tmp_path / "report.txt"
+    content = b"quarterly maintenance report\n" * 2000
+    original.write_bytes(content)
+
+    location = await storage.archive(str(original))
+
+    assert location == "s3://docs/report.txt.zst"
+    # El original se borra al confirmar la nueva ubicación, no en archive()
+    assert original.exists()
+    assert objects["/docs/report.txt.zst"][:4] == b"\x28\xb5\x2f\xfd"  # magic de zstd
+    assert len(objects["/docs/report.txt.zst"]) < len(content)
+    assert b"".join([chunk async for chunk in storage.iter_content(location)]) == content
+    async with storage.local_path(location) as path:
+        assert path.endswith(".txt")
+        assert open(path, "rb").read() == content
+
+    await storage.delete(location)
+    assert not objects
+
+@pytest.mark.asyncio
+async def test_text_artifact_skips_extraction_unless_forced(tmp_path, mocker):
+    from app.services.text_artifacts import TextArtifactService
+    from app.utils.file_processing import ExtractedText
+
+    mocker.patch("app.services.text_artifacts.settings.ARTIFACT_FOLDER", str(tmp_path))
+    extract = mocker.patch(
+        "app.services.text_artifacts.FileProcessor.extract_document",
+        return_value=ExtractedText.from_pages(["page one\n", "page two\n"])
+    )
+
+    first = await TextArtifactService.get_text("/uploads/a.pdf", "abc123")
+    cached = await TextArtifactService.get_text("/uploads/copy-of-a.pdf", "abc123")
+    assert extract.call_count == 1
+    assert cached.text == first.text
+    assert cached.page_offsets == [0, 9]
+
+    await TextArtifactService.get_text("/uploads/a.pdf", "abc123", force=True)
+    assert extract.call_count == 2
+
+    await TextArtifactService.delete(["abc123"])
+    assert not list(tmp_path.iterdir())
+
+@pytest.mark.asyncio
+async def test_text_artifact_streams_row_groups(tmp_path, mocker):
+    from app.services.text_artifacts import StoredText, TextArtifactService
+    from app.utils.file_processing import SEGMENT_BREAK
+
+    mocker.patch("app.services.text_artifacts.settings.ARTIFACT_FOLDER", str(tmp_path / "artifacts"))
+    mocker.patch("app.services.text_artifacts.settings.CHUNK_SIZE", 60)
+    extract = mocker.patch("app.services.text_artifacts.FileProcessor.extract_document")
+    path = tmp_path / "parts.csv"
+    path.write_text("code;name\n" + "".join(f"AB-{i};Seal kit {i}\n" for i in range(6)))
+
+    stored = await TextArtifactService.get_text(str(path), "csv123")
+    # Los grupos de filas van del extractor al artefacto sin pasar por un texto completo
+    assert isinstance(stored, StoredText)
+    assert not extract.called
+    segments = list(stored.segments())
+    assert len(segments) == 3
+    assert all(segment.startswith("code | name\n") and segment.endswith(SEGMENT_BREAK) for segment in segments)
+    assert (await TextArtifactService.load("csv123")).text == "".join(segments)
+
+@pytest.mark.asyncio
+async def test_reembedding_resumes_after_checkpoint(mocker):
+    import numpy as np
+    from app.services.reembedding import ReembeddingJob
+    from app.services.vector_store import IndexGeneration
+
+    mocker.patch("app.services.reembedding.settings.REEMBED_CPU_BUDGET", 1.0)
+    chunks = [{"_id": i, "vector_id": 100 + i, "chunk_text": f"chunk {i}"} for i in range(5)]
+
+    def fetch(query, projection, after):
+        start = 0 if after is None else after + 1
+        return chunks[start:start + 2]
+
+    job = ReembeddingJob()
+    mocker.patch.object(job, "_fetch", side_effect=fetch)
+    store = mocker.patch.object(job, "_store_batch")
+    mocker.patch.object(job, "_save_checkpoint")
+
+    embedder = mocker.MagicMock()
+    embedder.encode.side_effect = lambda texts: np.ones((len(texts), 4), dtype="float32")
+    generation = IndexGeneration(1, "new-model", "embedding_g1", embedder, mocker.MagicMock())
+    # Checkpoint de una ejecución anterior: los chunks 0 y 1 ya tienen vector nuevo
+    building = {"checkpoint": 1, "processed": 2}
+
+    await job._embed_remaining(generation, building)
+
+    encoded = [text for call in embedder.encode.call_args_list for text in call.args[0]]
+    assert encoded == ["chunk 2", "chunk 3", "chunk 4"]
+    assert building == {"checkpoint": 4, "processed": 5}
+    assert store.call_count == 2
+    added = [id_ for call in generation.index_id_map.add_with_ids.call_args_list for id_ in call.args[1]]
+    assert added == [102, 103, 104]
+
+@pytest.mark.asyncio
+async def test_index_watcher_follows_cutover_and_retires_after_all_replicas(mocker):
+    from datetime import datetime
+    from app.services import reembedding
+    from app.services.reembedding import IndexStateWatcher, ReembeddingJob
+    from app.services.vector_store import IndexGeneration, VectorStoreService
+
+    old = IndexGeneration(0, "old-model", "embedding", mocker.MagicMock(), mocker.MagicMock())
+    new = IndexGeneration(1, "new-model", "embedding_g1", mocker.MagicMock(), mocker.MagicMock())
+    # Réplica que no corre el job: sigue en la generación anterior
+    service = object.__new__(VectorStoreService)
+    service.active, service.building, service.document_chunks = old, None, {7: 2}
+    mocker.patch.object(VectorStoreService, "_instance", service)
+
+    state = {
+        "active": {"generation": 1, "model": "new-model", "field": "embedding_g1"},
+        "retired": {"generation": 0, "field": "embedding"},
+        "replicas": {"other-pod": {"active": 0, "building": None, "seen_at": datetime.utcnow()}},
+    }
+    mocker.patch.object(reembedding, "load_index_state", return_value=state)
+    job = ReembeddingJob()
+    load = mocker.patch.object(job, "_load_existing")
+    drop = mocker.patch.object(job, "_drop_field")
+    mocker.patch.object(job, "_state_collection")
+    watcher = IndexStateWatcher(job)
+    mocker.patch.object(watcher, "_new_generation", return_value=new)
+
+    await watcher.sync_once()
+    assert service.active is new and service.building is None
+    load.assert_awaited_once_with(new, ["7"])
+    # other-pod todavía busca con los vectores anteriores
+    assert not drop.called
+
+    state["replicas"]["other-pod"]["active"] = 1
+    await watcher.sync_once()
+    drop.assert_called_once_with("embedding")
+
+@pytest.mark.asyncio
+async def test_storage_tiering_keeps_rows_consistent_when_a_put_fails(engine, db, test_user, tmp_path, mocker):
+    from datetime import datetime, timedelta
+    import httpx
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from app.models.document import Document
+    from app.services.storage import S3Storage, StorageService, StorageTiering
+
+    mocker.patch("app.services.storage.settings.STORAGE_COMPRESS_EXTENSIONS", {"txt"})
+    objects, puts = {}, []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "PUT":
+            puts.append(request.url.path)
+            if len(puts) == 2:
+                return httpx.Response(503)
+            objects[request.url.path] = request.read()
+            return httpx.Response(200)
+        objects.pop(request.url.path, None)
+        return httpx.Response(204)
+
+    old = datetime.utcnow() - timedelta(days=365)
+    documents = []
+    for name in ("a.txt", "b.txt"):
+        path = tmp_path / name
+        path.write_text(f"contents of {name}\n" * 100)
+        documents.append(Document(
+            user_id=test_user.id, name=name, file_path=str(path), file_type="txt",
+            file_size=path.stat().st_size, status="uploaded", created_at=old
+        ))
+    db.add_all(documents)
+    await db.commit()
+
+    cold = S3Storage("http://minio:9000", "docs", "key", "secret", transport=httpx.MockTransport(handler))
+    tiering = StorageTiering(
+        StorageService(cold=cold),
+        session_factory=sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    )
+    moved = await tiering.run_once()
+
+    first, second = documents
+    await db.refresh(first)
+    await db.refresh(second)
+    assert moved == 1
+    assert first.file_path == "s3://docs/a.txt.zst"
+    assert "/docs/a.txt.zst" in objects
+    assert not (tmp_path / "a.txt").exists()
+    # El PUT fallido no mueve el documento ni borra su original
+    assert second.file_path == str(tmp_path / "b.txt")
+    assert (tmp_path / "b.txt").exists()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.txt"]
@@ -22,4 +22,297 @@ async def test_file_processing(tmp_path):
     
     assert saved_path == str(tmp_path / "test.txt")
     content = await processor.extract_text(saved_path)
-    assert content == "Test content"
\ No newline at end of file
+    assert content == "Test content"
+
+def test_available_cpus_honours_cgroup_quota(tmp_path, mocker):
+    from app.utils import resources
+
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("150000 100000\n")
+    mocker.patch.object(resources, "CGROUP_V2_CPU_MAX", cpu_max)
+    mocker.patch.object(resources.os, "sched_getaffinity", return_value=set(range(8)))
+
+    assert resources.cpu_quota() == 1.5
+    assert resources.available_cpus() == 2
+
+    cpu_max.write_text("max 100000\n")
+    assert resources.available_cpus() == 8
+
+def test_heavy_dependencies_are_not_imported_at_startup():
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, app.services.document, app.utils.file_processing\n"
+        "heavy = {'faiss', 'torch', 'sentence_transformers', 'pandas', 'pytesseract', 'pptx'}\n"
+        "print(sorted(heavy & set(sys.modules)))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_readiness_waits_for_warm_up(mocker):
+    import asyncio
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.routers import readiness
+    from app.utils import startup
+
+    warm = asyncio.Event()
+    mocker.patch.object(startup, "_warm", warm)
+    mocker.patch.object(readiness.settings, "WARM_UP_ON_STARTUP", True)
+    app = FastAPI()
+    app.include_router(readiness.router)
+    client = TestClient(app)
+
+    assert client.get("/ready").status_code == 503
+    warm.set()
+    assert client.get("/ready").status_code == 200
+
+def test_prometheus_middleware_labels_route_template():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from prometheus_client import REGISTRY
+    from app.utils.metrics import PrometheusMiddleware
+
+    app = FastAPI()
+    app.add_middleware(PrometheusMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) or 0
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+
+    assert REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) == before + 2
+
+def test_json_formatter_uses_header_allowlist_and_request_id():
+    import logging
+    import orjson
+    from starlette.requests import Request
+    from app.utils.logger import JSONFormatter, request_id_var, RequestIdFilter
+
+    request = Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/search",
+        "query_string": b"",
+        "headers": [(b"user-agent", b"pytest"), (b"authorization", b"Bearer secret")],
+        "client": ("127.0.0.1", 5000),
+        "server": ("test", 80),
+        "scheme": "http",
+    })
+    record = logging.LogRecord("api", logging.INFO, __file__, 1, "hello %s", ("world",), None)
+    record.request = request
+    record.status_code = 200
+
+    token = request_id_var.set("req-1")
+    RequestIdFilter().filter(record)
+    request_id_var.reset(token)
+
+    data = orjson.loads(JSONFormatter().format(record))
+    assert data["message"] == "hello world"
+    assert data["request_id"] == "req-1"
+    assert data["status_code"] == 200
+    assert data["request"]["headers"] == {"user-agent": "pytest"}
+
+def test_sampling_filter_keeps_whole_requests_and_all_warnings():
+    import logging
+    from app.utils.logger import SamplingFilter
+
+    sampler = SamplingFilter(0.0, ["api"])
+
+    info = logging.LogRecord("api", logging.INFO, __file__, 1, "x", None, None)
+    info.request_id = "req-1"
+    warning = logging.LogRecord("api", logging.WARNING, __file__, 1, "x", None, None)
+    other = logging.LogRecord("app.services", logging.INFO, __file__, 1, "x", None, None)
+
+    assert not sampler.filter(info)
+    assert sampler.filter(warning)
+    assert sampler.filter(other)
+
+def test_stack_sampler_covers_worker_threads():
+    import threading
+    import time
+    from app.utils.profiling import StackSampler
+
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker, name="extract-pool")
+    worker.start()
+    sampler = StackSampler(0.001)
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    collapsed = sampler.collapsed()
+    assert any(
+        line.startswith("thread:extract-pool;") and "busy_worker" in line
+        for line in collapsed.splitlines()
+    )
+    profile = sampler.speedscope()
+    names = {p["name"] for p in profile["profiles"]}
+    assert "thread:extract-pool" in names
+    assert all(len(p["samples"]) == len(p["weights"]) for p in profile["profiles"])
+
+def test_profiler_samples_only_matching_requests():
+    from app.utils.profiling import Profiler
+
+    profiler = Profiler()
+    session = profiler.arm("/search", 2, 0.01)
+
+    assert profiler.request_started("/documents") is None
+    first = profiler.request_started("/search")
+    assert not session.sampler.paused
+    profiler.request_finished(first)
+    assert session.sampler.paused and profiler.active is session
+
+    profiler.request_finished(profiler.request_started("/search?q=x"))
+    assert session.done.is_set()
+    assert profiler.active is None
+    assert profiler.get(session.id) is session
+
+@pytest.mark.asyncio
+async def test_loop_monitor_reports_blocking_call(mocker):
+    import asyncio
+    import time
+    from app.utils import loop_monitor
+    from app.utils.loop_monitor import LoopLagMonitor
+
+    warning = mocker.patch.object(loop_monitor.logger, "warning")
+    monitor = LoopLagMonitor(0.01, 0.05)
+    monitor.start()
+    await asyncio.sleep(0.03)
+
+    def blocking_handler():
+        time.sleep(0.3)
+
+    blocking_handler()
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+
+    assert warning.call_count == 1
+    extra = warning.call_args.kwargs["extra"]
+    assert extra["blocked_ms"] >= 50
+    assert extra["stack"][-1].startswith("blocking_handler")
+
+@pytest.mark.asyncio
+async def test_password_hashing_sheds_load_past_queue_limit(mocker):
+    import asyncio
+    import threading
+    from app.exceptions import PasswordHashingBusyError
+
+    mocker.patch.object(security.settings, "PASSWORD_HASH_QUEUE_LIMIT", 2)
+    release = threading.Event()
+    mocker.patch.object(
+        security.SecurityUtils, "get_password_hash",
+        side_effect=lambda password: release.wait(5) and f"hash:{password}"
+    )
+
+    first = asyncio.create_task(security.SecurityUtils.get_password_hash_async("a"))
+    second = asyncio.create_task(security.SecurityUtils.get_password_hash_async("b"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(PasswordHashingBusyError):
+        await security.SecurityUtils.get_password_hash_async("c")
+
+    release.set()
+    assert await asyncio.gather(first, second) == ["hash:a", "hash:b"]
+
+def test_ttl_cache_expires_evicts_and_invalidates(mocker):
+    from types import SimpleNamespace
+    from app.utils import cache
+    from app.utils.cache import TTLCache
+
+    now = [1000.0]
+    mocker.patch.object(cache.time, "monotonic", side_effect=lambda: now[0])
+    users = TTLCache("test", maxsize=2, ttl=60)
+
+    users.set(("a@x.com", 1), SimpleNamespace(id=1))
+    users.set(("a@x.com", 2), SimpleNamespace(id=1))
+    assert users.get(("a@x.com", 1)).id == 1
+
+    users.set(("b@x.com", 1), SimpleNamespace(id=2))
+    assert users.get(("a@x.com", 2)) is None  # least recently used
+    assert len(users) == 2
+
+    now[0] += 61
+    assert users.get(("b@x.com", 1)) is None
+
+    users.set(("b@x.com", 1), SimpleNamespace(id=2))
+    assert users.invalidate(lambda key, user: user.id == 2) == 1
+    assert users.get(("b@x.com", 1)) is None
+
+def test_upload_ranges_merge_out_of_order_parts():
+    from app.utils.uploads import merge_ranges, missing_ranges, parse_content_range
+
+    assert parse_content_range("bytes 0-99/1000") == (0, 100, 1000)
+    with pytest.raises(ValueError):
+        parse_content_range("bytes 900-1000/1000")
+
+    ranges = [(500, 1000), (0, 100), (100, 200), (150, 300)]
+    merged = merge_ranges(ranges)
+    assert merged == [(0, 300), (500, 1000)]
+    assert missing_ranges(merged, 1000) == [(300, 500)]
+    assert missing_ranges(merge_ranges(ranges + [(300, 500)]), 1000) == []
+
+@pytest.mark.asyncio
+async def test_csv_extraction_chunks_follow_row_groups(tmp_path, mocker):
+    from app.services.vector_store import VectorStoreService
+
+    mocker.patch.object(file_processing.settings, "CHUNK_SIZE", 60)
+    path = tmp_path / "parts.csv"
+    path.write_text("code;name\n" + "".join(f"AB-{i};Seal kit {i}\n" for i in range(6)))
+
+    text = await file_processing.FileProcessor.extract_text(str(path))
+    chunks = VectorStoreService._chunk_text(None, text)
+
+    assert len(chunks) == 3
+    assert all(chunk.startswith("code | name\n") for chunk in chunks)
+    assert chunks[0] == "code | name\nAB-0 | Seal kit 0\nAB-1 | Seal kit 1"
+    rows = [line for chunk in chunks for line in chunk.split("\n")[1:]]
+    assert rows == [f"AB-{i} | Seal kit {i}" for i in range(6)]
+
+@pytest.mark.asyncio
+async def test_structured_extraction_yields_path_annotated_records(tmp_path):
+    import json
+
+    xml_path = tmp_path / "catalog.xml"
+    xml_path.write_text(
+        '<catalog xmlns="urn:parts"><part id="AB-1"><name>Seal  kit</name></part>'
+        '<part id="AB-2"><name>Valve</name></part></catalog>'
+    )
+    mixed_path = tmp_path / "manual.xml"
+    mixed_path.write_text(
+        "<manual><p>Replace the <b>seal kit</b> every 500 hours"
+        " and check the <i>valve</i> monthly.</p></manual>"
+    )
+    json_path = tmp_path / "orders.json"
+    json_path.write_text(json.dumps({"orders": [{"sku": "AB-1", "qty": 2, "urgent": True}], "count": 1}))
+
+    xml_text = await file_processing.FileProcessor.extract_text(str(xml_path))
+    mixed_text = await file_processing.FileProcessor.extract_text(str(mixed_path))
+    json_text = await file_processing.FileProcessor.extract_text(str(json_path))
+
+    assert xml_text.split("\n") == [
+        "catalog/part@id: AB-1", "catalog/part/name: Seal kit",
+        "catalog/part@id: AB-2", "catalog/part/name: Valve" + file_processing.SEGMENT_BREAK,
+    ]
+    # El texto mixto conserva el orden del documento
+    assert mixed_text.rstrip(file_processing.SEGMENT_BREAK).split("\n") == [
+        "manual/p: Replace the", "manual/p/b: seal kit", "manual/p: every 500 hours and check the",
+        "manual/p/i: valve", "manual/p: monthly.",
+    ]
+    assert json_text.rstrip(file_processing.SEGMENT_BREAK).split("\n") == [
+        "orders[].sku: AB-1", "orders[].qty: 2", "orders[].urgent: true", "count: 1",
+    ]